@@ -0,0 +1,197 @@
+"""Benchmark de analytics: buckets pré-agregados x agregação sobre access_logs
+
+Uso:
+    python benchmarks/seed.py /tmp/bench.db --keys 100000 --logs 1000000
+    python benchmarks/bench_analytics.py /tmp/bench.db --repeat 5
+
+Numa cópia do banco: reconstrói os buckets (analytics.rebuild), compara as consultas de
+services/analytics.py com o GROUP BY equivalente nos logs brutos (tempo e erro dos distintos
+estimados pelos sketches) e mede o custo extra da gravação de logs com os buckets ligados.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import environment, make_app, write_results
+from sqlalchemy import case, desc, func
+from src.models.key import db, AccessLog
+from src.services.analytics import analytics, floor_time
+from src.services.log_writer import log_writer
+
+
+def raw_hourly(since, until):
+    """Logins por hora a partir dos logs brutos"""
+    bucket = func.strftime('%Y-%m-%d %H:00:00', AccessLog.login_at)
+    rows = db.session.execute(db.select(
+        bucket,
+        func.sum(case((AccessLog.success.is_(True), 1), else_=0)),
+        func.sum(case((AccessLog.success.is_(False), 1), else_=0)),
+        func.count(func.distinct(AccessLog.hwid)),
+        func.count(func.distinct(AccessLog.ip_address))
+    ).where(AccessLog.login_at >= since, AccessLog.login_at < until).group_by(bucket)).all()
+    totals = db.session.execute(db.select(
+        func.count(func.distinct(AccessLog.hwid)), func.count(func.distinct(AccessLog.ip_address))
+    ).where(AccessLog.login_at >= since, AccessLog.login_at < until)).one()
+    return rows, {'distinct_hwids': totals[0], 'distinct_ips': totals[1]}
+
+
+def raw_top_keys(since, until, limit, by='hwids'):
+    """Keys com mais HWIDs distintos (ou logins) a partir dos logs brutos"""
+    value = func.count(func.distinct(AccessLog.hwid)) if by == 'hwids' else func.count()
+    return db.session.execute(
+        db.select(AccessLog.key_id, value)
+        .where(AccessLog.login_at >= since, AccessLog.login_at < until)
+        .group_by(AccessLog.key_id).order_by(desc(value), AccessLog.key_id).limit(limit)
+    ).all()
+
+
+def raw_key_daily(key_id, since, until):
+    bucket = func.strftime('%Y-%m-%d', AccessLog.login_at)
+    return db.session.execute(db.select(bucket, func.count(), func.count(func.distinct(AccessLog.hwid))).where(
+        AccessLog.key_id == key_id, AccessLog.login_at >= since, AccessLog.login_at < until
+    ).group_by(bucket)).all()
+
+
+def measure(function, repeat):
+    """Mediana, em ms, de repeat execuções"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def relative_error(estimate, exact):
+    return round(abs(estimate - exact) / exact * 100, 2) if exact else None
+
+
+def write_cost(logs, enabled, rng, key_ids):
+    """Segundos para gravar logs pela fila do writer, com ou sem os buckets"""
+    analytics.enabled = enabled
+    started = time.perf_counter()
+    for _ in range(logs):
+        log_writer.submit(
+            key_id=key_ids[rng.randrange(len(key_ids))],
+            hwid=f'BENCH-{rng.randrange(10 ** 6)}',
+            ip_address=f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}',
+            success=rng.random() > 0.1,
+            error_message=None
+        )
+    log_writer.flush(timeout=600)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db', help='Banco criado por benchmarks/seed.py (não é alterado)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=20, help='Tamanho do ranking de keys')
+    parser.add_argument('--write-logs', type=int, default=20000, help='Logs gravados na medição da escrita')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Também grava o JSON neste arquivo')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench-analytics-')
+    try:
+        db_path = os.path.join(tmp, 'bench.db')
+        shutil.copyfile(args.db, db_path)
+        app = make_app(db_path)
+
+        with app.app_context():
+            started = time.perf_counter()
+            rebuilt = analytics.rebuild()
+            rebuild_seconds = time.perf_counter() - started
+
+            until = datetime.utcnow()
+            # Início alinhado aos buckets para que as contagens sejam comparáveis
+            week = floor_time(until - timedelta(days=7), 'hour')
+            month = floor_time(until - timedelta(days=30), 'day')
+            busiest = raw_top_keys(month, until, 1)
+            key_id = busiest[0][0] if busiest else None
+
+            queries = []
+
+            rows, exact = raw_hourly(week, until)
+            result = analytics.series('hour', week, until)
+            queries.append({
+                'query': 'logins_per_hour_week',
+                'raw_ms': measure(lambda: raw_hourly(week, until), args.repeat),
+                'buckets_ms': measure(lambda: analytics.series('hour', week, until), args.repeat),
+                'counts_match': sum(row[1] + row[2] for row in rows) ==
+                                result['totals']['success'] + result['totals']['failed'],
+                'distinct_hwids_error_pct': relative_error(result['totals']['distinct_hwids'], exact['distinct_hwids']),
+                'distinct_ips_error_pct': relative_error(result['totals']['distinct_ips'], exact['distinct_ips'])
+            })
+
+            exact_top = dict(raw_top_keys(month, until, args.limit))
+            result = analytics.top_keys('hwids', 'day', month, until, args.limit)
+            estimated = {entry['key_id']: entry['distinct_hwids'] for entry in result['keys']}
+            queries.append({
+                'query': 'top_keys_by_distinct_hwids_month',
+                'raw_ms': measure(lambda: raw_top_keys(month, until, args.limit), args.repeat),
+                'buckets_ms': measure(lambda: analytics.top_keys('hwids', 'day', month, until, args.limit),
+                                      args.repeat),
+                'top_overlap': len(set(exact_top) & set(estimated))
+            })
+
+            queries.append({
+                'query': 'top_keys_by_logins_month',
+                'raw_ms': measure(lambda: raw_top_keys(month, until, args.limit, 'logins'), args.repeat),
+                'buckets_ms': measure(lambda: analytics.top_keys('logins', 'day', month, until, args.limit),
+                                      args.repeat)
+            })
+
+            if key_id:
+                queries.append({
+                    'query': 'key_daily_month',
+                    'raw_ms': measure(lambda: raw_key_daily(key_id, month, until), args.repeat),
+                    'buckets_ms': measure(lambda: analytics.series('day', month, until, key_id), args.repeat)
+                })
+
+            for query in queries:
+                if query.get('raw_ms') and query['buckets_ms']:
+                    query['speedup'] = round(query['raw_ms'] / query['buckets_ms'], 1)
+
+            rng = random.Random(args.seed)
+            key_ids = [row[0] for row in db.session.execute(db.select(AccessLog.key_id).distinct().limit(10000))]
+            db.session.close()
+            disabled = write_cost(args.write_logs, False, rng, key_ids)
+            enabled = write_cost(args.write_logs, True, rng, key_ids)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    write_results({
+        'benchmark': 'analytics',
+        'environment': environment(),
+        'config': {
+            'db': os.path.abspath(args.db),
+            'repeat': args.repeat,
+            'limit': args.limit,
+            'write_logs': args.write_logs
+        },
+        'rebuild': {
+            'logs': rebuilt['logs'],
+            'seconds': round(rebuild_seconds, 2),
+            'logs_per_second': round(rebuilt['logs'] / rebuild_seconds) if rebuild_seconds else None
+        },
+        'queries': queries,
+        'write': {
+            'logs_per_second_without_buckets': round(args.write_logs / disabled),
+            'logs_per_second_with_buckets': round(args.write_logs / enabled),
+            'overhead_pct': round((enabled - disabled) / disabled * 100, 1)
+        }
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Benchmark de carga das APIs de autenticação e administração (vazão e latência p50/p95/p99)
+
+Uso:
+    python benchmarks/seed.py /tmp/bench.db --keys 1000000 --logs 20000000
+    python benchmarks/bench_api.py /tmp/bench.db --workers 8 --mode thread --duration 10
+    python benchmarks/bench_api.py /tmp/bench.db --target http --mode process --workers 4
+    python benchmarks/bench_api.py /tmp/bench.db --target http --url http://127.0.0.1:5000
+
+Cada execução trabalha numa cópia do banco (os logins alteram keys e logs), a menos de --in-place.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import (HttpTarget, TestClientTarget, drive, environment, make_app, run_workers,
+                     start_server, summarize, write_results)
+
+SCENARIOS = ('login', 'validate', 'admin_keys', 'admin_logs', 'admin_stats')
+SAMPLE_SIZE = 10000
+
+
+def load_sample(db_path, size=SAMPLE_SIZE, seed_value=1):
+    """Amostra de (key_id, hwid) do banco, usada para montar as requisições"""
+    connection = sqlite3.connect(db_path)
+    try:
+        rows = connection.execute(
+            'SELECT key_id, hwid FROM keys WHERE is_active = 1 AND is_paused = 0 AND expired = 0 ORDER BY id'
+        ).fetchall()
+    finally:
+        connection.close()
+    if not rows:
+        raise ValueError('Nenhuma key utilizável no banco')
+    return random.Random(seed_value).sample(rows, min(size, len(rows)))
+
+
+def request_factory(scenario, sample, rng, missing_fraction=0.1):
+    """Função que gera a próxima requisição (método, caminho, corpo) do cenário"""
+    def key():
+        return sample[rng.randrange(len(sample))]
+
+    if scenario == 'login':
+        def next_request():
+            key_id, hwid = key()
+            return 'POST', '/api/login', {'key_id': key_id, 'hwid': hwid or f'BENCH-{key_id}'}
+    elif scenario == 'validate':
+        def next_request():
+            if rng.random() < missing_fraction:
+                # Keys inexistentes exercitam o caminho de rejeição
+                return 'POST', '/api/validate', {'key_id': f'{rng.randrange(10 ** 8):08d}'}
+            return 'POST', '/api/validate', {'key_id': key()[0]}
+    elif scenario == 'admin_keys':
+        def next_request():
+            return 'GET', f'/api/admin/keys?per_page=50&page={rng.randrange(1, 21)}', None
+    elif scenario == 'admin_logs':
+        def next_request():
+            return 'GET', f'/api/admin/logs?per_page=50&page={rng.randrange(1, 21)}', None
+    elif scenario == 'admin_stats':
+        def next_request():
+            return 'GET', '/api/admin/stats', None
+    else:
+        raise ValueError(f'Cenário desconhecido: {scenario}')
+    return next_request
+
+
+# Aplicação compartilhada pelas threads de um mesmo processo (alvo test client)
+_apps = {}
+_apps_lock = threading.Lock()
+
+
+def worker(index, scenario, db_path, url, sample, duration, requests, warmup, seed_value):
+    """Um worker: cria seu alvo e executa o cenário; roda em thread ou processo"""
+    if url:
+        target = HttpTarget(url)
+    else:
+        key = (os.getpid(), db_path)
+        with _apps_lock:
+            if key not in _apps:
+                _apps[key] = make_app(db_path)
+        target = TestClientTarget(_apps[key])
+
+    rng = random.Random(seed_value * 1000 + index)
+    try:
+        return drive(target, request_factory(scenario, sample, rng), duration, requests, warmup)
+    finally:
+        target.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db', help='Banco criado por benchmarks/seed.py')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--mode', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--target', choices=('client', 'http'), default='client',
+                        help='client: test client do Flask; http: servidor local (ou --url)')
+    parser.add_argument('--url', help='Servidor já em execução (implica --target http)')
+    parser.add_argument('--duration', type=float, default=5.0, help='Segundos por cenário e número de workers')
+    parser.add_argument('--requests', type=int, help='Requisições por worker (em vez de --duration)')
+    parser.add_argument('--warmup', type=int, default=20, help='Requisições iniciais descartadas por worker')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--in-place', action='store_true', help='Usa o banco original em vez de uma cópia')
+    parser.add_argument('--output', help='Também grava o JSON neste arquivo')
+    args = parser.parse_args()
+
+    tmp = None
+    db_path = os.path.abspath(args.db)
+    if not args.in_place and not args.url:
+        tmp = tempfile.mkdtemp(prefix='bench-api-')
+        db_path = os.path.join(tmp, 'bench.db')
+        shutil.copyfile(args.db, db_path)
+
+    server = None
+    url = args.url
+    if args.target == 'http' and not url:
+        server, url = start_server(db_path)
+
+    try:
+        sample = load_sample(db_path if not args.url else os.path.abspath(args.db), seed_value=args.seed)
+        duration = None if args.requests else args.duration
+
+        results = []
+        for scenario in args.scenarios:
+            for workers in args.workers:
+                worker_args = [(index, scenario, db_path, url, sample, duration, args.requests, args.warmup, args.seed)
+                               for index in range(workers)]
+                samples, seconds = run_workers(worker, worker_args, args.mode)
+                results.append({
+                    'scenario': scenario,
+                    'mode': args.mode,
+                    'target': 'http' if url else 'client',
+                    'workers': workers,
+                    **summarize(samples, seconds)
+                })
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    write_results({
+        'benchmark': 'api',
+        'environment': environment(),
+        'config': {
+            'db': os.path.abspath(args.db),
+            'duration': duration,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'seed': args.seed
+        },
+        'results': results
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""Benchmark de contenção do SQLite: escritas e leituras simultâneas, com e sem a configuração de storage
+
+Uso:
+    python benchmarks/seed.py /tmp/bench.db --keys 100000 --logs 1000000
+    python benchmarks/bench_contention.py /tmp/bench.db --writers 4 --readers 4 --duration 10
+    python benchmarks/bench_contention.py /tmp/bench.db --mode process --target http
+
+Os escritores alternam reset de HWID e login (que reativa a key); os leitores chamam as rotas
+read_only (validate, listagem de keys e logs, estatísticas). Cada configuração roda numa cópia
+nova do banco:
+
+    default  journal em rollback e sem pool de leitura (SQLITE_TUNING_ENABLED = False)
+    tuned    WAL, pragmas, pool de leitura e escritor único (services/storage.py)
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_api import load_sample
+from harness import (HttpTarget, TestClientTarget, combine_results, drive, environment, make_app, run_workers,
+                     start_server, summarize, write_results)
+from src.services.key_cache import key_cache
+from src.services.log_writer import log_writer
+
+CONFIGS = {
+    'default': {'SQLITE_TUNING_ENABLED': False},
+    'tuned': {}
+}
+
+READ_SCENARIOS = ('validate', 'admin_keys', 'admin_logs', 'admin_stats')
+
+
+def writer_requests(sample, rng):
+    """Reset de HWID seguido do login que reativa a key: duas escritas síncronas por par"""
+    pending = []
+
+    def next_request():
+        if pending:
+            return pending.pop()
+        key_id, _ = sample[rng.randrange(len(sample))]
+        pending.append(('POST', '/api/login', {'key_id': key_id, 'hwid': f'BENCH-{rng.randrange(10 ** 6)}'}))
+        return 'POST', f'/api/admin/keys/{key_id}/reset-hwid', None
+    return next_request
+
+
+def reader_requests(sample, rng):
+    """Mistura das rotas read_only"""
+    def next_request():
+        scenario = READ_SCENARIOS[rng.randrange(len(READ_SCENARIOS))]
+        if scenario == 'validate':
+            return 'POST', '/api/validate', {'key_id': sample[rng.randrange(len(sample))][0]}
+        if scenario == 'admin_keys':
+            return 'GET', f'/api/admin/keys?per_page=50&page={rng.randrange(1, 21)}', None
+        if scenario == 'admin_logs':
+            return 'GET', f'/api/admin/logs?per_page=50&page={rng.randrange(1, 21)}', None
+        return 'GET', '/api/admin/stats', None
+    return next_request
+
+
+# Aplicação compartilhada pelas threads de um mesmo processo (alvo test client)
+_apps = {}
+_apps_lock = threading.Lock()
+
+
+def worker(index, role, config_name, db_path, url, sample, duration, requests, warmup, seed_value):
+    """Um escritor ou leitor; roda em thread ou processo"""
+    if url:
+        target = HttpTarget(url)
+    else:
+        key = (os.getpid(), db_path)
+        with _apps_lock:
+            if key not in _apps:
+                _apps[key] = make_app(db_path, **CONFIGS[config_name])
+        target = TestClientTarget(_apps[key])
+
+    rng = random.Random(seed_value * 1000 + index)
+    factory = writer_requests if role == 'writer' else reader_requests
+    try:
+        return drive(target, factory(sample, rng), duration, requests, warmup)
+    finally:
+        target.close()
+
+
+def prepare_copy(source, directory, config_name):
+    """Cópia do banco para a configuração; o default volta ao journal em rollback"""
+    db_path = os.path.join(directory, f'{config_name}.db')
+    shutil.copyfile(source, db_path)
+    connection = sqlite3.connect(db_path)
+    try:
+        # O modo WAL fica gravado no arquivo: sem isto o default herdaria o WAL de uma execução tuned
+        connection.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        connection.close()
+    return db_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db', help='Banco criado por benchmarks/seed.py (não é alterado)')
+    parser.add_argument('--configs', nargs='+', choices=tuple(CONFIGS), default=list(CONFIGS))
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--mode', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--target', choices=('client', 'http'), default='client',
+                        help='client: test client do Flask; http: servidor local')
+    parser.add_argument('--duration', type=float, default=5.0, help='Segundos por configuração')
+    parser.add_argument('--requests', type=int, help='Requisições por worker (em vez de --duration)')
+    parser.add_argument('--warmup', type=int, default=20, help='Requisições iniciais descartadas por worker')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Também grava o JSON neste arquivo')
+    args = parser.parse_args()
+
+    if args.writers + args.readers < 1:
+        parser.error('É preciso ao menos um escritor ou leitor')
+
+    sample = load_sample(os.path.abspath(args.db), seed_value=args.seed)
+    duration = None if args.requests else args.duration
+    roles = ['writer'] * args.writers + ['reader'] * args.readers
+
+    tmp = tempfile.mkdtemp(prefix='bench-contention-')
+    results = []
+    try:
+        for config_name in args.configs:
+            db_path = prepare_copy(os.path.abspath(args.db), tmp, config_name)
+            server = url = None
+            if args.target == 'http':
+                server, url = start_server(db_path, config=CONFIGS[config_name])
+            try:
+                worker_args = [(index, role, config_name, db_path, url, sample, duration, args.requests,
+                                args.warmup, args.seed) for index, role in enumerate(roles)]
+                outcomes = run_workers(worker, worker_args, args.mode, combine=False)
+                # No modo thread as configurações rodam no mesmo processo: os logs pendentes vão para
+                # o banco desta configuração e o cache de keys não passa para a próxima
+                log_writer.flush()
+                key_cache.clear()
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.join()
+
+            result = {
+                'config': config_name,
+                'mode': args.mode,
+                'target': args.target,
+                'writers': args.writers,
+                'readers': args.readers,
+                **summarize(*combine_results(outcomes))
+            }
+            for role in ('writer', 'reader'):
+                group = [outcome for outcome, worker_role in zip(outcomes, roles) if worker_role == role]
+                if group:
+                    result[f'{role}s_summary'] = summarize(*combine_results(group))
+            results.append(result)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    output = {
+        'benchmark': 'contention',
+        'environment': environment(),
+        'config': {
+            'db': os.path.abspath(args.db),
+            'duration': duration,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    by_config = {result['config']: result for result in results}
+    if 'default' in by_config and 'tuned' in by_config and by_config['default']['throughput_rps']:
+        output['throughput_gain'] = round(by_config['tuned']['throughput_rps'] / by_config['default']['throughput_rps'], 2)
+    write_results(output, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark da geração de keys em lote (keys/segundo por volume de keys existentes)
+
+Uso:
+    python benchmarks/bench_mint.py --existing 10000 100000 1000000 --quantity 50000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models.key import db, Key
+from src.services.key_allocator import key_allocator
+from src.services.key_minting import mint_keys
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def seed_keys(count, chunk_size=50000):
+    """Popula a tabela keys com count keys sequenciais"""
+    for start in range(0, count, chunk_size):
+        rows = [{'key_id': f'{n:08d}', 'expiration_days': 30, 'is_active': True,
+                 'is_paused': False, 'is_used': False}
+                for n in range(start, min(start + chunk_size, count))]
+        db.session.execute(Key.__table__.insert(), rows)
+    db.session.commit()
+
+
+def run(existing, quantity):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            seed_keys(existing)
+            key_allocator.reset()
+
+            started = time.perf_counter()
+            key_ids = mint_keys(quantity, 30)
+            elapsed = time.perf_counter() - started
+
+            assert len(set(key_ids)) == quantity
+            assert Key.query.count() == existing + quantity
+            db.session.remove()
+            db.engine.dispose()
+
+    return {
+        'existing_keys': existing,
+        'minted_keys': quantity,
+        'seconds': round(elapsed, 3),
+        'keys_per_second': round(quantity / elapsed)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--existing', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--quantity', type=int, default=50000)
+    args = parser.parse_args()
+
+    results = [run(existing, args.quantity) for existing in args.existing]
+    print(json.dumps({'benchmark': 'mint_keys', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Micro-benchmark da serialização das listagens: objetos do ORM + to_dict() x colunas projetadas
+
+Uso:
+    python benchmarks/seed.py /tmp/bench.db --keys 100000 --logs 1000000
+    python benchmarks/bench_serialization.py /tmp/bench.db --per-page 20 50 100
+
+Para cada página mede consulta + conversão + JSON pelos dois caminhos e confere que os
+corpos das respostas são iguais (byte a byte com o encoder padrão; com orjson, como JSON).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import environment, make_app, write_results
+from flask import jsonify
+from sqlalchemy import desc
+from src.models.key import Key, AccessLog
+from src.services.serialization import KEY_COLUMNS, LOG_COLUMNS, key_dicts, log_dicts, json_backend, json_response
+
+TARGETS = {
+    'keys': (Key, (Key.created_at, Key.id), KEY_COLUMNS, key_dicts),
+    'logs': (AccessLog, (AccessLog.login_at, AccessLog.id), LOG_COLUMNS, log_dicts)
+}
+
+
+def orm_body(model, order, per_page, page):
+    items = model.query.order_by(*[desc(column) for column in order]).limit(per_page).offset((page - 1) * per_page).all()
+    return jsonify({'success': True, 'items': [item.to_dict() for item in items]}).get_data()
+
+
+def projected_body(model, order, columns, serialize, per_page, page):
+    rows = model.query.order_by(*[desc(column) for column in order]).with_entities(*columns) \
+        .limit(per_page).offset((page - 1) * per_page).all()
+    return json_response({'success': True, 'items': serialize(rows)}).get_data()
+
+
+def measure(function, repeat, pages):
+    """Mediana, em ms, do tempo de uma página (percorrendo pages páginas por rodada)"""
+    timings = []
+    for _ in range(repeat):
+        for page in range(1, pages + 1):
+            started = time.perf_counter()
+            function(page)
+            timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db', help='Banco criado por benchmarks/seed.py (não é alterado)')
+    parser.add_argument('--per-page', type=int, nargs='+', default=[20, 50, 100])
+    parser.add_argument('--pages', type=int, default=20, help='Páginas diferentes por rodada')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='Também grava o JSON neste arquivo')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench-serialization-')
+    results = []
+    try:
+        db_path = os.path.join(tmp, 'bench.db')
+        shutil.copyfile(args.db, db_path)
+        app = make_app(db_path)
+
+        for backend_enabled in (False, True):
+            app.config['FAST_JSON_ENABLED'] = backend_enabled
+            with app.test_request_context():
+                backend = json_backend()
+                if backend_enabled and backend == 'json':
+                    # orjson não instalado: a segunda rodada repetiria a primeira
+                    continue
+
+                for name, (model, order, columns, serialize) in TARGETS.items():
+                    for per_page in args.per_page:
+                        def orm(page):
+                            return orm_body(model, order, per_page, page)
+
+                        def projected(page):
+                            return projected_body(model, order, columns, serialize, per_page, page)
+
+                        old, new = orm(1), projected(1)
+                        orm_ms = measure(orm, args.repeat, args.pages)
+                        projected_ms = measure(projected, args.repeat, args.pages)
+                        results.append({
+                            'target': name,
+                            'backend': backend,
+                            'per_page': per_page,
+                            'to_dict_ms': orm_ms,
+                            'projected_ms': projected_ms,
+                            'speedup': round(orm_ms / projected_ms, 2) if projected_ms else None,
+                            'identical_bytes': old == new,
+                            'identical_json': json.loads(old) == json.loads(new)
+                        })
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    write_results({
+        'benchmark': 'serialization',
+        'environment': environment(),
+        'config': {
+            'db': os.path.abspath(args.db),
+            'pages': args.pages,
+            'repeat': args.repeat
+        },
+        'results': results
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Benchmark de inicialização: custo de criar a aplicação num processo novo e de subir workers por fork
+
+Uso:
+    python benchmarks/seed.py /tmp/bench.db --keys 1000000 --logs 1000000
+    python benchmarks/bench_startup.py /tmp/bench.db --workers 1 4 8
+
+cold_start mede, num interpretador novo, o import de src.main e o create_app() (verificação do
+schema e carga do filtro de keys): o que cada worker pagaria se criasse a própria aplicação.
+prefork mede o src/server.py: o mestre cria a aplicação uma vez e os workers só fazem o fork.
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import environment, make_app, percentile, write_results
+from src.server import PreforkServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD_START = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from src.main import create_app
+imported = time.perf_counter()
+create_app({config!r})
+created = time.perf_counter()
+print(json.dumps({{'import_seconds': imported - started, 'create_app_seconds': created - imported}}))
+'''
+
+
+def cold_start(db_path):
+    """Import e create_app num processo Python novo"""
+    config = {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'RETENTION_ARCHIVE_URI': f'sqlite:///{os.path.splitext(db_path)[0]}-archive.db'
+    }
+    output = subprocess.run([sys.executable, '-c', COLD_START.format(root=ROOT, config=config)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def first_response(port, timeout=10):
+    """Segundos até a primeira resposta de um worker"""
+    started = time.perf_counter()
+    deadline = started + timeout
+    while True:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+            connection.request('GET', '/api/admin/stats')
+            connection.getresponse().read()
+            connection.close()
+            return time.perf_counter() - started
+        except OSError:
+            if time.perf_counter() >= deadline:
+                raise
+            time.sleep(0.01)
+
+
+def prefork(db_path, workers):
+    """Sobe workers sobre uma aplicação já criada e mede boot, primeira resposta e encerramento"""
+    app = make_app(db_path)
+    server = PreforkServer(app, '127.0.0.1', 0, workers, background=False)
+
+    started = time.perf_counter()
+    server.start()
+    start_seconds = time.perf_counter() - started
+    try:
+        response_seconds = first_response(server.port)
+    finally:
+        stopping = time.perf_counter()
+        server.shutdown()
+        server.wait()
+        shutdown_seconds = time.perf_counter() - stopping
+
+    boot_times = sorted(server.boot_times.values())
+    return {
+        'workers': workers,
+        'start_seconds': round(start_seconds, 4),
+        'worker_boot_ms': {
+            'p50': round(percentile(boot_times, 0.5) * 1000, 2),
+            'max': round(boot_times[-1] * 1000, 2)
+        },
+        'first_response_ms': round(response_seconds * 1000, 2),
+        'shutdown_seconds': round(shutdown_seconds, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db', help='Banco criado por benchmarks/seed.py (não é alterado)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=3, help='Execuções de cold start (mediana)')
+    parser.add_argument('--output', help='Também grava o JSON neste arquivo')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        parser.error('O servidor com workers exige fork (Linux/macOS)')
+
+    # O log de cada requisição dos workers no stderr
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    tmp = tempfile.mkdtemp(prefix='bench-startup-')
+    try:
+        db_path = os.path.join(tmp, 'bench.db')
+        shutil.copyfile(args.db, db_path)
+
+        runs = [cold_start(db_path) for _ in range(args.repeat)]
+        cold = {name: round(statistics.median(run[name] for run in runs), 4)
+                for name in ('import_seconds', 'create_app_seconds')}
+        results = [prefork(db_path, workers) for workers in args.workers]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    write_results({
+        'benchmark': 'startup',
+        'environment': environment(),
+        'config': {
+            'db': os.path.abspath(args.db),
+            'repeat': args.repeat
+        },
+        'cold_start': cold,
+        'prefork': results
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Compara dois resultados JSON de benchmarks/bench_api.py (variação de vazão e latência)
+
+Uso:
+    python benchmarks/compare.py antes.json depois.json
+    python benchmarks/compare.py antes.json depois.json --max-regression 10
+"""
+
+import argparse
+import json
+import sys
+
+KEY_FIELDS = ('scenario', 'mode', 'target', 'workers')
+LATENCIES = ('p50', 'p95', 'p99')
+
+
+def change(before, after):
+    """Variação percentual de before para after"""
+    if not before or after is None:
+        return None
+    return round((after - before) / before * 100, 1)
+
+
+def compare(before, after):
+    """Pareia os resultados pelas mesmas condições e calcula as variações"""
+    baseline = {tuple(result[field] for field in KEY_FIELDS): result for result in before['results']}
+    rows = []
+    for result in after['results']:
+        key = tuple(result[field] for field in KEY_FIELDS)
+        if key not in baseline:
+            continue
+        old = baseline[key]
+        rows.append({
+            **dict(zip(KEY_FIELDS, key)),
+            'throughput_rps': [old['throughput_rps'], result['throughput_rps'],
+                               change(old['throughput_rps'], result['throughput_rps'])],
+            **{f'{name}_ms': [old['latency_ms'][name], result['latency_ms'][name],
+                              change(old['latency_ms'][name], result['latency_ms'][name])]
+               for name in LATENCIES}
+        })
+    return rows
+
+
+def regressions(rows, max_regression):
+    """Linhas em que a vazão caiu ou o p95 subiu mais que max_regression por cento"""
+    found = []
+    for row in rows:
+        throughput = row['throughput_rps'][2]
+        p95 = row['p95_ms'][2]
+        if (throughput is not None and throughput < -max_regression) or (p95 is not None and p95 > max_regression):
+            found.append(row)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--max-regression', type=float,
+                        help='Sai com código 1 se a vazão cair ou o p95 subir mais que esta porcentagem')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    rows = compare(before, after)
+    output = {
+        'before': before.get('environment', {}).get('git_commit'),
+        'after': after.get('environment', {}).get('git_commit'),
+        # [antes, depois, variação %]
+        'results': rows
+    }
+    if args.max_regression is not None:
+        output['regressions'] = regressions(rows, args.max_regression)
+    print(json.dumps(output, indent=2))
+
+    if output.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,467 @@
+"""Orçamento de comandos SQL, varreduras completas e latência por endpoint
+
+Uso:
+    python benchmarks/guard.py
+    python benchmarks/guard.py --size small large
+    python benchmarks/guard.py --fixture large=/tmp/bench.db --size large --repeat 5
+    python benchmarks/guard.py --update-budgets
+
+Executa cada rota de src/routes/auth.py e src/routes/admin.py pelo test client sobre uma cópia do
+banco pequeno (e, com --size large, do grande; ambos criados por benchmarks/seed.py) e confere os limites de
+benchmarks/budgets.json: número máximo de comandos SQL por requisição, tabelas que podem ser lidas
+por inteiro (EXPLAIN QUERY PLAN) e latência mediana das execuções após o aquecimento, nunca abaixo
+de LATENCY_FLOOR_MS. Sai com código 1 se algum limite for
+ultrapassado ou se uma rota não tiver cenário, mostrando os comandos da requisição que estourou.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import environment, make_app, write_results
+from seed import seed
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from src.models.key import db
+from src.services.analytics import analytics
+from src.services.log_writer import log_writer
+
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'budgets.json')
+
+SIZES = {
+    'small': {'keys': 1000, 'logs': 10000},
+    'large': {'keys': 20000, 'logs': 200000}
+}
+
+# Comandos que o EXPLAIN QUERY PLAN sabe descrever
+PLANNED_PREFIXES = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+# "SCAN keys", "SCAN k USING COVERING INDEX ...": a tabela (ou o índice) inteira é percorrida
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX \w+)?$')
+SELECTED_COLUMNS = re.compile(r'^SELECT (?:(?!\bFROM\b).)* FROM ')
+# Folga de --update-budgets sobre a latência medida, com um mínimo (também na conferência) para não
+# falhar por ruído: a latência só pega regressões grosseiras; os comandos SQL são o sinal exato
+LATENCY_HEADROOM = 3
+LATENCY_FLOOR_MS = 50
+
+
+class Tracer:
+    """Comandos SQL executados pela thread da requisição (os da thread do writer e dos jobs ficam de fora)"""
+
+    def __init__(self):
+        self._local = threading.local()
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    def start(self):
+        self._local.statements = []
+
+    def stop(self):
+        statements, self._local.statements = self._local.statements, None
+        return statements
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        statements = getattr(self._local, 'statements', None)
+        if statements is not None:
+            if executemany:
+                parameters = parameters[0] if parameters else ()
+            statements.append((conn.engine.url.database, statement, parameters))
+
+
+class Fixture:
+    """Banco de um tamanho e amostras de keys para montar as requisições"""
+
+    def __init__(self, size, path):
+        self.size = size
+        self.path = path
+        connection = sqlite3.connect(path)
+        try:
+            self.unused = [row[0] for row in connection.execute(
+                "SELECT key_id FROM keys WHERE status = 'available' ORDER BY key_id LIMIT 2000")]
+            self.used = [tuple(row) for row in connection.execute(
+                "SELECT key_id, hwid FROM keys WHERE status = 'used' ORDER BY key_id LIMIT 2000")]
+            self.logged = connection.execute(
+                'SELECT key_id FROM access_logs GROUP BY key_id ORDER BY count(*) DESC LIMIT 1').fetchone()[0]
+            self.rows = {name: connection.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0]
+                         for (name,) in connection.execute(
+                             "SELECT name FROM sqlite_master WHERE type = 'table' AND sql NOT LIKE '%VIRTUAL%'")}
+        finally:
+            connection.close()
+
+    def take_unused(self, count=1):
+        taken, self.unused = self.unused[:count], self.unused[count:]
+        return taken
+
+    def take_used(self, count=1):
+        taken, self.used = self.used[:count], self.used[count:]
+        return taken
+
+    def sample_used(self, count):
+        """Keys em uso sem retirá-las da amostra (requisições que não alteram as keys)"""
+        return self.used[-count:]
+
+
+def login_token(client, fixture):
+    key_id, hwid = fixture.take_used()[0]
+    response = client.post('/api/login', json={'key_id': key_id, 'hwid': hwid})
+    return {'token': response.get_json()['session']['token'], 'hwid': hwid}
+
+
+def created_job(client, fixture):
+    response = client.post('/api/admin/jobs', json={'action': 'extend', 'days': 1,
+                                                    'key_ids': [key_id for key_id, _ in fixture.sample_used(10)]})
+    wait_for_jobs(client, response)
+    return response.get_json()['job']['id']
+
+
+# (nome, método, regra da rota, requisição); a requisição recebe (client, fixture) e retorna
+# (caminho, corpo), montando fora da medição o que precisar (tokens, jobs). As destrutivas ficam no
+# fim e rodam uma vez.
+SCENARIOS = [
+    ('POST /api/login', 'POST', '/api/login',
+     lambda client, fixture: ('/api/login', {'key_id': fixture.take_unused()[0], 'hwid': 'GUARD-HWID'})),
+    ('POST /api/login (key em uso)', 'POST', '/api/login',
+     lambda client, fixture: ('/api/login', dict(zip(('key_id', 'hwid'), fixture.take_used()[0])))),
+    ('POST /api/heartbeat', 'POST', '/api/heartbeat',
+     lambda client, fixture: ('/api/heartbeat', login_token(client, fixture))),
+    ('POST /api/validate', 'POST', '/api/validate',
+     lambda client, fixture: ('/api/validate', {'key_id': fixture.take_used()[0][0]})),
+    ('POST /api/validate/batch', 'POST', '/api/validate/batch',
+     lambda client, fixture: ('/api/validate/batch', {'keys': [key_id for key_id, _ in fixture.sample_used(100)]})),
+    ('POST /api/login/batch', 'POST', '/api/login/batch',
+     lambda client, fixture: ('/api/login/batch', {'keys': [
+         {'key_id': key_id, 'hwid': hwid} for key_id, hwid in fixture.take_used(50)]})),
+
+    ('POST /api/admin/keys', 'POST', '/api/admin/keys',
+     lambda client, fixture: ('/api/admin/keys', {'quantity': 100})),
+    ('POST /api/admin/keys/bulk', 'POST', '/api/admin/keys/bulk',
+     lambda client, fixture: ('/api/admin/keys/bulk', {'quantity': 1000})),
+    ('GET /api/admin/keys', 'GET', '/api/admin/keys',
+     lambda client, fixture: ('/api/admin/keys?per_page=50', None)),
+    ('GET /api/admin/keys (página 20)', 'GET', '/api/admin/keys',
+     lambda client, fixture: ('/api/admin/keys?per_page=50&page=20', None)),
+    ('GET /api/admin/keys (busca)', 'GET', '/api/admin/keys',
+     lambda client, fixture: ('/api/admin/keys?search=123&match=prefix', None)),
+    ('GET /api/admin/keys (status)', 'GET', '/api/admin/keys',
+     lambda client, fixture: ('/api/admin/keys?status=expired', None)),
+    ('GET /api/admin/keys/export', 'GET', '/api/admin/keys/export',
+     lambda client, fixture: ('/api/admin/keys/export?status=expired', None)),
+    ('GET /api/admin/keys/<key_id>', 'GET', '/api/admin/keys/<key_id>',
+     lambda client, fixture: (f'/api/admin/keys/{fixture.logged}', None)),
+    ('POST /api/admin/keys/<key_id>/reset-hwid', 'POST', '/api/admin/keys/<key_id>/reset-hwid',
+     lambda client, fixture: (f'/api/admin/keys/{fixture.take_used()[0][0]}/reset-hwid', None)),
+    ('DELETE /api/admin/keys/<key_id>', 'DELETE', '/api/admin/keys/<key_id>',
+     lambda client, fixture: (f'/api/admin/keys/{fixture.take_used()[0][0]}', None)),
+
+    ('GET /api/admin/logs', 'GET', '/api/admin/logs',
+     lambda client, fixture: ('/api/admin/logs', None)),
+    ('GET /api/admin/logs (key)', 'GET', '/api/admin/logs',
+     lambda client, fixture: (f'/api/admin/logs?key_id={fixture.logged}', None)),
+    ('GET /api/admin/logs/export', 'GET', '/api/admin/logs/export',
+     lambda client, fixture: (f'/api/admin/logs/export?key_id={fixture.logged}', None)),
+    ('GET /api/admin/logs/rollups', 'GET', '/api/admin/logs/rollups',
+     lambda client, fixture: ('/api/admin/logs/rollups?period=day', None)),
+    ('GET /api/admin/analytics', 'GET', '/api/admin/analytics',
+     lambda client, fixture: ('/api/admin/analytics?period=hour', None)),
+    ('GET /api/admin/analytics (key)', 'GET', '/api/admin/analytics',
+     lambda client, fixture: (f'/api/admin/analytics?period=day&key_id={fixture.logged}', None)),
+    ('GET /api/admin/analytics/top-keys', 'GET', '/api/admin/analytics/top-keys',
+     lambda client, fixture: ('/api/admin/analytics/top-keys?by=logins', None)),
+    ('GET /api/admin/analytics/top-keys (hwids)', 'GET', '/api/admin/analytics/top-keys',
+     lambda client, fixture: ('/api/admin/analytics/top-keys?by=hwids', None)),
+    ('GET /api/admin/retention', 'GET', '/api/admin/retention',
+     lambda client, fixture: ('/api/admin/retention', None)),
+    ('GET /api/admin/stats', 'GET', '/api/admin/stats',
+     lambda client, fixture: ('/api/admin/stats', None)),
+    # Só o estado inicial: o stream não termina e é fechado sem ser lido
+    ('GET /api/admin/stream', 'GET', '/api/admin/stream',
+     lambda client, fixture: ('/api/admin/stream', None)),
+    ('GET /api/admin/event-bus', 'GET', '/api/admin/event-bus',
+     lambda client, fixture: ('/api/admin/event-bus', None)),
+    ('GET /api/admin/cache', 'GET', '/api/admin/cache',
+     lambda client, fixture: ('/api/admin/cache', None)),
+    ('GET /api/admin/membership', 'GET', '/api/admin/membership',
+     lambda client, fixture: ('/api/admin/membership', None)),
+    ('GET /api/admin/log-writer', 'GET', '/api/admin/log-writer',
+     lambda client, fixture: ('/api/admin/log-writer', None)),
+    ('GET /api/admin/rate-limit', 'GET', '/api/admin/rate-limit',
+     lambda client, fixture: ('/api/admin/rate-limit', None)),
+    ('GET /api/admin/shards', 'GET', '/api/admin/shards',
+     lambda client, fixture: ('/api/admin/shards', None)),
+    ('GET /api/admin/storage', 'GET', '/api/admin/storage',
+     lambda client, fixture: ('/api/admin/storage', None)),
+    ('POST /api/admin/jobs', 'POST', '/api/admin/jobs',
+     lambda client, fixture: ('/api/admin/jobs', {'action': 'extend', 'days': 1, 'filters': {'status': 'expired'}})),
+    ('GET /api/admin/jobs', 'GET', '/api/admin/jobs',
+     lambda client, fixture: ('/api/admin/jobs', None)),
+    ('GET /api/admin/jobs/<job_id>', 'GET', '/api/admin/jobs/<job_id>',
+     lambda client, fixture: (f'/api/admin/jobs/{created_job(client, fixture)}', None)),
+
+    ('POST /api/admin/keys/pause-all', 'POST', '/api/admin/keys/pause-all',
+     lambda client, fixture: ('/api/admin/keys/pause-all', {'pause': True})),
+    ('POST /api/admin/analytics/rebuild', 'POST', '/api/admin/analytics/rebuild',
+     lambda client, fixture: ('/api/admin/analytics/rebuild', None)),
+    ('POST /api/admin/retention/run', 'POST', '/api/admin/retention/run',
+     lambda client, fixture: ('/api/admin/retention/run', None)),
+    ('DELETE /api/admin/keys/delete-all', 'DELETE', '/api/admin/keys/delete-all',
+     lambda client, fixture: ('/api/admin/keys/delete-all', None))
+]
+
+# Executadas uma única vez por banco: alteram tudo ou custam o banco inteiro
+RUN_ONCE = {
+    'POST /api/admin/keys/pause-all',
+    'POST /api/admin/analytics/rebuild',
+    'POST /api/admin/retention/run',
+    'DELETE /api/admin/keys/delete-all'
+}
+STREAMS = {'GET /api/admin/stream'}
+
+
+def create_fixture(path, size):
+    """Banco do seed.py com os buckets de analytics já calculados, como numa base em uso"""
+    seed(path, **SIZES[size])
+    app = make_app(path)
+    with app.app_context():
+        analytics.rebuild()
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def missing_scenarios(app):
+    """Rotas dos blueprints auth e admin sem nenhum cenário"""
+    covered = {(method, rule) for _, method, rule, _ in SCENARIOS}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint.split('.')[0] not in ('auth', 'admin'):
+            continue
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            if (method, rule.rule) not in covered:
+                missing.append(f'{method} {rule.rule}')
+    return missing
+
+
+def wait_for_jobs(client, response):
+    """Espera o job criado pela requisição terminar, para não disputar o banco com o próximo cenário"""
+    if response.status_code != 202:
+        return
+    job_id = response.get_json()['job']['id']
+    deadline = time.time() + 600
+    while time.time() < deadline:
+        job = client.get(f'/api/admin/jobs/{job_id}').get_json()['job']
+        if job['status'] in ('done', 'failed'):
+            return
+        time.sleep(0.05)
+
+
+def full_scans(statements, plans, fixture):
+    """Tabelas do banco principal lidas por inteiro em algum comando, pelo EXPLAIN QUERY PLAN"""
+    scanned = set()
+    for database, statement, parameters in statements:
+        # Arquivo da retenção e contadores do limite de requisições ficam de fora
+        if database != fixture.path or not statement.lstrip().upper().startswith(PLANNED_PREFIXES):
+            continue
+        key = (database, statement)
+        if key not in plans:
+            connection = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+            try:
+                plans[key] = [row[3] for row in connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+            except sqlite3.Error:
+                # Tabelas temporárias e afins: sem plano
+                plans[key] = []
+            finally:
+                connection.close()
+        for detail in plans[key]:
+            match = FULL_SCAN.match(detail)
+            if match and match.group(1) in fixture.rows:
+                scanned.add(match.group(1))
+    return sorted(scanned)
+
+
+def run_scenario(tracer, client, fixture, name, path_factory, method, repeat, plans):
+    """Executa o cenário repeat vezes; retorna a medição e os comandos da execução com mais SQL
+
+    A primeira execução (exceto nos cenários RUN_ONCE) é de aquecimento: conta os comandos, com os
+    caches ainda frios, mas fica fora da latência.
+    """
+    timings = []
+    statuses = set()
+    worst = []
+    scanned = set()
+    runs = 1 if name in RUN_ONCE else repeat + 1
+    for run in range(runs):
+        path, body = path_factory(client, fixture)
+        log_writer.flush(timeout=60)
+
+        tracer.start()
+        started = time.perf_counter()
+        response = client.open(path, method=method, json=body, buffered=False)
+        if name not in STREAMS:
+            response.get_data()
+        response.close()
+        elapsed = time.perf_counter() - started
+        statements = tracer.stop()
+
+        if run > 0 or runs == 1:
+            timings.append(elapsed)
+        statuses.add(response.status_code)
+        if len(statements) > len(worst):
+            worst = statements
+        scanned.update(full_scans(statements, plans, fixture))
+
+        if name in RUN_ONCE or method == 'POST' and path == '/api/admin/jobs':
+            wait_for_jobs(client, response)
+        log_writer.flush(timeout=60)
+
+    return {
+        'statuses': sorted(statuses),
+        'queries': len(worst),
+        'full_scans': sorted(scanned),
+        'scanned_rows': sum(fixture.rows[table] for table in scanned),
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'max_ms': round(max(timings) * 1000, 3)
+    }, worst
+
+
+def check(name, size, measured, budget):
+    """Violações do orçamento, em linhas legíveis"""
+    if budget is None:
+        return ['sem orçamento em budgets.json']
+    problems = []
+    if any(status >= 500 for status in measured['statuses']):
+        problems.append(f"respostas com erro: {measured['statuses']}")
+    if measured['queries'] > budget['max_queries']:
+        problems.append(f"comandos SQL: {measured['queries']} > {budget['max_queries']}")
+    extra = [table for table in measured['full_scans'] if table not in budget.get('full_scans', [])]
+    if extra:
+        problems.append(f"varredura completa não permitida: {', '.join(extra)} "
+                        f"(~{measured['scanned_rows']} linhas no banco {size})")
+    limit = budget.get('max_ms', {}).get(size)
+    if limit is not None and measured['median_ms'] > max(limit, LATENCY_FLOOR_MS):
+        problems.append(f"latência mediana: {measured['median_ms']} ms > {limit} ms")
+    return problems
+
+
+def describe(statements):
+    """Comandos agrupados pelo texto, com a contagem: N+1 aparece como um comando repetido"""
+    counts = {}
+    for _, statement, _ in statements:
+        # A lista de colunas esconderia o FROM/WHERE, que é o que diferencia os comandos
+        text = SELECTED_COLUMNS.sub('SELECT ... FROM ', ' '.join(statement.split()), count=1)
+        counts[text] = counts.get(text, 0) + 1
+    return [f'{count:>5} x {text[:160]}' for text, count in counts.items()]
+
+
+def updated_budgets(budgets, results):
+    """Orçamentos com os valores medidos (latência com folga de LATENCY_HEADROOM vezes)"""
+    updated = {}
+    for result in results:
+        entry = updated.setdefault(result['scenario'], {'max_queries': 0, 'full_scans': [], 'max_ms': {}})
+        entry['max_queries'] = max(entry['max_queries'], result['queries'])
+        entry['full_scans'] = sorted(set(entry['full_scans']) | set(result['full_scans']))
+        entry['max_ms'][result['size']] = max(LATENCY_FLOOR_MS, math.ceil(result['median_ms'] * LATENCY_HEADROOM))
+    return {**budgets, **updated}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    # O banco grande (criação e rotas de manutenção) leva minutos: só quando pedido
+    parser.add_argument('--size', choices=sorted(SIZES), nargs='+', default=['small'])
+    parser.add_argument('--fixture', action='append', default=[], metavar='SIZE=DB',
+                        help='Usa este banco (não é alterado) em vez de criar um pelo seed.py')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help='Só os cenários cujo nome contém este texto')
+    parser.add_argument('--budgets', default=BUDGETS_PATH)
+    parser.add_argument('--update-budgets', action='store_true',
+                        help='Grava os valores medidos como novos orçamentos em vez de conferir')
+    parser.add_argument('--output', help='Também grava o JSON neste arquivo')
+    args = parser.parse_args()
+
+    fixtures = dict(item.split('=', 1) for item in args.fixture)
+    with open(args.budgets) as f:
+        budgets = json.load(f)
+
+    tracer = Tracer()
+    results = []
+    failures = []
+    tmp = tempfile.mkdtemp(prefix='bench-guard-')
+    try:
+        for size in args.size:
+            source = fixtures.get(size)
+            if source is None:
+                source = os.path.join(tmp, f'{size}-seed.db')
+                create_fixture(source, size)
+            db_path = os.path.join(tmp, f'{size}.db')
+            shutil.copyfile(source, db_path)
+            fixture = Fixture(size, db_path)
+
+            # pause-all roda na própria requisição em qualquer tamanho: os comandos do job entram na contagem
+            app = make_app(db_path, BULK_JOB_CHUNK_PAUSE=0, BULK_JOB_SYNC_MAX_KEYS=float('inf'))
+            if size == args.size[0]:
+                failures.extend((name, None, ['rota sem cenário em benchmarks/guard.py'], [])
+                                for name in missing_scenarios(app))
+            client = app.test_client()
+            plans = {}
+            with app.app_context():
+                for name, method, _, path_factory in SCENARIOS:
+                    if args.only and args.only not in name:
+                        continue
+                    measured, statements = run_scenario(tracer, client, fixture, name, path_factory, method,
+                                                        args.repeat, plans)
+                    results.append({'scenario': name, 'size': size, **measured})
+                    problems = check(name, size, measured, budgets.get(name))
+                    if problems:
+                        failures.append((name, size, problems, statements))
+                    # Progresso em stderr (o JSON final vai para stdout)
+                    print(f'[{size}] {name}: {measured["queries"]} comando(s), mediana {measured["median_ms"]} ms'
+                          + (' - FALHOU' if problems else ''), file=sys.stderr, flush=True)
+
+                log_writer.flush(timeout=60)
+                db.session.remove()
+                for engine in db.engines.values():
+                    engine.dispose()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.update_budgets:
+        with open(args.budgets, 'w') as f:
+            json.dump(updated_budgets(budgets, results), f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        failures = []
+
+    write_results({
+        'benchmark': 'guard',
+        'environment': environment(),
+        'config': {
+            'sizes': {size: fixtures.get(size) or SIZES[size] for size in args.size},
+            'repeat': args.repeat,
+            'budgets': os.path.abspath(args.budgets)
+        },
+        'results': results,
+        'failures': [{'scenario': name, 'size': size, 'problems': problems}
+                     for name, size, problems, _ in failures]
+    }, args.output)
+
+    if failures:
+        lines = [f'\nOrçamentos ultrapassados ({len(failures)}):']
+        for name, size, problems, statements in failures:
+            lines.append(f'\n  {name}' + (f' [{size}]' if size else ''))
+            lines.extend(f'    - {problem}' for problem in problems)
+            if statements:
+                lines.append('    comandos SQL:')
+                lines.extend(f'    {line}' for line in describe(statements))
+        print('\n'.join(lines), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""Utilitários compartilhados pelos benchmarks: app sobre um banco qualquer, workers de carga e percentis"""
+
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import create_app
+
+
+def make_app(db_path, **config):
+    """Aplicação de src/main.py (create_app) sobre o banco db_path, sem as threads periódicas"""
+    return create_app({
+        'SECRET_KEY': 'benchmark',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'RETENTION_ARCHIVE_URI': f'sqlite:///{os.path.splitext(db_path)[0]}-archive.db',
+        # O limite por IP recusaria quase toda a carga vinda de 127.0.0.1
+        'RATE_LIMIT_ENABLED': False,
+        **config
+    })
+
+
+def percentile(ordered, fraction):
+    """Percentil por posição (nearest-rank) de uma lista já ordenada"""
+    if not ordered:
+        return None
+    index = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(samples, seconds):
+    """Vazão e latências (ms) de uma lista de (latência em segundos, status)"""
+    latencies = sorted(latency for latency, _ in samples)
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(count for status, count in statuses.items() if status == 'error' or int(status) >= 500)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'throughput_rps': round(len(samples) / seconds, 1) if seconds else None,
+        'latency_ms': {
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': ms(percentile(latencies, 0.50)),
+            'p95': ms(percentile(latencies, 0.95)),
+            'p99': ms(percentile(latencies, 0.99)),
+            'max': ms(latencies[-1]) if latencies else None
+        },
+        'status_codes': statuses
+    }
+
+
+class TestClientTarget:
+    """Envia requisições pelo test client do Flask, no próprio processo"""
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class HttpTarget:
+    """Envia requisições a um servidor HTTP, com conexão keep-alive por worker"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def request(self, method, path, body=None):
+        payload = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        try:
+            self.connection.request(method, self.prefix + path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            # Reabre a conexão na próxima requisição
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            return 'error'
+
+    def close(self):
+        self.connection.close()
+
+
+def drive(target, next_request, duration=None, requests=None, warmup=0):
+    """Executa requisições até acabar o tempo ou a quantidade; retorna ([(latência, status)], segundos medidos)"""
+    samples = []
+    measured_from = deadline = None
+    count = 0
+    while True:
+        if count == warmup and measured_from is None:
+            measured_from = time.perf_counter()
+            deadline = measured_from + duration if duration else None
+        if requests is not None and count >= requests + warmup:
+            break
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+
+        method, path, body = next_request()
+        started = time.perf_counter()
+        status = target.request(method, path, body)
+        elapsed = time.perf_counter() - started
+
+        if count >= warmup:
+            samples.append((elapsed, status))
+        count += 1
+    return samples, time.perf_counter() - measured_from
+
+
+def run_workers(worker, args_list, mode, combine=True):
+    """Executa worker(*args) em paralelo, em threads ou processos; retorna (amostras, segundos)
+
+    worker retorna o resultado de drive(); o tempo é o do worker mais lento, sem a inicialização.
+    Com combine=False retorna a lista de resultados de cada worker, na ordem de args_list.
+    """
+    if mode == 'process':
+        with multiprocessing.get_context().Pool(len(args_list)) as pool:
+            results = pool.starmap(worker, args_list)
+    else:
+        with ThreadPoolExecutor(len(args_list)) as executor:
+            results = list(executor.map(lambda args: worker(*args), args_list))
+    if not combine:
+        return results
+    return combine_results(results)
+
+
+def combine_results(results):
+    """Junta os resultados de drive() de vários workers em (amostras, segundos do mais lento)"""
+    samples = [item for batch, _ in results for item in batch]
+    return samples, max(seconds for _, seconds in results)
+
+
+def serve(db_path, host, port, config):
+    """Processo filho: servidor HTTP multithread (Werkzeug) sobre o banco db_path"""
+    import logging
+    from werkzeug.serving import make_server
+    # O log de cada requisição no stderr pesaria na medição
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = make_app(db_path, **config)
+    make_server(host, port, app, threaded=True).serve_forever()
+
+
+def start_server(db_path, host='127.0.0.1', port=5055, config=None):
+    """Inicia um servidor local em outro processo e espera ele aceitar conexões"""
+    process = multiprocessing.get_context().Process(target=serve, args=(db_path, host, port, config or {}), daemon=True)
+    process.start()
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request('GET', '/api/admin/stats')
+            connection.getresponse().read()
+            connection.close()
+            return process, f'http://{host}:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('Servidor de benchmark não iniciou')
+
+
+def environment():
+    """Dados do ambiente gravados junto com os resultados, para comparar execuções"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+
+def write_results(results, output=None):
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
@@ -0,0 +1,145 @@
+"""Popula um banco SQLite com keys e logs de acesso para os benchmarks
+
+Uso:
+    python benchmarks/seed.py /tmp/bench.db --keys 1000000 --logs 20000000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models.key import db, KeyAllocatorState
+from src.models.schema import upgrade_schema
+from src.services.key_allocator import key_allocator
+from src.services.stats import stats_counters
+
+CHUNK_SIZE = 50000
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def seed(db_path, keys, logs, used_fraction=0.5, expired_fraction=0.1, failed_fraction=0.1, days=60, seed_value=1):
+    """Cria o banco com keys alocadas pelo alocador real e logs em ordem cronológica"""
+    if os.path.exists(db_path):
+        raise FileExistsError(db_path)
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        # Só as tabelas: o índice FTS é criado depois, de uma vez, por upgrade_schema()
+        db.create_all()
+        # Segredo do alocador derivado da semente: as mesmas opções geram as mesmas keys
+        db.session.add(KeyAllocatorState(id=1, secret=f'{rng.getrandbits(256):064x}', next_index=0))
+        db.session.commit()
+        key_allocator.reset()
+        key_ids = key_allocator.allocate(keys)
+
+        connection = db.engine.raw_connection()
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute('PRAGMA journal_mode = MEMORY')
+
+        used = []
+        rows = []
+        for key_id in key_ids:
+            created_at = now - timedelta(days=days, seconds=rng.randrange(86400))
+            hwid = first_login_at = expires_at = None
+            is_used = rng.random() < used_fraction
+            expired = False
+            status = 'available'
+            if is_used:
+                hwid = f'HWID-{key_id}'
+                expired = rng.random() < expired_fraction
+                first_login_at = created_at + timedelta(seconds=rng.randrange(86400))
+                # Keys expiradas venceram no passado; as demais vencem em até 30 dias
+                expires_at = now - timedelta(days=1) if expired else now + timedelta(days=rng.randrange(1, 31))
+                status = 'expired' if expired else 'used'
+                used.append((key_id, hwid))
+            rows.append((key_id, hwid, 30, created_at.strftime(DATETIME_FORMAT),
+                         first_login_at.strftime(DATETIME_FORMAT) if first_login_at else None,
+                         expires_at.strftime(DATETIME_FORMAT) if expires_at else None,
+                         1, 0, int(is_used), int(expired), status))
+            if len(rows) >= CHUNK_SIZE:
+                _insert_keys(connection, rows)
+                rows = []
+        _insert_keys(connection, rows)
+
+        # Logs distribuídos em ordem cronológica nos últimos `days` dias, como numa base real
+        span = days * 86400
+        start = now - timedelta(days=days)
+        rows = []
+        for index in range(logs if used else 0):
+            key_id, hwid = used[rng.randrange(len(used))]
+            success = rng.random() >= failed_fraction
+            login_at = start + timedelta(seconds=span * index / logs)
+            rows.append((key_id, hwid if success else f'OTHER-{rng.randrange(1000)}',
+                         f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}',
+                         'bc-games-client/1.0', login_at.strftime(DATETIME_FORMAT), int(success),
+                         None if success else 'HWID não corresponde'))
+            if len(rows) >= CHUNK_SIZE:
+                _insert_logs(connection, rows)
+                rows = []
+        _insert_logs(connection, rows)
+        connection.close()
+
+        upgrade_schema()
+        stats_counters.reconcile()
+        db.session.remove()
+        db.engine.dispose()
+
+    return {
+        'db': db_path,
+        'keys': keys,
+        'used_keys': len(used),
+        'logs': logs if used else 0,
+        'seconds': round(time.perf_counter() - started, 1),
+        'size_mb': round(os.path.getsize(db_path) / 1024 / 1024, 1)
+    }
+
+
+def _insert_keys(connection, rows):
+    connection.executemany(
+        'INSERT INTO keys (key_id, hwid, expiration_days, created_at, first_login_at, expires_at, '
+        'is_active, is_paused, is_used, expired, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows
+    )
+    connection.commit()
+
+
+def _insert_logs(connection, rows):
+    connection.executemany(
+        'INSERT INTO access_logs (key_id, hwid, ip_address, user_agent, login_at, success, error_message) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)', rows
+    )
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db', help='Arquivo do banco a criar (não pode existir)')
+    parser.add_argument('--keys', type=int, default=100000)
+    parser.add_argument('--logs', type=int, default=1000000)
+    parser.add_argument('--used-fraction', type=float, default=0.5)
+    parser.add_argument('--expired-fraction', type=float, default=0.1, help='Fração das keys usadas que já expiraram')
+    parser.add_argument('--failed-fraction', type=float, default=0.1)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(json.dumps(seed(args.db, args.keys, args.logs, args.used_fraction, args.expired_fraction,
+                          args.failed_fraction, args.days, args.seed), indent=2))
+
+
+if __name__ == '__main__':
+    main()
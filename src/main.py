@@ -1,49 +1,157 @@
 import os
 import sys
+import threading
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
 from src.models.key import db
+from src.models.schema import upgrade_schema
 from src.routes.auth import auth_bp
 from src.routes.admin import admin_bp
+from src.services.log_writer import log_writer
+from src.services.stats import stats_counters
+from src.services.retention import retention_engine
+from src.services.expiry import expiry_sweeper
+from src.services.bulk_jobs import bulk_jobs
+from src.services.metrics import metrics
+from src.services.session_tokens import session_tokens
+from src.services.key_membership import key_membership
+from src.services.key_changes import key_changes
+from src.services.rate_limiter import rate_limiter
+from src.services.storage import storage
+from src.services.sharding import shards
+from src.services.event_bus import event_bus
+from src.services.analytics import analytics
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'bc_games_auth_secret_key_2024'
-
-# Habilitar CORS para todas as rotas
-CORS(app)
-
-# Registrar blueprints
-app.register_blueprint(auth_bp, url_prefix='/api')
-app.register_blueprint(admin_bp, url_prefix='/api/admin')
-
-# Configuração do banco de dados
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-
-# Criar tabelas
-with app.app_context():
-    db.create_all()
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-        return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
+DATABASE_DIR = os.path.join(os.path.dirname(__file__), 'database')
+
+_app_lock = threading.Lock()
+
+
+def create_app(config=None):
+    """Cria a aplicação; config (dict) sobrescreve os valores padrão antes de iniciar os serviços
+
+    As threads periódicas não são iniciadas aqui: veja start_background_services().
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.config['SECRET_KEY'] = 'bc_games_auth_secret_key_2024'
+
+    # Configuração do banco de dados
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(DATABASE_DIR, 'app.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['RETENTION_ARCHIVE_URI'] = f"sqlite:///{os.path.join(DATABASE_DIR, 'archive.db')}"
+    app.config.update(config or {})
+
+    # Habilitar CORS para todas as rotas
+    CORS(app)
+
+    # Registrar blueprints
+    app.register_blueprint(auth_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+
+    # Keys e logs divididos entre SHARD_COUNT bancos pelo key_id (registra os binds de cada shard)
+    shards.init_app(app)
+
+    db.init_app(app)
+
+    # WAL e pragmas em toda conexão, pool de leitura para as rotas read_only e escritor único
+    storage.init_app(app)
+
+    # Gravação dos logs de acesso em lote, numa thread de fundo
+    log_writer.init_app(app)
+
+    # Buckets de logins por minuto/hora/dia, atualizados junto com cada lote de logs
+    analytics.init_app(app)
+
+    # Eventos ao vivo para os dashboards (/api/admin/stream)
+    event_bus.init_app(app)
+
+    # Contadores de estatísticas com reconciliação periódica
+    stats_counters.init_app(app)
+
+    # Limite de requisições por IP, HWID e key nas rotas de autenticação
+    rate_limiter.init_app(app)
+
+    # Tokens de sessão assinados com a SECRET_KEY
+    session_tokens.init_app(app)
+
+    # Consolidação e arquivamento periódico dos logs de acesso
+    retention_engine.init_app(app)
+
+    # Atualização periódica do status das keys cujo prazo passou
+    expiry_sweeper.init_app(app)
+
+    # Operações em massa executadas em blocos numa thread de fundo
+    bulk_jobs.init_app(app)
+
+    # Latência, status HTTP e SQL por requisição em /metrics (formato Prometheus)
+    metrics.init_app(app)
+
+    # Criar tabelas e índices
+    with app.app_context():
+        upgrade_schema()
+
+    # Filtro em memória das keys existentes (rejeita keys inexistentes sem consultar o banco)
+    key_membership.init_app(app)
+
+    # Alterações de keys feitas por outros processos (invalidação do cache de cada worker)
+    key_changes.init_app(app)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        static_folder_path = app.static_folder
+        if static_folder_path is None:
+            return "Static folder not configured", 404
+
+        if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
+            return send_from_directory(static_folder_path, path)
         else:
-            return "index.html not found", 404
+            index_path = os.path.join(static_folder_path, 'index.html')
+            if os.path.exists(index_path):
+                return send_from_directory(static_folder_path, 'index.html')
+            else:
+                return "index.html not found", 404
+
+    return app
+
+
+def start_background_services():
+    """Threads periódicas de retenção de logs, de expiração das keys e de reconciliação dos
+    contadores (uma cópia basta por banco)"""
+    retention_engine.start()
+    expiry_sweeper.start()
+    stats_counters.start()
+
+
+def stop_background_services():
+    """Encerra os streams abertos, para as threads de fundo do processo e grava os logs ainda na fila"""
+    event_bus.close()
+    retention_engine.stop()
+    expiry_sweeper.stop()
+    stats_counters.stop()
+    key_changes.stop()
+    log_writer.stop()
+
+
+def __getattr__(name):
+    """src.main:app (gunicorn, waitress, ...): cria a aplicação padrão no primeiro acesso
+
+    Sem as threads periódicas: inicie-as com start_background_services() em um único processo.
+    """
+    global app
+    if name != 'app':
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    with _app_lock:
+        if 'app' not in globals():
+            app = create_app()
+    return app
+
 
 if __name__ == '__main__':
+    # Servidor de desenvolvimento; em produção use src/server.py
+    app = create_app()
+    start_background_services()
     app.run(host='0.0.0.0', port=5000, debug=True)
-
@@ -1,12 +1,45 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta
-import random
-import string
+from sqlalchemy import case, event, literal
+from sqlalchemy.orm import Session
+from src.services.key_cache import key_cache
+from src.services.storage import RoutingSession
+from src.services.sharding import shards
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Códigos de status gravados na coluna keys.status, na ordem de precedência, e seus rótulos
+STATUS_LABELS = {
+    'inactive': 'Inativa',
+    'paused': 'Pausada',
+    'expired': 'Expirada',
+    'used': 'Em uso',
+    'available': 'Disponível'
+}
+
+
+def key_status(is_active, is_paused, expired, is_used):
+    """Código de status a partir das colunas, na mesma precedência de Key.status_expression"""
+    if not is_active:
+        return 'inactive'
+    if is_paused:
+        return 'paused'
+    if expired:
+        return 'expired'
+    if is_used:
+        return 'used'
+    return 'available'
 
 class Key(db.Model):
     __tablename__ = 'keys'
+    __table_args__ = (
+        # Paginação por cursor em (created_at, id)
+        db.Index('ix_keys_created_at_id', 'created_at', 'id'),
+        # Filtros e contagens por status
+        db.Index('ix_keys_status_created_at', 'status', 'created_at'),
+        # Varredura de expiração: keys ainda não marcadas cujo expires_at já passou
+        db.Index('ix_keys_expired_expires_at', 'expired', 'expires_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     key_id = db.Column(db.String(8), unique=True, nullable=False, index=True)
@@ -18,6 +51,9 @@ class Key(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     is_paused = db.Column(db.Boolean, default=False)
     is_used = db.Column(db.Boolean, default=False)
+    # Mantidos a cada escrita e pela varredura de expiração (services/expiry.py)
+    expired = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    status = db.Column(db.String(16), nullable=False, default='available', server_default='available')
     
     # Relacionamento com logs
     access_logs = db.relationship('AccessLog', backref='key_ref', lazy=True, cascade='all, delete-orphan')
@@ -28,25 +64,94 @@ class Key(db.Model):
     @staticmethod
     def generate_unique_key():
         """Gera uma key única de 8 dígitos"""
-        while True:
-            key = ''.join(random.choices(string.digits, k=8))
-            if not Key.query.filter_by(key_id=key).first():
-                return key
+        from src.services.key_allocator import key_allocator
+        return key_allocator.allocate(1)[0]
+    
+    @staticmethod
+    def get_cached(key_id):
+        """Retorna o estado da key pelo cache, consultando o banco apenas em caso de miss"""
+        snapshot = key_cache.get(key_id)
+        if snapshot is None:
+            generation = key_cache.generation()
+            with shards.for_key(key_id):
+                key = Key.query.filter_by(key_id=key_id).first()
+            if not key:
+                return None
+            snapshot = key.snapshot()
+            key_cache.set(key_id, snapshot, generation)
+        return snapshot
+    
+    @staticmethod
+    def get_cached_many(key_ids, chunk_size=500):
+        """Retorna {key_id: estado} pelo cache, com uma consulta IN (...) por shard e bloco de misses"""
+        found = {}
+        missing = []
+        for key_id in set(key_ids):
+            snapshot = key_cache.get(key_id)
+            if snapshot is None:
+                missing.append(key_id)
+            else:
+                found[key_id] = snapshot
+        
+        for index, key_ids in shards.group(missing).items():
+            with shards.scope(index):
+                for start in range(0, len(key_ids), chunk_size):
+                    generation = key_cache.generation()
+                    for key in Key.query.filter(Key.key_id.in_(key_ids[start:start + chunk_size])):
+                        snapshot = key.snapshot()
+                        key_cache.set(key.key_id, snapshot, generation)
+                        found[key.key_id] = snapshot
+        
+        return found
+    
+    def snapshot(self):
+        """Cria uma cópia imutável do estado da key, desacoplada da sessão"""
+        return KeySnapshot(**{column: getattr(self, column) for column in KeySnapshot.__slots__})
     
     def is_expired(self):
-        """Verifica se a key está expirada"""
+        """Verifica se a key está expirada (no instante atual, sem esperar a varredura)"""
         if not self.expires_at:
             return False
         return datetime.utcnow() > self.expires_at
     
-    def activate_key(self, hwid):
+    def compute_status(self, expired=None):
+        """Código de status a partir das colunas (expired: sobrescreve a coluna expired)"""
+        return key_status(self.is_active, self.is_paused, self.expired if expired is None else expired, self.is_used)
+    
+    def refresh_status(self, now=None):
+        """Atualiza expired e status antes de gravar a key"""
+        now = now or datetime.utcnow()
+        self.expired = self.expires_at is not None and self.expires_at < now
+        self.status = self.compute_status()
+    
+    @staticmethod
+    def status_expression(**values):
+        """Expressão SQL do status; values substitui colunas pelos novos valores de um UPDATE em massa"""
+        def column(name):
+            value = values.get(name, getattr(Key, name))
+            return literal(value) if isinstance(value, bool) else value
+        
+        return case(
+            (column('is_active') == False, 'inactive'),
+            (column('is_paused') == True, 'paused'),
+            (column('expired') == True, 'expired'),
+            (column('is_used') == True, 'used'),
+            else_='available'
+        )
+    
+    def activate_key(self, hwid, commit=True):
         """Ativa a key no primeiro login"""
         if not self.first_login_at:
             self.first_login_at = datetime.utcnow()
             self.expires_at = self.first_login_at + timedelta(days=self.expiration_days)
             self.hwid = hwid
             self.is_used = True
-            db.session.commit()
+            if commit:
+                from src.services.key_changes import key_changes
+                # A linha do diário vai na mesma transação da ativação
+                rows = key_changes.stage('activate', [self.key_id], shard=shards.index_for(self.key_id))
+                db.session.commit()
+                key_changes.apply(rows)
     
     def can_login(self, hwid):
         """Verifica se pode fazer login com esta key"""
@@ -67,7 +172,10 @@ class Key(db.Model):
         self.is_used = False
         self.first_login_at = None
         self.expires_at = None
+        from src.services.key_changes import key_changes
+        rows = key_changes.stage('reset_hwid', [self.key_id], shard=shards.index_for(self.key_id))
         db.session.commit()
+        key_changes.apply(rows)
     
     def to_dict(self):
         return {
@@ -86,20 +194,54 @@ class Key(db.Model):
         }
     
     def get_status(self):
-        """Retorna o status atual da key"""
-        if not self.is_active:
-            return "Inativa"
-        if self.is_paused:
-            return "Pausada"
-        if self.is_expired():
-            return "Expirada"
-        if self.is_used:
-            return "Em uso"
-        return "Disponível"
+        """Retorna o status atual da key, com o prazo conferido agora: as colunas expired/status, que
+        servem aos filtros e índices, ficam até uma varredura atrasadas"""
+        return STATUS_LABELS[self.compute_status(expired=self.is_expired())]
+
+
+class KeySnapshot:
+    """Estado de uma key guardado no cache, com as mesmas regras de Key"""
+    
+    __slots__ = ('id', 'key_id', 'hwid', 'expiration_days', 'created_at', 'first_login_at',
+                 'expires_at', 'is_active', 'is_paused', 'is_used', 'expired', 'status')
+    
+    def __init__(self, **columns):
+        for column in self.__slots__:
+            setattr(self, column, columns.get(column))
+    
+    def __repr__(self):
+        return f'<KeySnapshot {self.key_id}>'
+    
+    is_expired = Key.is_expired
+    compute_status = Key.compute_status
+    refresh_status = Key.refresh_status
+    can_login = Key.can_login
+    to_dict = Key.to_dict
+    get_status = Key.get_status
+
+
+def _refresh_key_status(session, flush_context, instances):
+    """Recalcula expired/status das keys criadas ou alteradas pelo ORM"""
+    now = datetime.utcnow()
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Key):
+            obj.refresh_status(now)
+
+
+# Registrado antes do listener de estatísticas, que lê os valores já recalculados
+event.listen(Session, 'before_flush', _refresh_key_status)
 
 
 class AccessLog(db.Model):
     __tablename__ = 'access_logs'
+    __table_args__ = (
+        # Paginação por cursor em (login_at, id)
+        db.Index('ix_access_logs_login_at_id', 'login_at', 'id'),
+        # Buscas por key (incluindo os logs recentes de get_key), HWID e IP
+        db.Index('ix_access_logs_key_id_login_at', 'key_id', 'login_at'),
+        db.Index('ix_access_logs_hwid', 'hwid'),
+        db.Index('ix_access_logs_ip_address', 'ip_address'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     key_id = db.Column(db.String(8), db.ForeignKey('keys.key_id'), nullable=False)
@@ -125,3 +267,143 @@ class AccessLog(db.Model):
             'error_message': self.error_message
         }
 
+
+
+class KeyAllocatorState(db.Model):
+    __tablename__ = 'key_allocator'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    secret = db.Column(db.String(64), nullable=False)
+    next_index = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<KeyAllocatorState {self.next_index}>'
+
+
+class StatsCounter(db.Model):
+    __tablename__ = 'stats_counters'
+    
+    name = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StatsCounter {self.name}={self.value}>'
+
+
+class AccessLogRollup(db.Model):
+    __tablename__ = 'access_log_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('period', 'bucket_start', 'key_id', name='uq_access_log_rollups_bucket'),
+        db.Index('ix_access_log_rollups_key_id', 'key_id', 'period', 'bucket_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(8), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    key_id = db.Column(db.String(8), nullable=False)
+    success_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+    distinct_hwids = db.Column(db.Integer, nullable=False, default=0)
+    distinct_ips = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<AccessLogRollup {self.period} {self.bucket_start} {self.key_id}>'
+    
+    def to_dict(self):
+        return {
+            'period': self.period,
+            'bucket_start': self.bucket_start.isoformat() if self.bucket_start else None,
+            'key_id': self.key_id,
+            'success_count': self.success_count,
+            'failed_count': self.failed_count,
+            'distinct_hwids': self.distinct_hwids,
+            'distinct_ips': self.distinct_ips
+        }
+
+
+class AnalyticsBucket(db.Model):
+    __tablename__ = 'analytics_buckets'
+    __table_args__ = (
+        # key_id '' guarda o total de todas as keys
+        db.UniqueConstraint('period', 'key_id', 'bucket_start', name='uq_analytics_buckets_bucket'),
+        # Ranking de keys num intervalo
+        db.Index('ix_analytics_buckets_period_start', 'period', 'bucket_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(8), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    key_id = db.Column(db.String(8), nullable=False, default='')
+    success_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+    # Falhas por error_message
+    failures = db.Column(db.JSON, nullable=True)
+    # Registradores HyperLogLog (services/analytics.py) dos HWIDs e IPs distintos, e as estimativas
+    # do bucket (somadas, limitam o ranking de keys sem ler os sketches)
+    hwid_sketch = db.Column(db.LargeBinary, nullable=False)
+    ip_sketch = db.Column(db.LargeBinary, nullable=False)
+    distinct_hwids = db.Column(db.Integer, nullable=False, default=0)
+    distinct_ips = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<AnalyticsBucket {self.period} {self.bucket_start} {self.key_id or "*"}>'
+
+
+class RetentionState(db.Model):
+    __tablename__ = 'retention_state'
+    
+    name = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<RetentionState {self.name}={self.value}>'
+
+
+class KeyChange(db.Model):
+    """Diário das alterações de keys, lido por todos os processos (services/key_changes.py)"""
+    __tablename__ = 'key_changes'
+    # AUTOINCREMENT: ids nunca reaproveitados, mesmo depois da limpeza das linhas antigas
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # None: todas as keys
+    key_id = db.Column(db.String(8), nullable=True)
+    action = db.Column(db.String(16), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<KeyChange {self.id} {self.action} {self.key_id or "*"}>'
+
+
+class BulkJob(db.Model):
+    __tablename__ = 'bulk_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    action = db.Column(db.String(16), nullable=False)
+    params = db.Column(db.JSON, nullable=True)
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    total = db.Column(db.Integer, nullable=True)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<BulkJob {self.id} {self.action} {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'action': self.action,
+            'params': self.params,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'progress': round(self.processed / self.total * 100, 2) if self.total else (100.0 if self.status == 'done' else 0.0),
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,85 @@
+from datetime import datetime
+from sqlalchemy.exc import OperationalError
+from src.models.key import db, Key
+from src.services.sharding import shards, SHARDED_TABLES
+
+# Índice trigram de key_id (FTS5), sincronizado com a tabela keys por triggers
+KEYS_FTS_DDL = (
+    "CREATE VIRTUAL TABLE keys_fts USING fts5(key_id, content='keys', content_rowid='id', tokenize='trigram')",
+    """CREATE TRIGGER IF NOT EXISTS keys_fts_insert AFTER INSERT ON keys BEGIN
+        INSERT INTO keys_fts(rowid, key_id) VALUES (new.id, new.key_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS keys_fts_delete AFTER DELETE ON keys BEGIN
+        INSERT INTO keys_fts(keys_fts, rowid, key_id) VALUES ('delete', old.id, old.key_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS keys_fts_update AFTER UPDATE OF key_id ON keys BEGIN
+        INSERT INTO keys_fts(keys_fts, rowid, key_id) VALUES ('delete', old.id, old.key_id);
+        INSERT INTO keys_fts(rowid, key_id) VALUES (new.id, new.key_id);
+    END""",
+    "INSERT INTO keys_fts(keys_fts) VALUES ('rebuild')",
+)
+
+
+def table_exists(name, shard=None):
+    return db.session.execute(
+        db.text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': name},
+        bind_arguments={'shard': shard}
+    ).first() is not None
+
+
+def column_exists(table, column, shard=None):
+    rows = db.session.execute(db.text(f"PRAGMA table_info({table})"), bind_arguments={'shard': shard}).all()
+    return any(row[1] == column for row in rows)
+
+
+def add_key_status_columns(shard=None):
+    """Adiciona expired/status à tabela keys e preenche a partir das colunas existentes"""
+    if column_exists('keys', 'status', shard):
+        return
+
+    bind_arguments = {'shard': shard}
+    db.session.execute(db.text("ALTER TABLE keys ADD COLUMN expired BOOLEAN NOT NULL DEFAULT 0"),
+                       bind_arguments=bind_arguments)
+    db.session.execute(db.text("ALTER TABLE keys ADD COLUMN status VARCHAR(16) NOT NULL DEFAULT 'available'"),
+                       bind_arguments=bind_arguments)
+
+    expired = Key.expires_at.isnot(None) & (Key.expires_at < datetime.utcnow())
+    db.session.execute(Key.__table__.update().values(
+        expired=expired,
+        status=Key.status_expression(expired=expired)
+    ), bind_arguments=bind_arguments)
+    db.session.commit()
+
+
+def upgrade_schema():
+    """Cria tabelas, colunas e índices que faltam em bancos criados por versões anteriores
+
+    O shard 0 (banco principal) tem todas as tabelas; os demais, só as divididas por key_id.
+    """
+    db.create_all()
+    sharded = [table for table in db.metadata.sorted_tables if table.name in SHARDED_TABLES]
+    for index in shards.indexes():
+        if index > 0:
+            db.metadata.create_all(shards.engine(index), tables=sharded)
+        upgrade_shard(index if shards.count > 1 else None)
+
+
+def upgrade_shard(shard=None):
+    engine = db.engine if shard is None else shards.engine(shard)
+    add_key_status_columns(shard)
+
+    # create_all só cria índices junto com tabelas novas
+    for table in db.metadata.sorted_tables:
+        if shard and table.name not in SHARDED_TABLES:
+            continue
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+    if not table_exists('keys_fts', shard):
+        try:
+            for statement in KEYS_FTS_DDL:
+                db.session.execute(db.text(statement), bind_arguments={'shard': shard})
+            db.session.commit()
+        except OperationalError:
+            # SQLite sem FTS5/trigram: a busca usa LIKE
+            db.session.rollback()
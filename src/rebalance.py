@@ -0,0 +1,150 @@
+"""Redistribui keys e logs de acesso entre os shards ao aumentar SHARD_COUNT (com a aplicação parada)
+
+Uso:
+    python src/rebalance.py --shards 4
+    python src/rebalance.py --from 2 --shards 4 --config producao.py
+    python src/rebalance.py --shards 4 --dry-run
+
+Cada key que pelo novo número de shards pertence a outro arquivo é copiada para ele junto com seus
+logs de acesso, agregados (access_log_rollups) e buckets de analytics, e só então apagada da origem,
+em blocos de --batch-size keys. Os ids numéricos são gerados de novo no destino. Uma interrupção no
+meio é segura: ao executar de novo, as cópias incompletas no destino são substituídas. Os buckets
+de todas as keys ficam onde estão (as consultas somam os shards), os shards novos herdam o estado
+da retenção da origem e no fim os contadores são recalculados. Depois, configure SHARD_COUNT com o
+mesmo valor antes de subir a aplicação.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Config
+from src.main import create_app
+from src.models.key import db, Key, AccessLog, AccessLogRollup, AnalyticsBucket, RetentionState
+from src.services.sharding import shards
+from src.services.stats import stats_counters
+
+logger = logging.getLogger('bc_games.rebalance')
+
+# Linhas que acompanham a key (por key_id); logs já arquivados só existem nos agregados e buckets
+DEPENDENT_TABLES = (AccessLog.__table__, AccessLogRollup.__table__, AnalyticsBucket.__table__)
+
+
+def _without_id(table, rows):
+    columns = [column.name for column in table.columns if column.name != 'id']
+    return [{name: row._mapping[name] for name in columns} for row in rows]
+
+
+def _delete_keys(connection, key_ids):
+    """Apaga as keys e tudo o que pertence a elas num shard"""
+    for table in DEPENDENT_TABLES:
+        connection.execute(table.delete().where(table.c.key_id.in_(key_ids)))
+    connection.execute(Key.__table__.delete().where(Key.__table__.c.key_id.in_(key_ids)))
+
+
+def move_keys(source, target, key_ids):
+    """Copia as keys (e seus logs, agregados e buckets) do shard source para target e as apaga da origem
+
+    São dois arquivos, então não há uma transação única: primeiro a cópia é confirmada, depois a
+    origem é apagada. Se o processo parar entre as duas, a próxima execução refaz a cópia.
+    """
+    keys = Key.__table__
+    with shards.engine(source).connect() as connection:
+        rows = {table: connection.execute(table.select().where(table.c.key_id.in_(key_ids))).all()
+                for table in (keys,) + DEPENDENT_TABLES}
+
+    with shards.engine(target).begin() as connection:
+        _delete_keys(connection, key_ids)
+        for table, table_rows in rows.items():
+            if table_rows:
+                connection.execute(table.insert(), _without_id(table, table_rows))
+
+    with shards.engine(source).begin() as connection:
+        _delete_keys(connection, key_ids)
+
+    return len(rows[AccessLog.__table__])
+
+
+def copy_retention_state(source, target):
+    """Shard novo começa com o ponto da retenção da origem (os agregados já consolidados vêm junto)"""
+    state = RetentionState.__table__
+    with shards.engine(source).connect() as connection:
+        rows = connection.execute(state.select()).all()
+    with shards.engine(target).begin() as connection:
+        existing = set(connection.execute(db.select(state.c.name)).scalars())
+        missing = [dict(row._mapping) for row in rows if row.name not in existing]
+        if missing:
+            connection.execute(state.insert(), missing)
+
+
+def rebalance(previous, batch_size=1000, dry_run=False):
+    """Move para o shard certo as keys dos shards 0..previous-1; retorna as contagens por destino"""
+    keys = Key.__table__
+    moved = {'keys': 0, 'logs': 0, 'by_shard': {index: 0 for index in shards.indexes()}}
+
+    for source in range(previous):
+        last_id = 0
+        while True:
+            with shards.engine(source).connect() as connection:
+                batch = connection.execute(
+                    db.select(keys.c.id, keys.c.key_id).where(keys.c.id > last_id).order_by(keys.c.id).limit(batch_size)
+                ).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            for target, key_ids in shards.group(row.key_id for row in batch).items():
+                if target == source:
+                    continue
+                moved['keys'] += len(key_ids)
+                moved['by_shard'][target] += len(key_ids)
+                if not dry_run:
+                    moved['logs'] += move_keys(source, target, key_ids)
+
+        logger.info('shard %d: %d key(s) movida(s) até agora', source, moved['keys'])
+
+    if not dry_run:
+        for target in range(previous, shards.count):
+            copy_retention_state(0, target)
+
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, required=True, help='Novo SHARD_COUNT')
+    parser.add_argument('--from', dest='previous', type=int, default=1, help='SHARD_COUNT atual (padrão: 1)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Keys lidas por vez de cada shard')
+    parser.add_argument('--dry-run', action='store_true', help='Só conta as keys que mudariam de shard')
+    parser.add_argument('--config', help='Arquivo Python com a configuração da aplicação (SQLALCHEMY_DATABASE_URI, ...)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
+
+    if args.previous < 1 or args.shards <= args.previous:
+        parser.error('--shards deve ser maior que --from (reduzir o número de shards não é suportado)')
+
+    config = Config(os.getcwd())
+    if args.config:
+        config.from_pyfile(os.path.abspath(args.config))
+    config['SHARD_COUNT'] = args.shards
+    app = create_app(config)
+
+    with app.app_context():
+        started = time.perf_counter()
+        moved = rebalance(args.previous, args.batch_size, args.dry_run)
+        if not args.dry_run:
+            counters = stats_counters.reconcile()
+            logger.info('contadores: %d key(s), %d login(s)', counters['keys_total'], counters['logins_total'])
+
+    logger.info('%s %d key(s) e %d log(s) em %.1fs; por shard de destino: %s',
+                'Seriam movidas' if args.dry_run else 'Movidas', moved['keys'], moved['logs'],
+                time.perf_counter() - started, moved['by_shard'])
+
+
+if __name__ == '__main__':
+    main()
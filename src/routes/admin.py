@@ -1,10 +1,167 @@
-from flask import Blueprint, request, jsonify
-from src.models.key import db, Key, AccessLog
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from src.models.key import db, Key, AccessLog, AccessLogRollup, AnalyticsBucket, RetentionState, BulkJob
+from src.services.key_cache import key_cache
+from src.services.key_changes import key_changes
+from src.services.key_membership import key_membership
+from src.services.log_writer import log_writer
+from src.services.rate_limiter import rate_limiter
+from src.services.storage import storage, read_only
+from src.services.sharding import shards
+from src.services.key_minting import mint_keys, MAX_BULK_QUANTITY
+from src.services.stats import stats_counters, stats_summary
+from src.services.event_bus import event_bus, HEARTBEAT, encode_event
+from src.services.bulk_jobs import bulk_jobs, ACTIONS as BULK_ACTIONS, MAX_JOB_KEY_IDS
+from src.services.pagination import keyset_page_shards, paginate_shards, count_shards, InvalidCursor
+from src.services.serialization import KEY_COLUMNS, LOG_COLUMNS, key_dicts, log_dicts, json_response
+from src.services.key_search import key_search_filter, log_key_filter
+from src.services.retention import retention_engine, PERIODS
+from src.services.analytics import (analytics, PERIODS as ANALYTICS_PERIODS, KEY_PERIODS, RANKINGS,
+                                    DEFAULT_RANGES)
+from src.services.export import (FORMATS, KEY_FIELDS, LOG_FIELDS, key_rows, log_rows, shard_batches, encode_batches,
+                                 gzip_chunks)
 from datetime import datetime
-from sqlalchemy import desc
+import json
+import time
+from sqlalchemy import desc, true
 
 admin_bp = Blueprint('admin', __name__)
 
+
+def parse_datetime_arg(name):
+    """Lê um parâmetro de data ISO 8601 da query string"""
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Parâmetro {name} deve ser uma data ISO 8601')
+
+
+def keyset_response(query, timestamp_column, id_column, items_name, per_page, estimated_total=None, extra=None,
+                    columns=None, serialize=None):
+    """Resposta paginada por cursor (?after=), com total opcional (?count=exact|estimate)
+
+    Com columns e serialize, a página é lida como tuplas dessas colunas e convertida por serialize(rows).
+    Com vários shards, a página e o total juntam os de todos eles.
+    """
+    count_mode = request.args.get('count', '').strip()
+    
+    total = None
+    if count_mode == 'exact':
+        total = count_shards(query)
+    elif count_mode == 'estimate':
+        total = estimated_total
+    
+    if columns is not None:
+        query = query.with_entities(*columns)
+    
+    items, next_cursor, has_next = keyset_page_shards(
+        query, timestamp_column, id_column, request.args.get('after', '').strip(), per_page
+    )
+    
+    return json_response({
+        'success': True,
+        items_name: serialize(items) if serialize else [item.to_dict() for item in items],
+        'pagination': {
+            'per_page': per_page,
+            'next_cursor': next_cursor,
+            'has_next': has_next,
+            'total': total
+        },
+        **(extra or {})
+    }), 200
+
+
+def filtered_keys_query(filters=None):
+    """Consulta de keys com os filtros da query string ou de um dicionário (search, match, status)"""
+    filters = request.args if filters is None else filters
+    search = str(filters.get('search') or '').strip()
+    match = str(filters.get('match') or '').strip()
+    status_filter = str(filters.get('status') or '').strip()
+    
+    query = Key.query
+    
+    # Filtro de busca por key_id
+    if search:
+        query = query.filter(key_search_filter(search, match))
+    
+    # Filtro por status
+    if status_filter:
+        if status_filter in ('expired', 'available'):
+            # Coluna status indexada, mantida pelas escritas e pela varredura de expiração
+            query = query.filter(Key.status == status_filter)
+        elif status_filter == 'active':
+            query = query.filter(Key.is_active == True, Key.is_paused == False)
+        elif status_filter == 'paused':
+            query = query.filter(Key.is_paused == True)
+        elif status_filter == 'inactive':
+            query = query.filter(Key.is_active == False)
+        elif status_filter == 'used':
+            query = query.filter(Key.is_used == True)
+        elif status_filter == 'unused':
+            query = query.filter(Key.is_used == False)
+    
+    return query, bool(search or status_filter)
+
+
+def filtered_logs_query():
+    """Consulta de logs com os filtros da query string (key_id, match, hwid, ip, success_only, since, until)"""
+    key_id = request.args.get('key_id', '').strip()
+    match = request.args.get('match', '').strip()
+    hwid = request.args.get('hwid', '').strip()
+    ip_address = request.args.get('ip', '').strip()
+    success_only = request.args.get('success_only', '').lower() == 'true'
+    since = parse_datetime_arg('since')
+    until = parse_datetime_arg('until')
+    
+    query = AccessLog.query
+    
+    # Filtro por período
+    if since:
+        query = query.filter(AccessLog.login_at >= since)
+    if until:
+        query = query.filter(AccessLog.login_at < until)
+    
+    # Filtro por key_id
+    if key_id:
+        query = query.filter(log_key_filter(key_id, match))
+    
+    # Filtros exatos por HWID e IP
+    if hwid:
+        query = query.filter(AccessLog.hwid == hwid)
+    if ip_address:
+        query = query.filter(AccessLog.ip_address == ip_address)
+    
+    # Filtro por sucesso
+    if success_only:
+        query = query.filter(AccessLog.success == True)
+    
+    return query, bool(key_id or hwid or ip_address or success_only)
+
+
+def export_response(batches, fields, name):
+    """Resposta em streaming (CSV ou NDJSON, gzip opcional) a partir de blocos de linhas"""
+    output_format = request.args.get('format', 'csv').strip()
+    compress = request.args.get('gzip', '').lower() == 'true'
+    
+    if output_format not in FORMATS:
+        return jsonify({'success': False, 'error': 'Formato deve ser csv ou ndjson'}), 400
+    
+    chunks = encode_batches(batches, fields, output_format)
+    filename = f'{name}.{output_format}'
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+
+
 @admin_bp.route('/keys', methods=['POST'])
 def create_keys():
     """Criar novas keys"""
@@ -23,18 +180,8 @@ def create_keys():
         if not isinstance(expiration_days, int) or expiration_days < 1 or expiration_days > 365:
             return jsonify({'success': False, 'error': 'Dias de expiração deve ser entre 1 e 365'}), 400
         
-        created_keys = []
-        
-        for _ in range(quantity):
-            key_id = Key.generate_unique_key()
-            new_key = Key(
-                key_id=key_id,
-                expiration_days=expiration_days
-            )
-            db.session.add(new_key)
-            created_keys.append(key_id)
-        
-        db.session.commit()
+        created_keys = mint_keys(quantity, expiration_days)
+        event_bus.publish('keys', {'action': 'create', 'count': len(created_keys)})
         
         return jsonify({
             'success': True,
@@ -48,50 +195,86 @@ def create_keys():
         return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
 
 
+@admin_bp.route('/keys/bulk', methods=['POST'])
+def create_keys_bulk():
+    """Criar keys em lote, retornando-as em streaming (CSV ou NDJSON)"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'success': False, 'error': 'Dados não fornecidos'}), 400
+        
+        quantity = data.get('quantity', 1)
+        expiration_days = data.get('expiration_days', 30)
+        output_format = data.get('format', 'csv')
+        
+        if not isinstance(quantity, int) or quantity < 1 or quantity > MAX_BULK_QUANTITY:
+            return jsonify({'success': False, 'error': f'Quantidade deve ser entre 1 e {MAX_BULK_QUANTITY}'}), 400
+        
+        if not isinstance(expiration_days, int) or expiration_days < 1 or expiration_days > 365:
+            return jsonify({'success': False, 'error': 'Dias de expiração deve ser entre 1 e 365'}), 400
+        
+        if output_format not in ('csv', 'ndjson'):
+            return jsonify({'success': False, 'error': 'Formato deve ser csv ou ndjson'}), 400
+        
+        key_ids = mint_keys(quantity, expiration_days)
+        event_bus.publish('keys', {'action': 'create', 'count': len(key_ids)})
+        
+        def generate():
+            # Blocos de linhas para não montar a resposta inteira em memória
+            if output_format == 'csv':
+                yield 'key_id,expiration_days\n'
+            for start in range(0, len(key_ids), 1000):
+                if output_format == 'csv':
+                    yield ''.join(f'{key_id},{expiration_days}\n' for key_id in key_ids[start:start + 1000])
+                else:
+                    yield ''.join(
+                        json.dumps({'key_id': key_id, 'expiration_days': expiration_days}) + '\n'
+                        for key_id in key_ids[start:start + 1000]
+                    )
+        
+        mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+        return Response(generate(), status=201, mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename=keys.{output_format}',
+            'X-Keys-Created': str(len(key_ids))
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
 @admin_bp.route('/keys', methods=['GET'])
+@read_only
 def list_keys():
     """Listar todas as keys com paginação"""
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
-        search = request.args.get('search', '').strip()
-        status_filter = request.args.get('status', '').strip()
         
         if per_page > 100:
             per_page = 100
         
-        query = Key.query
-        
-        # Filtro de busca por key_id
-        if search:
-            query = query.filter(Key.key_id.like(f'%{search}%'))
-        
-        # Filtro por status
-        if status_filter:
-            if status_filter == 'active':
-                query = query.filter(Key.is_active == True, Key.is_paused == False)
-            elif status_filter == 'paused':
-                query = query.filter(Key.is_paused == True)
-            elif status_filter == 'inactive':
-                query = query.filter(Key.is_active == False)
-            elif status_filter == 'used':
-                query = query.filter(Key.is_used == True)
-            elif status_filter == 'unused':
-                query = query.filter(Key.is_used == False)
-        
-        # Ordenar por data de criação (mais recentes primeiro)
-        query = query.order_by(desc(Key.created_at))
-        
-        # Paginação
-        pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
+        query, filtered = filtered_keys_query()
+        
+        # Paginação por cursor, sem OFFSET e sem COUNT obrigatório
+        if 'after' in request.args:
+            estimated_total = None if filtered else stats_counters.snapshot()['keys_total']
+            return keyset_response(query, Key.created_at, Key.id, 'keys', per_page, estimated_total,
+                                   columns=KEY_COLUMNS, serialize=key_dicts)
+        
+        # Ordenar por data de criação (mais recentes primeiro), lendo só as colunas serializadas
+        # (sem objetos do ORM); com vários shards, as páginas de cada um são intercaladas
+        pagination = paginate_shards(
+            query.with_entities(*KEY_COLUMNS),
+            [(Key.created_at, True), (Key.id, True)],
+            page,
+            per_page
         )
         
-        keys = [key.to_dict() for key in pagination.items]
+        keys = key_dicts(pagination.items)
         
-        return jsonify({
+        return json_response({
             'success': True,
             'keys': keys,
             'pagination': {
@@ -104,6 +287,19 @@ def list_keys():
             }
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/keys/export', methods=['GET'])
+def export_keys():
+    """Exportar keys em streaming, com os mesmos filtros da listagem"""
+    try:
+        query, _ = filtered_keys_query()
+        return export_response(shard_batches(key_rows, query), KEY_FIELDS, 'keys')
+        
     except Exception as e:
         return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
 
@@ -115,18 +311,20 @@ def get_key(key_id):
         if len(key_id) != 8 or not key_id.isdigit():
             return jsonify({'success': False, 'error': 'Key deve ter exatamente 8 dígitos'}), 400
         
-        key = Key.query.filter_by(key_id=key_id).first()
-        
-        if not key:
-            return jsonify({'success': False, 'error': 'Key não encontrada'}), 404
-        
-        # Buscar logs da key
-        logs = AccessLog.query.filter_by(key_id=key_id).order_by(desc(AccessLog.login_at)).limit(10).all()
-        
-        return jsonify({
+        # A key e os seus logs ficam no mesmo shard
+        with shards.for_key(key_id):
+            key = Key.query.filter_by(key_id=key_id).with_entities(*KEY_COLUMNS).first()
+            
+            if not key:
+                return jsonify({'success': False, 'error': 'Key não encontrada'}), 404
+            
+            # Buscar logs da key
+            logs = AccessLog.query.filter_by(key_id=key_id).order_by(desc(AccessLog.login_at)).with_entities(*LOG_COLUMNS).limit(10).all()
+        
+        return json_response({
             'success': True,
-            'key': key.to_dict(),
-            'recent_logs': [log.to_dict() for log in logs]
+            'key': key_dicts([key])[0],
+            'recent_logs': log_dicts(logs)
         }), 200
         
     except Exception as e:
@@ -140,13 +338,17 @@ def delete_key(key_id):
         if len(key_id) != 8 or not key_id.isdigit():
             return jsonify({'success': False, 'error': 'Key deve ter exatamente 8 dígitos'}), 400
         
-        key = Key.query.filter_by(key_id=key_id).first()
-        
-        if not key:
-            return jsonify({'success': False, 'error': 'Key não encontrada'}), 404
-        
-        db.session.delete(key)
-        db.session.commit()
+        with shards.for_key(key_id):
+            key = Key.query.filter_by(key_id=key_id).first()
+            
+            if not key:
+                return jsonify({'success': False, 'error': 'Key não encontrada'}), 404
+            
+            db.session.delete(key)
+            rows = key_changes.stage('delete', [key_id], shard=shards.current())
+            db.session.commit()
+        key_changes.apply(rows)
+        event_bus.publish('keys', {'action': 'delete', 'key_id': key_id})
         
         return jsonify({
             'success': True,
@@ -163,7 +365,7 @@ def delete_all_keys():
     """Apagar todas as keys"""
     try:
         # Contar quantas keys serão apagadas
-        count = Key.query.count()
+        count = count_shards(Key.query)
         
         if count == 0:
             return jsonify({
@@ -171,9 +373,23 @@ def delete_all_keys():
                 'message': 'Nenhuma key encontrada para apagar'
             }), 200
         
-        # Apagar todas as keys (logs serão apagados automaticamente devido ao cascade)
-        Key.query.delete()
-        db.session.commit()
+        # DELETE em massa não passa pelo cascade do ORM: os logs são apagados explicitamente,
+        # shard a shard, cada um com o seu commit e a sua linha no diário
+        rows = []
+        for index in shards.indexes():
+            with shards.scope(index):
+                AccessLog.query.delete()
+                Key.query.delete()
+                # Agregados e buckets resumem os logs apagados; sem o estado, a retenção recomeça do zero
+                AccessLogRollup.query.delete()
+                AnalyticsBucket.query.delete()
+                RetentionState.query.delete()
+                rows.extend(key_changes.stage('delete_all', shard=index))
+                db.session.commit()
+            retention_engine.clear_archive(index)
+        key_changes.apply(rows)
+        stats_counters.reconcile()
+        event_bus.publish('keys', {'action': 'delete_all', 'count': count})
         
         return jsonify({
             'success': True,
@@ -192,17 +408,21 @@ def reset_key_hwid(key_id):
         if len(key_id) != 8 or not key_id.isdigit():
             return jsonify({'success': False, 'error': 'Key deve ter exatamente 8 dígitos'}), 400
         
-        key = Key.query.filter_by(key_id=key_id).first()
+        with shards.for_key(key_id):
+            key = Key.query.filter_by(key_id=key_id).first()
+            
+            if not key:
+                return jsonify({'success': False, 'error': 'Key não encontrada'}), 404
+            
+            key.reset_hwid()
+            key_info = key.to_dict()
         
-        if not key:
-            return jsonify({'success': False, 'error': 'Key não encontrada'}), 404
-        
-        key.reset_hwid()
+        event_bus.publish('keys', {'action': 'reset_hwid', 'key_id': key_id})
         
         return jsonify({
             'success': True,
             'message': f'HWID da key {key_id} resetado com sucesso',
-            'key': key.to_dict()
+            'key': key_info
         }), 200
         
     except Exception as e:
@@ -212,20 +432,40 @@ def reset_key_hwid(key_id):
 
 @admin_bp.route('/keys/pause-all', methods=['POST'])
 def pause_all_keys():
-    """Pausar todas as keys"""
+    """Pausar todas as keys (?async=1: em segundo plano, acompanhando por /api/admin/jobs/{id})"""
     try:
         data = request.get_json() or {}
         pause = data.get('pause', True)
-        
-        # Atualizar todas as keys
-        count = Key.query.filter(Key.is_active == True).update({'is_paused': pause})
-        db.session.commit()
+        run_async = request.args.get('async', '').lower() in ('1', 'true')
+        # Bases grandes sempre em segundo plano: a requisição não espera o job inteiro
+        if not run_async and stats_counters.snapshot()['keys_total'] > bulk_jobs.sync_max_keys:
+            run_async = True
+        
+        # Atualiza em blocos, sem segurar o lock de escrita durante toda a operação
+        job = bulk_jobs.submit(
+            'pause' if pause else 'unpause',
+            criterion=Key.is_active == True,
+            description={'filters': {'is_active': True}},
+            all_keys=True,
+            wait=not run_async
+        )
         
         action = "pausadas" if pause else "despausadas"
         
+        if run_async:
+            return jsonify({
+                'success': True,
+                'message': f'Keys sendo {action} em segundo plano',
+                'job': job.to_dict()
+            }), 202
+        
+        if job.status == 'failed':
+            return jsonify({'success': False, 'error': f'Erro interno: {job.error}', 'job': job.to_dict()}), 500
+        
         return jsonify({
             'success': True,
-            'message': f'{count} key(s) {action} com sucesso'
+            'message': f'{job.processed} key(s) {action} com sucesso',
+            'job': job.to_dict()
         }), 200
         
     except Exception as e:
@@ -234,42 +474,116 @@ def pause_all_keys():
 
 
 @admin_bp.route('/logs', methods=['GET'])
+@read_only
 def get_logs():
     """Obter logs de acesso"""
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
         key_id = request.args.get('key_id', '').strip()
-        success_only = request.args.get('success_only', '').lower() == 'true'
+        hwid = request.args.get('hwid', '').strip()
+        ip_address = request.args.get('ip', '').strip()
         
         if per_page > 100:
             per_page = 100
         
-        query = AccessLog.query
+        try:
+            since = parse_datetime_arg('since')
+            until = parse_datetime_arg('until')
+            query, filtered = filtered_logs_query()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        # Logs arquivados não estão mais na tabela: seus totais vêm dos agregados diários
+        extra = {}
+        if (not key_id or len(key_id) == 8) and not hwid and not ip_address:
+            archived = retention_engine.archived_summary(since, until, key_id or None)
+            if archived:
+                extra['archived'] = archived
+        
+        # Paginação por cursor, sem OFFSET e sem COUNT obrigatório
+        if 'after' in request.args:
+            estimated_total = None if filtered else stats_counters.snapshot()['logins_total']
+            return keyset_response(query, AccessLog.login_at, AccessLog.id, 'logs', per_page, estimated_total, extra,
+                                   columns=LOG_COLUMNS, serialize=log_dicts)
+        
+        # Ordenar por data (mais recentes primeiro), lendo só as colunas serializadas (sem objetos
+        # do ORM); com vários shards, as páginas de cada um são intercaladas
+        pagination = paginate_shards(
+            query.with_entities(*LOG_COLUMNS),
+            [(AccessLog.login_at, True), (AccessLog.id, True)],
+            page,
+            per_page
+        )
+        
+        logs = log_dicts(pagination.items)
+        
+        return json_response({
+            'success': True,
+            'logs': logs,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': pagination.total,
+                'pages': pagination.pages,
+                'has_next': pagination.has_next,
+                'has_prev': pagination.has_prev
+            },
+            **extra
+        }), 200
+        
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/logs/export', methods=['GET'])
+def export_logs():
+    """Exportar logs em streaming, com os mesmos filtros da listagem"""
+    try:
+        try:
+            query, _ = filtered_logs_query()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        # Filtro por key_id
-        if key_id:
-            query = query.filter(AccessLog.key_id.like(f'%{key_id}%'))
+        return export_response(shard_batches(log_rows, query), LOG_FIELDS, 'access_logs')
         
-        # Filtro por sucesso
-        if success_only:
-            query = query.filter(AccessLog.success == True)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/logs/rollups', methods=['GET'])
+def get_log_rollups():
+    """Obter logs agregados por hora ou por dia"""
+    try:
+        period = request.args.get('period', 'day').strip()
+        key_id = request.args.get('key_id', '').strip()
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 100, type=int)
         
-        # Ordenar por data (mais recentes primeiro)
-        query = query.order_by(desc(AccessLog.login_at))
+        if period not in PERIODS:
+            return jsonify({'success': False, 'error': 'Período deve ser hour ou day'}), 400
         
-        # Paginação
-        pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        try:
+            since = parse_datetime_arg('since')
+            until = parse_datetime_arg('until')
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        if per_page > 1000:
+            per_page = 1000
         
-        logs = [log.to_dict() for log in pagination.items]
+        pagination = paginate_shards(
+            retention_engine.rollups(period, since, until, key_id or None),
+            [(AccessLogRollup.bucket_start, True), (AccessLogRollup.key_id, False)],
+            page,
+            per_page
+        )
         
         return jsonify({
             'success': True,
-            'logs': logs,
+            'rollups': [rollup.to_dict() for rollup in pagination.items],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -284,40 +598,355 @@ def get_logs():
         return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
 
 
+def analytics_range(period):
+    """Lê ?since= e ?until= (padrão: o intervalo usual do período até agora)"""
+    until = parse_datetime_arg('until') or datetime.utcnow()
+    since = parse_datetime_arg('since') or until - DEFAULT_RANGES[period]
+    return since, until
+
+
+@admin_bp.route('/analytics', methods=['GET'])
+@read_only
+def get_analytics():
+    """Obter logins por minuto, hora ou dia (total ou de uma key), com falhas por motivo e HWIDs/IPs distintos"""
+    try:
+        period = request.args.get('period', 'hour').strip()
+        key_id = request.args.get('key_id', '').strip()
+        
+        if period not in ANALYTICS_PERIODS:
+            return jsonify({'success': False, 'error': 'Período deve ser minute, hour ou day'}), 400
+        
+        if key_id and period not in KEY_PERIODS:
+            return jsonify({'success': False, 'error': 'Por key, o período deve ser hour ou day'}), 400
+        
+        try:
+            since, until = analytics_range(period)
+            result = analytics.series(period, since, until, key_id or None)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        return json_response({
+            'success': True,
+            'analytics': result
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/analytics/top-keys', methods=['GET'])
+@read_only
+def get_top_keys():
+    """Obter as keys com mais logins, falhas, HWIDs ou IPs distintos num intervalo"""
+    try:
+        by = request.args.get('by', 'logins').strip()
+        period = request.args.get('period', 'day').strip()
+        limit = request.args.get('limit', 20, type=int)
+        
+        if by not in RANKINGS:
+            return jsonify({'success': False, 'error': 'Critério deve ser logins, failed, hwids ou ips'}), 400
+        
+        if period not in KEY_PERIODS:
+            return jsonify({'success': False, 'error': 'Período deve ser hour ou day'}), 400
+        
+        if limit > 1000:
+            limit = 1000
+        
+        if limit < 1:
+            return jsonify({'success': False, 'error': 'limit deve ser positivo'}), 400
+        
+        try:
+            since, until = analytics_range(period)
+            result = analytics.top_keys(by, period, since, until, limit)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        return json_response({
+            'success': True,
+            'top_keys': result
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/analytics/rebuild', methods=['POST'])
+def rebuild_analytics():
+    """Recalcular os buckets de analytics a partir dos logs de acesso"""
+    try:
+        result = analytics.rebuild()
+        
+        return jsonify({
+            'success': True,
+            'result': result,
+            'analytics': analytics.stats()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/retention', methods=['GET'])
+def get_retention_status():
+    """Obter estado da retenção de logs"""
+    try:
+        return jsonify({
+            'success': True,
+            'retention': retention_engine.status()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/retention/run', methods=['POST'])
+def run_retention():
+    """Executar agora a consolidação e o arquivamento de logs"""
+    try:
+        result = retention_engine.run()
+        stats_counters.reconcile()
+        
+        return jsonify({
+            'success': True,
+            'result': result,
+            'retention': retention_engine.status()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
 @admin_bp.route('/stats', methods=['GET'])
+@read_only
 def get_stats():
     """Obter estatísticas do sistema"""
     try:
-        total_keys = Key.query.count()
-        active_keys = Key.query.filter(Key.is_active == True, Key.is_paused == False).count()
-        paused_keys = Key.query.filter(Key.is_paused == True).count()
-        used_keys = Key.query.filter(Key.is_used == True).count()
-        expired_keys = Key.query.filter(Key.expires_at < datetime.utcnow()).count()
+        # Contadores mantidos a cada escrita (custo O(1), independente do tamanho das tabelas)
+        counters = stats_counters.snapshot()
+        
+        return jsonify({
+            'success': True,
+            'stats': stats_summary(counters)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+
+@admin_bp.route('/stream', methods=['GET'])
+@read_only
+def stream_events():
+    """Eventos ao vivo (Server-Sent Events): estatísticas, logs de acesso novos e mudanças nas keys"""
+    try:
+        # Estado inicial; depois só chegam os deltas publicados pelas escritas
+        initial = encode_event('stats', stats_summary(stats_counters.snapshot()))
+        db.session.close()
+        
+        def generate():
+            # Assina só quando o stream começa: uma resposta nunca lida não deixa fila para trás
+            subscription = event_bus.subscribe()
+            try:
+                yield initial
+                resync_at = time.monotonic() + event_bus.resync_interval
+                while True:
+                    messages = subscription.get(timeout=event_bus.heartbeat_interval)
+                    if messages is None:
+                        return
+                    
+                    # Eventos descartados (fila cheia) ou de outros workers: reenvia o estado completo
+                    if subscription.take_lagged() or time.monotonic() >= resync_at:
+                        messages.append(encode_event('stats', stats_summary(stats_counters.snapshot())))
+                        # O stream fica aberto: não segura a conexão (nem a leitura) entre eventos
+                        db.session.close()
+                        resync_at = time.monotonic() + event_bus.resync_interval
+                    
+                    yield b''.join(messages) or HEARTBEAT
+            finally:
+                event_bus.unsubscribe(subscription)
+        
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            # Proxies (nginx) não devem acumular a resposta
+            'X-Accel-Buffering': 'no'
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/event-bus', methods=['GET'])
+def get_event_bus_stats():
+    """Obter assinantes e contadores dos streams de eventos"""
+    try:
+        return jsonify({
+            'success': True,
+            'event_bus': event_bus.stats()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/cache', methods=['GET'])
+def get_cache_stats():
+    """Obter contadores do cache de keys"""
+    try:
+        return jsonify({
+            'success': True,
+            'cache': key_cache.stats(),
+            'changes': key_changes.stats()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/membership', methods=['GET'])
+def get_membership_stats():
+    """Obter contadores do filtro de keys existentes"""
+    try:
+        return jsonify({
+            'success': True,
+            'membership': key_membership.stats()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/log-writer', methods=['GET'])
+def get_log_writer_stats():
+    """Obter contadores da fila de gravação de logs"""
+    try:
+        return jsonify({
+            'success': True,
+            'log_writer': log_writer.stats()
+        }), 200
         
-        total_logins = AccessLog.query.count()
-        successful_logins = AccessLog.query.filter(AccessLog.success == True).count()
-        failed_logins = AccessLog.query.filter(AccessLog.success == False).count()
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/rate-limit', methods=['GET'])
+def get_rate_limit_stats():
+    """Obter regras e contadores do limite de requisições"""
+    try:
+        return jsonify({
+            'success': True,
+            'rate_limit': rate_limiter.stats()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/shards', methods=['GET'])
+def get_shards_status():
+    """Obter os shards configurados e os contadores de keys e logins de cada um"""
+    try:
+        counters = stats_counters.by_shard()
         
         return jsonify({
             'success': True,
-            'stats': {
-                'keys': {
-                    'total': total_keys,
-                    'active': active_keys,
-                    'paused': paused_keys,
-                    'used': used_keys,
-                    'expired': expired_keys,
-                    'available': total_keys - used_keys - expired_keys
-                },
-                'logins': {
-                    'total': total_logins,
-                    'successful': successful_logins,
-                    'failed': failed_logins,
-                    'success_rate': round((successful_logins / total_logins * 100) if total_logins > 0 else 0, 2)
-                }
+            'shards': {
+                **shards.stats(),
+                'counters': [{row.name: row.value for row in rows} for rows in counters]
             }
         }), 200
         
     except Exception as e:
         return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
 
+
+@admin_bp.route('/storage', methods=['GET'])
+def get_storage_status():
+    """Obter a configuração do SQLite e os contadores do escritor único"""
+    try:
+        return jsonify({
+            'success': True,
+            'storage': storage.status()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/jobs', methods=['POST'])
+def create_job():
+    """Criar operação em massa (pause, unpause, reset_hwid, extend, delete) por filtros ou lista de keys"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'success': False, 'error': 'Dados não fornecidos'}), 400
+        
+        action = data.get('action')
+        if action not in BULK_ACTIONS:
+            return jsonify({'success': False, 'error': f'Ação inválida. Use: {", ".join(BULK_ACTIONS)}'}), 400
+        
+        params = {}
+        if action == 'extend':
+            days = data.get('days')
+            if not isinstance(days, int) or days < 1 or days > 365:
+                return jsonify({'success': False, 'error': 'Dias para estender deve ser entre 1 e 365'}), 400
+            params['days'] = days
+        
+        key_ids = data.get('key_ids')
+        filters = data.get('filters')
+        
+        if key_ids is not None:
+            if not isinstance(key_ids, list) or not key_ids or len(key_ids) > MAX_JOB_KEY_IDS:
+                return jsonify({'success': False, 'error': f'key_ids deve ser uma lista com 1 a {MAX_JOB_KEY_IDS} keys'}), 400
+            if not all(isinstance(key_id, str) and len(key_id) == 8 and key_id.isdigit() for key_id in key_ids):
+                return jsonify({'success': False, 'error': 'Key deve ter exatamente 8 dígitos'}), 400
+            job = bulk_jobs.submit(action, key_ids=key_ids, params=params, description={'key_ids': len(key_ids)})
+        elif isinstance(filters, dict):
+            # Mesmos filtros da listagem; {} seleciona todas as keys
+            query, _ = filtered_keys_query(filters)
+            criterion = query.whereclause if query.whereclause is not None else true()
+            job = bulk_jobs.submit(action, criterion=criterion, params=params, description={'filters': filters})
+        else:
+            return jsonify({'success': False, 'error': 'Informe key_ids ou filters'}), 400
+        
+        return jsonify({
+            'success': True,
+            'job': job.to_dict()
+        }), 202
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Listar as operações em massa mais recentes"""
+    try:
+        return jsonify({
+            'success': True,
+            'jobs': [job.to_dict() for job in bulk_jobs.recent()]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@admin_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Obter progresso e resultado de uma operação em massa"""
+    try:
+        job = db.session.get(BulkJob, job_id)
+        
+        if not job:
+            return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+        
+        return jsonify({
+            'success': True,
+            'job': job.to_dict()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
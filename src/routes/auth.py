@@ -1,9 +1,132 @@
 from flask import Blueprint, request, jsonify
 from src.models.key import db, Key, AccessLog
+from src.services.key_changes import key_changes
+from src.services.key_membership import key_membership
+from src.services.log_writer import log_writer
+from src.services.rate_limiter import rate_limiter
+from src.services.session_tokens import session_tokens, InvalidSession
+from src.services.storage import read_only
+from src.services.sharding import shards
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__)
 
+# Máximo de keys por requisição em lote
+MAX_BATCH_SIZE = 5000
+
+
+def max_batch_size():
+    """Maior lote aceito: MAX_BATCH_SIZE ou, se menor, o limite da regra ip_batch"""
+    return min(MAX_BATCH_SIZE, rate_limiter.batch_limit() or MAX_BATCH_SIZE)
+
+
+@auth_bp.before_request
+def apply_rate_limit():
+    """Recusa com 429 clientes acima do limite, antes de qualquer consulta ao banco"""
+    # Um lote acima do máximo nunca seria aceito: 413 com o tamanho permitido, em vez de um 429
+    data = request.get_json(silent=True)
+    entries = data.get('keys') if isinstance(data, dict) else None
+    limit = max_batch_size()
+    if isinstance(entries, list) and len(entries) > limit:
+        return jsonify({
+            'success': False,
+            'error': f'Máximo de {limit} keys por requisição',
+            'max_batch_size': limit
+        }), 413
+    
+    retry_after = rate_limiter.check(request)
+    if retry_after is not None:
+        response = jsonify({
+            'success': False,
+            'error': 'Muitas tentativas, aguarde antes de tentar novamente',
+            'retry_after': retry_after
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+
+@auth_bp.before_request
+def follow_key_changes():
+    """Garante que este worker aplique as alterações de keys feitas pelos demais"""
+    key_changes.ensure_started()
+
+
+def log_access(key_id, hwid, success=True, error_message=None):
+    """Enfileira o log de acesso da requisição atual para gravação em lote"""
+    log_writer.submit(
+        key_id=key_id,
+        hwid=hwid,
+        ip_address=request.remote_addr,
+        user_agent=request.headers.get('User-Agent'),
+        success=success,
+        error_message=error_message
+    )
+
+
+def login_key_info(key):
+    """Dados da key retornados ao cliente após o login"""
+    return {
+        'key_id': key.key_id,
+        'expires_at': key.expires_at.isoformat() if key.expires_at else None,
+        'expiration_days': key.expiration_days,
+        'first_login': key.first_login_at.isoformat() if key.first_login_at else None
+    }
+
+
+def batch_entries(data):
+    """Lê a lista 'keys' de uma requisição em lote como pares (key_id, hwid)"""
+    entries = data.get('keys')
+    
+    if not isinstance(entries, list) or not entries:
+        raise ValueError('Lista de keys é obrigatória')
+    
+    parsed = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            parsed.append((str(entry.get('key_id') or '').strip(), str(entry.get('hwid') or '').strip()))
+        else:
+            parsed.append((str(entry or '').strip(), ''))
+    return parsed
+
+
+def is_valid_key_format(key_id):
+    return len(key_id) == 8 and key_id.isdigit()
+
+
+def lock_keys(key_ids):
+    """Escrever primeiro garante o lock de escrita do shard atual: as keys relidas em seguida não
+    mudam até o commit (outro worker pode tê-las ativado depois do snapshot do cache)"""
+    table = Key.__table__
+    db.session.execute(table.update().where(table.c.key_id.in_(key_ids)).values(id=table.c.id))
+
+
+def activate_for_login(key_id, hwid):
+    """Ativa a key no primeiro login, decidindo sobre a linha atual e não sobre o snapshot do cache
+
+    Retorna (key, status, mensagem); key é None quando o login foi recusado.
+    """
+    lock_keys([key_id])
+    key = Key.query.filter_by(key_id=key_id).populate_existing().first()
+    
+    if not key:
+        db.session.rollback()
+        return None, 404, 'Key não encontrada'
+    
+    can_login, message = key.can_login(hwid)
+    
+    if not can_login:
+        db.session.rollback()
+        return None, 403, message
+    
+    if key.first_login_at:
+        # Ativada por outro login com o mesmo HWID
+        db.session.commit()
+    else:
+        key.activate_key(hwid)
+    return key, 200, 'OK'
+
+
 @auth_bp.route('/login', methods=['POST'])
 def login():
     """Endpoint para login do cliente"""
@@ -22,21 +145,17 @@ def login():
         if len(key_id) != 8 or not key_id.isdigit():
             return jsonify({'success': False, 'error': 'Key deve ter exatamente 8 dígitos'}), 400
         
-        # Buscar a key no banco
-        key = Key.query.filter_by(key_id=key_id).first()
+        # Key com certeza inexistente: responde sem consultar o banco e sem log individual
+        if not key_membership.might_exist(key_id):
+            key_membership.reject()
+            return jsonify({'success': False, 'error': 'Key não encontrada'}), 404
+        
+        # Buscar a key (cache em memória, banco apenas em caso de miss)
+        key = Key.get_cached(key_id)
         
         if not key:
             # Log de tentativa de login com key inexistente
-            log = AccessLog(
-                key_id=key_id,
-                hwid=hwid,
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent'),
-                success=False,
-                error_message='Key não encontrada'
-            )
-            db.session.add(log)
-            db.session.commit()
+            log_access(key_id, hwid, success=False, error_message='Key não encontrada')
             
             return jsonify({'success': False, 'error': 'Key não encontrada'}), 404
         
@@ -45,42 +164,68 @@ def login():
         
         if not can_login:
             # Log de tentativa de login falhada
-            log = AccessLog(
-                key_id=key_id,
-                hwid=hwid,
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent'),
-                success=False,
-                error_message=message
-            )
-            db.session.add(log)
-            db.session.commit()
+            log_access(key_id, hwid, success=False, error_message=message)
             
             return jsonify({'success': False, 'error': message}), 403
         
-        # Ativar key no primeiro login
+        # Ativar key no primeiro login (só o shard da key é consultado e travado)
         if not key.first_login_at:
-            key.activate_key(hwid)
+            with shards.for_key(key_id):
+                key, status, message = activate_for_login(key_id, hwid)
+            
+            if not key:
+                log_access(key_id, hwid, success=False, error_message=message)
+                
+                return jsonify({'success': False, 'error': message}), status
         
         # Log de login bem-sucedido
-        log = AccessLog(
-            key_id=key_id,
-            hwid=hwid,
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent'),
-            success=True
-        )
-        db.session.add(log)
-        db.session.commit()
+        log_access(key_id, hwid)
+        
+        # Token de sessão para as verificações periódicas via /heartbeat
+        token, token_expires_at = session_tokens.issue(key, hwid)
         
         return jsonify({
             'success': True,
             'message': 'Login realizado com sucesso',
-            'key_info': {
-                'key_id': key.key_id,
-                'expires_at': key.expires_at.isoformat() if key.expires_at else None,
-                'expiration_days': key.expiration_days,
-                'first_login': key.first_login_at.isoformat() if key.first_login_at else None
+            'key_info': login_key_info(key),
+            'session': {
+                'token': token,
+                'expires_at': token_expires_at.isoformat()
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@auth_bp.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    """Endpoint para confirmar a sessão do cliente sem consultar o banco"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'success': False, 'error': 'Dados não fornecidos'}), 400
+        
+        token = data.get('token', '').strip()
+        hwid = data.get('hwid', '').strip()
+        
+        if not token or not hwid:
+            return jsonify({'success': False, 'error': 'Token e HWID são obrigatórios'}), 400
+        
+        try:
+            payload = session_tokens.verify(token, hwid)
+        except InvalidSession as e:
+            return jsonify({'success': False, 'error': str(e)}), 401
+        
+        token, token_expires_at = session_tokens.refresh(payload)
+        
+        return jsonify({
+            'success': True,
+            'key_id': payload['k'],
+            'session': {
+                'token': token,
+                'expires_at': token_expires_at.isoformat()
             }
         }), 200
         
@@ -89,6 +234,7 @@ def login():
 
 
 @auth_bp.route('/validate', methods=['POST'])
+@read_only
 def validate_key():
     """Endpoint para validar uma key sem fazer login"""
     try:
@@ -105,8 +251,12 @@ def validate_key():
         if len(key_id) != 8 or not key_id.isdigit():
             return jsonify({'success': False, 'error': 'Key deve ter exatamente 8 dígitos'}), 400
         
-        # Buscar a key no banco
-        key = Key.query.filter_by(key_id=key_id).first()
+        if not key_membership.might_exist(key_id):
+            key_membership.reject()
+            return jsonify({'success': False, 'error': 'Key não encontrada'}), 404
+        
+        # Buscar a key (cache em memória, banco apenas em caso de miss)
+        key = Key.get_cached(key_id)
         
         if not key:
             return jsonify({'success': False, 'error': 'Key não encontrada'}), 404
@@ -119,3 +269,156 @@ def validate_key():
     except Exception as e:
         return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
 
+
+
+@auth_bp.route('/validate/batch', methods=['POST'])
+@read_only
+def validate_batch():
+    """Endpoint para validar várias keys numa única requisição"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'success': False, 'error': 'Dados não fornecidos'}), 400
+        
+        try:
+            entries = batch_entries(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        # Uma consulta IN (...) por bloco de keys fora do cache
+        keys = Key.get_cached_many([
+            key_id for key_id, _ in entries
+            if is_valid_key_format(key_id) and key_membership.might_exist(key_id)
+        ])
+        
+        results = []
+        for key_id, _ in entries:
+            if not key_id:
+                results.append({'key_id': key_id, 'status': 400, 'success': False, 'error': 'Key ID é obrigatório'})
+            elif not is_valid_key_format(key_id):
+                results.append({'key_id': key_id, 'status': 400, 'success': False, 'error': 'Key deve ter exatamente 8 dígitos'})
+            elif key_id not in keys:
+                if not key_membership.might_exist(key_id):
+                    key_membership.reject()
+                results.append({'key_id': key_id, 'status': 404, 'success': False, 'error': 'Key não encontrada'})
+            else:
+                results.append({'key_id': key_id, 'status': 200, 'success': True, 'key_info': keys[key_id].to_dict()})
+        
+        valid = sum(1 for result in results if result['success'])
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'summary': {
+                'total': len(results),
+                'valid': valid,
+                'invalid': len(results) - valid
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
+
+@auth_bp.route('/login/batch', methods=['POST'])
+def login_batch():
+    """Endpoint para login de várias keys numa única requisição"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'success': False, 'error': 'Dados não fornecidos'}), 400
+        
+        try:
+            entries = batch_entries(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        keys = Key.get_cached_many([
+            key_id for key_id, _ in entries
+            if is_valid_key_format(key_id) and key_membership.might_exist(key_id)
+        ])
+        
+        # Keys que podem ser ativadas neste lote, relidas de uma vez (por shard) sob o lock de escrita:
+        # a decisão sobre elas usa a linha atual, não o snapshot do cache
+        pending = [key_id for key_id, key in keys.items() if not key.first_login_at]
+        to_activate = {}
+        for index, key_ids in shards.group(pending).items():
+            with shards.scope(index):
+                for start in range(0, len(key_ids), 500):
+                    lock_keys(key_ids[start:start + 500])
+                    for key in Key.query.filter(Key.key_id.in_(key_ids[start:start + 500])).populate_existing():
+                        to_activate[key.key_id] = key
+        
+        activated = {}
+        results = []
+        for key_id, hwid in entries:
+            if not key_id or not hwid:
+                results.append({'key_id': key_id, 'status': 400, 'success': False, 'error': 'Key ID e HWID são obrigatórios'})
+                continue
+            
+            if not is_valid_key_format(key_id):
+                results.append({'key_id': key_id, 'status': 400, 'success': False, 'error': 'Key deve ter exatamente 8 dígitos'})
+                continue
+            
+            key = keys.get(key_id)
+            if key is not None and not key.first_login_at:
+                # Linha relida acima (None se foi apagada); uma key ativada antes no mesmo lote já
+                # está vinculada ao HWID
+                key = to_activate.get(key_id)
+            
+            if not key and not key_membership.might_exist(key_id):
+                key_membership.reject()
+                results.append({'key_id': key_id, 'status': 404, 'success': False, 'error': 'Key não encontrada'})
+                continue
+            
+            if not key:
+                log_access(key_id, hwid, success=False, error_message='Key não encontrada')
+                results.append({'key_id': key_id, 'status': 404, 'success': False, 'error': 'Key não encontrada'})
+                continue
+            
+            can_login, message = key.can_login(hwid)
+            
+            if not can_login:
+                log_access(key_id, hwid, success=False, error_message=message)
+                results.append({'key_id': key_id, 'status': 403, 'success': False, 'error': message})
+                continue
+            
+            # Ativar key no primeiro login
+            if not key.first_login_at:
+                key.activate_key(hwid, commit=False)
+                activated[key_id] = key
+            
+            log_access(key_id, hwid)
+            results.append({
+                'key_id': key_id,
+                'status': 200,
+                'success': True,
+                'message': 'Login realizado com sucesso',
+                'key_info': login_key_info(key)
+            })
+        
+        # Todas as ativações do lote num único commit (que também libera os locks de escrita),
+        # com as linhas do diário de cada shard
+        rows = []
+        for index, group in shards.group(activated).items():
+            rows.extend(key_changes.stage('activate', group, shard=index))
+        db.session.commit()
+        key_changes.apply(rows)
+        
+        successful = sum(1 for result in results if result['success'])
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'summary': {
+                'total': len(results),
+                'successful': successful,
+                'failed': len(results) - successful
+            }
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
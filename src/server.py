@@ -0,0 +1,256 @@
+"""Servidor de produção: um processo mestre e N workers (fork) atendendo no mesmo socket
+
+Uso:
+    python src/server.py --bind 0.0.0.0:5000 --workers 4
+    python src/server.py --workers 4 --threads --config producao.py
+
+O mestre cria a aplicação uma única vez (verificação do schema e filtro de keys incluídos),
+fecha as conexões com o banco e só então cria os workers, que abrem as suas depois do fork.
+SIGTERM ou SIGINT encerram com calma: os workers terminam as requisições em andamento e
+gravam os logs pendentes; passado --graceful-timeout, os restantes são finalizados.
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Config
+from werkzeug.serving import make_server
+from src.main import create_app, start_background_services, stop_background_services
+from src.models.key import db
+from src.services.storage import storage
+from src.services.event_bus import event_bus
+
+logger = logging.getLogger('bc_games.server')
+
+
+def close_connections(app):
+    """Fecha as conexões com o banco abertas por este processo"""
+    with app.app_context():
+        for engine in list(db.engines.values()) + storage.readers():
+            engine.dispose()
+
+
+class PreforkServer:
+    """Mestre que abre o socket e mantém os workers vivos, recriando os que morrerem"""
+
+    def __init__(self, app, host='0.0.0.0', port=5000, workers=None, threaded=False, graceful_timeout=30,
+                 background=True):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.threaded = threaded
+        self.graceful_timeout = graceful_timeout
+        # As threads periódicas (retenção, expiração) rodam só no worker 0
+        self.background = background
+        self.socket = None
+
+        # pid -> índice do worker
+        self._children = {}
+        self._stopping = False
+        self._deadline = None
+        # Segundos entre o fork e o worker estar pronto para aceitar conexões, por índice
+        self.boot_times = {}
+
+    def start(self):
+        """Abre o socket e cria os workers; retorna quando todos estão prontos"""
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(socket.SOMAXCONN)
+        # accept() sem bloqueio: cada conexão vai para um worker, os demais voltam a esperar
+        sock.setblocking(False)
+        self.socket = sock
+        self.port = sock.getsockname()[1]
+
+        # Nenhuma conexão com o banco atravessa o fork
+        close_connections(self.app)
+
+        for index in range(self.workers):
+            self.spawn(index)
+
+    def spawn(self, index):
+        read_fd, write_fd = os.pipe()
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                self._work(index, write_fd)
+            except BaseException:
+                logger.exception('Worker %d falhou', index)
+                code = 1
+            finally:
+                os._exit(code)
+
+        os.close(write_fd)
+        # Um byte quando o worker fica pronto; fim de arquivo se ele morrer antes
+        ready = os.read(read_fd, 1)
+        os.close(read_fd)
+        self._children[pid] = index
+        if ready:
+            self.boot_times[index] = time.perf_counter() - started
+        if self._stopping:
+            os.kill(pid, signal.SIGTERM)
+        return pid
+
+    def _work(self, index, ready_fd):
+        """Corpo do processo worker"""
+        # SIGINT (Ctrl+C no terminal) chega a todo o grupo: quem decide o encerramento é o mestre
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        server = make_server(self.host, self.port, self.app, threaded=self.threaded, fd=self.socket.fileno())
+        # Requisições em andamento terminam antes do processo sair
+        server.daemon_threads = False
+        server.block_on_close = True
+
+        accept = server.get_request
+
+        def get_request():
+            # Em BSD/macOS a conexão aceita herdaria o modo sem bloqueio do socket compartilhado
+            connection, address = accept()
+            connection.setblocking(True)
+            return connection, address
+
+        server.get_request = get_request
+
+        def stop():
+            # Streams de eventos não terminam sozinhos: sem isto as threads deles seguram o encerramento
+            event_bus.close()
+            server.shutdown()
+
+        def handle_term(signum, frame):
+            # shutdown() espera o loop de serve_forever, que roda nesta mesma thread
+            threading.Thread(target=stop, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, handle_term)
+
+        if self.background and index == 0:
+            start_background_services()
+
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            stop_background_services()
+            close_connections(self.app)
+
+    def shutdown(self, graceful=True):
+        """Pede o encerramento dos workers; wait() finaliza os que passarem do prazo"""
+        if self._stopping or not graceful:
+            # Segundo pedido: não espera mais
+            self._deadline = time.monotonic()
+        else:
+            self._deadline = time.monotonic() + self.graceful_timeout
+        self._stopping = True
+        for pid in list(self._children):
+            self._signal(pid, signal.SIGTERM)
+
+    def wait(self):
+        """Acompanha os workers até todos saírem, recriando os que morrerem antes do shutdown"""
+        while self._children:
+            if self._stopping and time.monotonic() >= self._deadline:
+                for pid in list(self._children):
+                    self._signal(pid, signal.SIGKILL)
+
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.1)
+                continue
+
+            index = self._children.pop(pid, None)
+            if index is None or self._stopping:
+                continue
+
+            logger.warning('Worker %d (pid %d) saiu com status %d; recriando', index, pid,
+                           os.waitstatus_to_exitcode(status))
+            # Um worker que morre ao iniciar não deve virar um loop de fork
+            if index not in self.boot_times:
+                time.sleep(1)
+            self.boot_times.pop(index, None)
+            self.spawn(index)
+
+        self.socket.close()
+
+    def run(self):
+        """Inicia, atende até receber SIGTERM/SIGINT e encerra com calma"""
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.shutdown())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.shutdown())
+
+        self.start()
+        logger.info('Atendendo em %s:%d com %d worker(s)%s', self.host, self.port, self.workers,
+                    ' multithread' if self.threaded else '')
+        self.wait()
+        logger.info('Encerrado')
+
+    def _signal(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def parse_bind(value):
+    host, _, port = value.rpartition(':')
+    return host.strip('[]') or '0.0.0.0', int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bind', default='0.0.0.0:5000', help='host:porta')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', action='store_true', help='Cada worker atende as conexões em threads')
+    parser.add_argument('--graceful-timeout', type=float, default=30,
+                        help='Segundos para os workers terminarem as requisições ao encerrar')
+    parser.add_argument('--config', help='Arquivo Python com a configuração da aplicação (SECRET_KEY, ...)')
+    parser.add_argument('--no-background', action='store_true',
+                        help='Não inicia as threads de retenção e expiração (rodam em outro lugar)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(process)d] %(message)s')
+
+    config = Config(os.getcwd())
+    if args.config:
+        config.from_pyfile(os.path.abspath(args.config))
+    app = create_app(config)
+    host, port = parse_bind(args.bind)
+
+    if args.workers > 1 and not app.config.get('RATE_LIMIT_STORAGE'):
+        logger.warning('Sem RATE_LIMIT_STORAGE, cada worker aplica os limites de requisição separadamente')
+    if not args.threads:
+        logger.warning('Sem --threads, cada dashboard aberto em /api/admin/stream ocupa um worker inteiro')
+
+    if not hasattr(os, 'fork'):
+        # Sem fork (Windows): um único processo multithread
+        logger.warning('fork indisponível: atendendo num único processo')
+        if not args.no_background:
+            start_background_services()
+        try:
+            make_server(host, port, app, threaded=True).serve_forever()
+        finally:
+            stop_background_services()
+        return
+
+    PreforkServer(app, host, port, args.workers, args.threads, args.graceful_timeout,
+                  background=not args.no_background).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,602 @@
+from datetime import datetime, timedelta
+import functools
+import hashlib
+import logging
+import math
+from types import SimpleNamespace
+from sqlalchemy import and_, bindparam, desc, func, or_
+from src.models.key import db, AccessLog, AnalyticsBucket
+from src.services.sharding import shards
+
+logger = logging.getLogger('bc_games.analytics')
+
+PERIOD_MINUTE = 'minute'
+PERIOD_HOUR = 'hour'
+PERIOD_DAY = 'day'
+PERIODS = (PERIOD_MINUTE, PERIOD_HOUR, PERIOD_DAY)
+
+PERIOD_LENGTHS = {
+    PERIOD_MINUTE: timedelta(minutes=1),
+    PERIOD_HOUR: timedelta(hours=1),
+    PERIOD_DAY: timedelta(days=1)
+}
+
+# Intervalo consultado quando ?since= não é informado
+DEFAULT_RANGES = {
+    PERIOD_MINUTE: timedelta(hours=1),
+    PERIOD_HOUR: timedelta(days=1),
+    PERIOD_DAY: timedelta(days=30)
+}
+
+# Buckets por minuto só existem para o total: por key seriam quase uma linha por login
+KEY_PERIODS = (PERIOD_HOUR, PERIOD_DAY)
+
+# key_id dos buckets com o total de todas as keys
+ALL_KEYS = ''
+
+# Critérios do ranking de keys e o campo de cada um no resultado
+RANKINGS = ('logins', 'failed', 'hwids', 'ips')
+RANKING_FIELDS = {'logins': 'logins', 'failed': 'failed', 'hwids': 'distinct_hwids', 'ips': 'distinct_ips'}
+
+# Motivos de falha distintos guardados por bucket; os menos frequentes somam em OTHER_REASON
+MAX_REASONS = 32
+OTHER_REASON = 'Outros'
+UNKNOWN_REASON = 'Sem mensagem'
+
+# Colunas regravadas quando o bucket já existe
+UPDATE_COLUMNS = ('success_count', 'failed_count', 'hwid_sketch', 'ip_sketch', 'distinct_hwids', 'distinct_ips')
+
+# Potências 2^-r da estimativa do HyperLogLog (r vai até 64 - precisão + 1)
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(66)]
+
+
+def floor_time(value, period):
+    if period == PERIOD_MINUTE:
+        return value.replace(second=0, microsecond=0)
+    if period == PERIOD_HOUR:
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+@functools.lru_cache(maxsize=None)
+def _high_bits(size):
+    """Inteiro com o bit 0x80 ligado em cada um de size bytes"""
+    return int.from_bytes(b'\x80' * size, 'little')
+
+
+def sketch_hash(value):
+    """Hash de 64 bits usado pelos sketches"""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """Estimativa de elementos distintos em 2^precision registradores de um byte, unível por máximo"""
+
+    def __init__(self, precision, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f'Precisão do sketch inválida: {precision}')
+        self.precision = precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << precision)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(len(data).bit_length() - 1, data)
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+    @staticmethod
+    def position(value, precision):
+        """Registrador e valor (posição do primeiro bit 1) de um hash numa dada precisão"""
+        bits = 64 - precision
+        return value >> bits, bits - (value & ((1 << bits) - 1)).bit_length() + 1
+
+    def add_position(self, position):
+        index, rank = position
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add_hash(self, value):
+        self.add_position(self.position(value, self.precision))
+
+    def fold(self, precision):
+        """Mesmo sketch com menos registradores (sketches só se unem com a mesma precisão)"""
+        if precision >= self.precision:
+            return self
+        shift = self.precision - precision
+        mask = (1 << shift) - 1
+        folded = bytearray(1 << precision)
+        for index, rank in enumerate(self.registers):
+            if not rank:
+                continue
+            # Os bits que saem do índice passam a ser os primeiros do restante do hash
+            low = index & mask
+            rank = shift - low.bit_length() + 1 if low else rank + shift
+            target = index >> shift
+            if rank > folded[target]:
+                folded[target] = rank
+        return HyperLogLog(precision, folded)
+
+    def merge(self, other):
+        """Une other a este sketch; com precisões diferentes o resultado fica com a menor"""
+        if other.precision != self.precision:
+            precision = min(self.precision, other.precision)
+            folded = self.fold(precision)
+            self.precision, self.registers = precision, folded.registers
+            other = other.fold(precision)
+        # Máximo byte a byte com aritmética de inteiros (os registradores nunca passam de 127):
+        # em (a | 0x80) - b o bit alto de cada byte fica ligado onde a >= b, sem empréstimo entre bytes
+        size = len(self.registers)
+        high = _high_bits(size)
+        a = int.from_bytes(self.registers, 'little')
+        b = int.from_bytes(other.registers, 'little')
+        keep = (((a | high) - b) & high) >> 7
+        keep *= 0xFF
+        self.registers = bytearray(((a & keep) | (b & ~keep)).to_bytes(size, 'little'))
+        return self
+
+    def count(self):
+        size = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(size, 0.7213 / (1 + 1.079 / size))
+        estimate = alpha * size * size / sum(map(_INVERSE_POWERS.__getitem__, self.registers))
+        zeros = self.registers.count(0)
+        # Poucos elementos: contagem linear pelos registradores vazios é mais precisa
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+
+class _Delta:
+    """Contribuição de um lote de logs para um bucket"""
+
+    __slots__ = ('success', 'failed', 'failures', 'hwids', 'ips')
+
+    def __init__(self, precision):
+        self.success = 0
+        self.failed = 0
+        self.failures = {}
+        self.hwids = HyperLogLog(precision)
+        self.ips = HyperLogLog(precision)
+
+
+def merge_failures(target, source):
+    for reason, count in source.items():
+        target[reason] = target.get(reason, 0) + count
+    if len(target) > MAX_REASONS:
+        ranked = sorted(target.items(), key=lambda item: item[1], reverse=True)
+        kept = dict(item for item in ranked if item[0] != OTHER_REASON)
+        kept = dict(list(kept.items())[:MAX_REASONS - 1])
+        kept[OTHER_REASON] = sum(target.values()) - sum(kept.values())
+        target.clear()
+        target.update(kept)
+    return target
+
+
+def _union(sketch, data):
+    """Une os registradores gravados em data ao sketch (None: começa por eles)"""
+    if sketch is None:
+        return HyperLogLog.from_bytes(data)
+    return sketch.merge(HyperLogLog.from_bytes(data))
+
+
+def _combine_buckets(shard_rows):
+    """Une os buckets de mesmo início vindos de cada shard (contadores somados, sketches unidos)"""
+    if len(shard_rows) == 1:
+        return shard_rows[0]
+    combined = {}
+    for rows in shard_rows:
+        for row in rows:
+            bucket = combined.get(row.bucket_start)
+            if bucket is None:
+                combined[row.bucket_start] = [row.success_count, row.failed_count, dict(row.failures or {}),
+                                              _union(None, row.hwid_sketch), _union(None, row.ip_sketch)]
+                continue
+            bucket[0] += row.success_count
+            bucket[1] += row.failed_count
+            merge_failures(bucket[2], row.failures or {})
+            bucket[3] = _union(bucket[3], row.hwid_sketch)
+            bucket[4] = _union(bucket[4], row.ip_sketch)
+    return [SimpleNamespace(
+        bucket_start=start, success_count=success, failed_count=failed, failures=failures,
+        hwid_sketch=hwids.to_bytes(), ip_sketch=ips.to_bytes(),
+        distinct_hwids=hwids.count(), distinct_ips=ips.count()
+    ) for start, (success, failed, failures, hwids, ips) in sorted(combined.items())]
+
+
+class Analytics:
+    """Agregados de login por minuto, hora e dia, atualizados na mesma transação que grava os logs
+
+    Cada bucket guarda sucessos, falhas por error_message e sketches HyperLogLog dos HWIDs e IPs:
+    uma consulta lê só os buckets do intervalo, qualquer que seja o volume de access_logs.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        # Registradores por sketch: 2^precision bytes (erro típico de 1,04 / sqrt(2^precision))
+        self.precision = 10
+        self.key_precision = 6
+        self.minute_retention = timedelta(hours=48)
+        self.hour_retention = timedelta(days=90)
+        self.max_buckets = 2000
+        self.chunk_size = 5000
+
+        self.logs_recorded = 0
+        self.buckets_inserted = 0
+        self.buckets_updated = 0
+        self.failed = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('ANALYTICS_ENABLED', self.enabled)
+        self.precision = app.config.get('ANALYTICS_PRECISION', self.precision)
+        self.key_precision = app.config.get('ANALYTICS_KEY_PRECISION', self.key_precision)
+        self.minute_retention = timedelta(hours=app.config.get('ANALYTICS_MINUTE_RETENTION_HOURS', 48))
+        self.hour_retention = timedelta(days=app.config.get('ANALYTICS_HOUR_RETENTION_DAYS', 90))
+        self.max_buckets = app.config.get('ANALYTICS_MAX_BUCKETS', self.max_buckets)
+
+    # Escrita
+
+    def record(self, connection, records):
+        """Soma os logs (dicts com as colunas de AccessLog) aos buckets
+
+        Chamar depois de uma escrita na mesma transação: com o lock de escrita já obtido, nenhum
+        outro processo altera os buckets entre a leitura e a gravação.
+        """
+        if not self.enabled or not records:
+            return
+        try:
+            # Savepoint: uma falha no meio desfaz só os buckets já alterados, não os logs da transação
+            with connection.begin_nested():
+                self._write(connection, self._deltas(records))
+        except Exception:
+            # Uma falha nos buckets não pode descartar os logs: rebuild() recalcula a partir deles
+            logger.exception('Falha ao somar %d log(s) aos buckets de analytics', len(records))
+            self.failed += len(records)
+
+    def _deltas(self, records):
+        deltas = {}
+        for record in records:
+            login_at = record.get('login_at') or datetime.utcnow()
+            key_id = record['key_id']
+            success = record.get('success') is not False
+            reason = None if success else (record.get('error_message') or UNKNOWN_REASON)
+            hwid = sketch_hash(record['hwid']) if record.get('hwid') else None
+            ip = sketch_hash(record['ip_address']) if record.get('ip_address') else None
+            # Posição nos registradores calculada uma vez por precisão (total e por key), não por bucket
+            positions = [(None if hwid is None else HyperLogLog.position(hwid, precision),
+                          None if ip is None else HyperLogLog.position(ip, precision))
+                         for precision in (self.precision, self.key_precision)]
+
+            for period in PERIODS:
+                start = floor_time(login_at, period)
+                targets = (ALL_KEYS, key_id) if period in KEY_PERIODS else (ALL_KEYS,)
+                for target in targets:
+                    per_key = target != ALL_KEYS
+                    delta = deltas.get((period, start, target))
+                    if delta is None:
+                        delta = deltas[(period, start, target)] = _Delta(
+                            self.key_precision if per_key else self.precision
+                        )
+                    if success:
+                        delta.success += 1
+                    else:
+                        delta.failed += 1
+                        delta.failures[reason] = delta.failures.get(reason, 0) + 1
+                    hwid_position, ip_position = positions[per_key]
+                    if hwid_position is not None:
+                        delta.hwids.add_position(hwid_position)
+                    if ip_position is not None:
+                        delta.ips.add_position(ip_position)
+
+        self.logs_recorded += len(records)
+        return deltas
+
+    def _write(self, connection, deltas):
+        table = AnalyticsBucket.__table__
+        groups = {}
+        for period, start, key_id in deltas:
+            groups.setdefault(period, []).append((start, key_id))
+
+        # Buckets com falhas novas regravam também a coluna JSON; os demais, só contadores e sketches
+        updates, failure_updates = [], []
+        for period, pairs in groups.items():
+            # Uma consulta por bloco de buckets, não por bucket: a reconstrução cobre milhares de minutos.
+            # key_id IN (...) AND bucket_start IN (...) usa o índice único; combinações sem delta pendente
+            # (de outro bloco ou já unidas) são ignoradas
+            pairs.sort()
+            for offset in range(0, len(pairs), 500):
+                chunk = pairs[offset:offset + 500]
+                rows = connection.execute(db.select(
+                    table.c.id, table.c.bucket_start, table.c.key_id, table.c.success_count,
+                    table.c.failed_count, table.c.failures, table.c.hwid_sketch, table.c.ip_sketch
+                ).where(
+                    table.c.period == period,
+                    table.c.key_id.in_(sorted({key_id for _, key_id in chunk})),
+                    table.c.bucket_start.in_(sorted({start for start, _ in chunk}))
+                ))
+                for row in rows:
+                    delta = deltas.pop((period, row.bucket_start, row.key_id), None)
+                    if delta is None:
+                        continue
+                    hwids = HyperLogLog.from_bytes(row.hwid_sketch).merge(delta.hwids)
+                    ips = HyperLogLog.from_bytes(row.ip_sketch).merge(delta.ips)
+                    update = {
+                        '_id': row.id,
+                        'success_count': row.success_count + delta.success,
+                        'failed_count': row.failed_count + delta.failed,
+                        'hwid_sketch': hwids.to_bytes(),
+                        'ip_sketch': ips.to_bytes(),
+                        'distinct_hwids': hwids.count(),
+                        'distinct_ips': ips.count()
+                    }
+                    if delta.failures:
+                        update['failures'] = merge_failures(dict(row.failures or {}), delta.failures)
+                        failure_updates.append(update)
+                    else:
+                        updates.append(update)
+
+        inserts = [{
+            'period': period,
+            'bucket_start': start,
+            'key_id': key_id,
+            'success_count': delta.success,
+            'failed_count': delta.failed,
+            'failures': delta.failures or None,
+            'hwid_sketch': delta.hwids.to_bytes(),
+            'ip_sketch': delta.ips.to_bytes(),
+            'distinct_hwids': delta.hwids.count(),
+            'distinct_ips': delta.ips.count()
+        } for (period, start, key_id), delta in deltas.items()]
+
+        for rows, columns in ((updates, UPDATE_COLUMNS), (failure_updates, UPDATE_COLUMNS + ('failures',))):
+            if rows:
+                connection.execute(
+                    table.update().where(table.c.id == bindparam('_id'))
+                    .values({column: bindparam(column) for column in columns}),
+                    rows
+                )
+        if inserts:
+            connection.execute(table.insert(), inserts)
+
+        self.buckets_updated += len(updates) + len(failure_updates)
+        self.buckets_inserted += len(inserts)
+
+    # Consultas
+
+    def series(self, period, since, until, key_id=None):
+        """Buckets de [since, until) com os buckets vazios preenchidos, e os totais do intervalo
+
+        Os de uma key vêm do shard dela; os do total, da união dos buckets de todos os shards.
+        """
+        since = floor_time(since, period)
+        self._check_range(period, since, until)
+
+        if key_id:
+            with shards.for_key(key_id):
+                rows = self._bucket_rows(period, since, until, key_id)
+        else:
+            rows = _combine_buckets(shards.scatter(self._bucket_rows, period, since, until, ALL_KEYS))
+        by_start = {row.bucket_start: row for row in rows}
+
+        totals = {'success': 0, 'failed': 0, 'failures': {}}
+        hwids = ips = None
+        buckets = []
+        start = since
+        while start < until:
+            row = by_start.get(start)
+            if row is None:
+                buckets.append({'bucket_start': start.isoformat(), 'success': 0, 'failed': 0, 'failures': {},
+                                'distinct_hwids': 0, 'distinct_ips': 0})
+            else:
+                buckets.append({
+                    'bucket_start': start.isoformat(),
+                    'success': row.success_count,
+                    'failed': row.failed_count,
+                    'failures': row.failures or {},
+                    'distinct_hwids': row.distinct_hwids,
+                    'distinct_ips': row.distinct_ips
+                })
+                totals['success'] += row.success_count
+                totals['failed'] += row.failed_count
+                merge_failures(totals['failures'], row.failures or {})
+                # Distintos do intervalo: a união dos sketches, não a soma dos buckets
+                hwids = _union(hwids, row.hwid_sketch)
+                ips = _union(ips, row.ip_sketch)
+            start += PERIOD_LENGTHS[period]
+
+        totals['distinct_hwids'] = hwids.count() if hwids else 0
+        totals['distinct_ips'] = ips.count() if ips else 0
+        return {
+            'period': period,
+            'key_id': key_id or None,
+            'since': since.isoformat(),
+            'until': until.isoformat(),
+            'buckets': buckets,
+            'totals': totals
+        }
+
+    def _bucket_rows(self, period, since, until, key_id):
+        table = AnalyticsBucket
+        return db.session.execute(db.select(
+            table.bucket_start, table.success_count, table.failed_count, table.failures,
+            table.hwid_sketch, table.ip_sketch, table.distinct_hwids, table.distinct_ips
+        ).where(
+            table.period == period, table.key_id == key_id,
+            table.bucket_start >= since, table.bucket_start < until
+        ).order_by(table.bucket_start)).all()
+
+    def top_keys(self, by, period, since, until, limit=20):
+        """Keys com mais logins, falhas, HWIDs ou IPs distintos no intervalo
+
+        Logins e falhas saem prontos do SQL. Para os distintos, os candidatos vêm em ordem de um limite
+        superior (a soma das estimativas dos buckets) e os sketches só são unidos até que nenhuma key
+        restante possa entrar no ranking. Cada key está num único shard: o ranking geral é a
+        intercalação dos rankings de cada shard.
+        """
+        since = floor_time(since, period)
+        self._check_range(period, since, until)
+
+        ranked = [entry for entries in shards.scatter(self._top_keys, by, period, since, until, limit)
+                  for entry in entries]
+        if shards.count > 1:
+            field = RANKING_FIELDS[by]
+            ranked.sort(key=lambda entry: (-entry[field], entry['key_id']))
+            del ranked[limit:]
+        return {
+            'by': by,
+            'period': period,
+            'since': since.isoformat(),
+            'until': until.isoformat(),
+            'keys': ranked
+        }
+
+    def _top_keys(self, by, period, since, until, limit):
+        table = AnalyticsBucket
+        in_range = and_(table.period == period, table.key_id != ALL_KEYS,
+                        table.bucket_start >= since, table.bucket_start < until)
+        bounds = {
+            'logins': func.sum(table.success_count + table.failed_count),
+            'failed': func.sum(table.failed_count),
+            'hwids': func.sum(table.distinct_hwids),
+            'ips': func.sum(table.distinct_ips)
+        }
+        candidates = db.session.execute(
+            db.select(table.key_id, bounds[by]).where(in_range).group_by(table.key_id)
+            .order_by(desc(bounds[by]), table.key_id)
+        )
+        try:
+            if by in ('logins', 'failed'):
+                ranked = [tuple(row) for row in candidates.fetchmany(limit)]
+            else:
+                sketch = table.hwid_sketch if by == 'hwids' else table.ip_sketch
+                ranked = []
+                while True:
+                    chunk = candidates.fetchmany(max(limit, 500))
+                    if not chunk:
+                        break
+                    ranked.extend(self._distinct_counts(in_range, sketch, [row[0] for row in chunk]))
+                    ranked.sort(key=lambda item: (-item[1], item[0]))
+                    del ranked[limit:]
+                    if len(ranked) == limit and ranked[-1][1] >= chunk[-1][1]:
+                        break
+        finally:
+            candidates.close()
+
+        totals = self._key_totals(in_range, [key_id for key_id, _ in ranked])
+        return [totals[key_id] for key_id, _ in ranked]
+
+    def _distinct_counts(self, in_range, sketch, key_ids):
+        """(key_id, distintos no intervalo) pela união dos sketches de cada key"""
+        table = AnalyticsBucket
+        sketches = {}
+        for key_id, data in db.session.execute(
+            db.select(table.key_id, sketch).where(in_range, table.key_id.in_(key_ids))
+        ):
+            sketches[key_id] = _union(sketches.get(key_id), data)
+        return [(key_id, merged.count()) for key_id, merged in sketches.items()]
+
+    def _key_totals(self, in_range, key_ids):
+        table = AnalyticsBucket
+        keys = {}
+        rows = db.session.execute(db.select(
+            table.key_id, table.success_count, table.failed_count, table.hwid_sketch, table.ip_sketch
+        ).where(in_range, table.key_id.in_(key_ids)))
+        for row in rows:
+            entry = keys.get(row.key_id)
+            if entry is None:
+                entry = keys[row.key_id] = [0, 0, None, None]
+            entry[0] += row.success_count
+            entry[1] += row.failed_count
+            entry[2] = _union(entry[2], row.hwid_sketch)
+            entry[3] = _union(entry[3], row.ip_sketch)
+
+        return {key_id: {
+            'key_id': key_id,
+            'logins': success + failed,
+            'success': success,
+            'failed': failed,
+            'distinct_hwids': hwids.count(),
+            'distinct_ips': ips.count()
+        } for key_id, (success, failed, hwids, ips) in keys.items()}
+
+    def _check_range(self, period, since, until):
+        if since >= until:
+            raise ValueError('since deve ser anterior a until')
+        if (until - since) / PERIOD_LENGTHS[period] > self.max_buckets:
+            raise ValueError(f'Intervalo maior que {self.max_buckets} buckets de {period}: use um período maior')
+
+    # Manutenção
+
+    def prune(self, now=None):
+        """Remove buckets por minuto e por hora mais antigos que a retenção de cada um, em todos os shards"""
+        now = now or datetime.utcnow()
+        table = AnalyticsBucket.__table__
+        pruned = 0
+        for index in shards.indexes():
+            with shards.engine(index).begin() as connection:
+                pruned += connection.execute(table.delete().where(or_(
+                    and_(table.c.period == PERIOD_MINUTE, table.c.bucket_start < now - self.minute_retention),
+                    and_(table.c.period == PERIOD_HOUR, table.c.bucket_start < now - self.hour_retention)
+                ))).rowcount
+        return pruned
+
+    def rebuild(self):
+        """Recalcula todos os buckets a partir de access_logs (logs já arquivados ficam de fora), shard a shard"""
+        processed = 0
+        for index in shards.indexes():
+            processed += self._rebuild_shard(shards.engine(index))
+        return {'logs': processed}
+
+    def _rebuild_shard(self, engine):
+        logs = AccessLog.__table__
+        buckets = AnalyticsBucket.__table__
+
+        with engine.begin() as connection:
+            connection.execute(buckets.delete())
+            # Lido sob o lock de escrita: logs com id maior são somados pelo writer de logs
+            last_id = connection.execute(db.select(func.max(logs.c.id))).scalar() or 0
+
+        columns = (logs.c.id, logs.c.key_id, logs.c.hwid, logs.c.ip_address, logs.c.login_at,
+                   logs.c.success, logs.c.error_message)
+        cursor = 0
+        processed = 0
+        while cursor < last_id:
+            with engine.connect() as connection:
+                rows = connection.execute(
+                    db.select(*columns).where(logs.c.id > cursor, logs.c.id <= last_id)
+                    .order_by(logs.c.id).limit(self.chunk_size)
+                ).mappings().all()
+            if not rows:
+                break
+
+            deltas = self._deltas(rows)
+            with engine.begin() as connection:
+                # Escrever primeiro garante o lock de escrita antes de ler os buckets (id 0 não existe)
+                connection.execute(buckets.update().where(buckets.c.id == 0).values(id=buckets.c.id))
+                self._write(connection, deltas)
+
+            cursor = rows[-1]['id']
+            processed += len(rows)
+
+        return processed
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'precision': self.precision,
+            'key_precision': self.key_precision,
+            'minute_retention_hours': self.minute_retention.total_seconds() / 3600,
+            'hour_retention_days': self.hour_retention.days,
+            'logs_recorded': self.logs_recorded,
+            'buckets_inserted': self.buckets_inserted,
+            'buckets_updated': self.buckets_updated,
+            'failed': self.failed
+        }
+
+
+# Instância compartilhada pelo writer de logs e pelas rotas
+analytics = Analytics()
@@ -0,0 +1,249 @@
+from datetime import datetime, timedelta
+import threading
+import time
+import uuid
+from sqlalchemy import bindparam, case, func
+from src.models.key import db, Key, AccessLog, BulkJob, KeySnapshot
+from src.services.key_changes import key_changes
+from src.services.stats import stats_counters, key_flags, KEY_COLUMNS, KEY_COUNTERS
+from src.services.event_bus import event_bus
+from src.services.sharding import shards
+
+ACTIONS = ('pause', 'unpause', 'reset_hwid', 'extend', 'delete')
+MAX_JOB_KEY_IDS = 100000
+
+# Colunas regravadas pelas ações de atualização
+UPDATE_COLUMNS = ('hwid', 'expiration_days', 'first_login_at', 'expires_at', 'is_paused', 'is_used', 'expired', 'status')
+
+
+def pause(key, params):
+    key.is_paused = True
+
+
+def unpause(key, params):
+    key.is_paused = False
+
+
+def reset_hwid(key, params):
+    # Mesmo efeito de Key.reset_hwid()
+    key.hwid = None
+    key.is_used = False
+    key.first_login_at = None
+    key.expires_at = None
+
+
+def extend(key, params):
+    # expires_at continua sendo first_login_at + expiration_days
+    key.expiration_days += params['days']
+    if key.expires_at:
+        key.expires_at += timedelta(days=params['days'])
+
+
+UPDATES = {
+    'pause': pause,
+    'unpause': unpause,
+    'reset_hwid': reset_hwid,
+    'extend': extend
+}
+
+
+class BulkJobs:
+    """Operações em massa sobre keys, executadas em blocos curtos numa thread de fundo"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.chunk_size = 500
+        self.chunk_pause = 0.05
+        # Acima disso o pause-all não roda na própria requisição: responde 202 com o job
+        self.sync_max_keys = 5000
+        # Um job por vez, para não disputar o lock de escrita entre si
+        self._run_lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.chunk_size = app.config.get('BULK_JOB_CHUNK_SIZE', self.chunk_size)
+        self.chunk_pause = app.config.get('BULK_JOB_CHUNK_PAUSE', self.chunk_pause)
+        self.sync_max_keys = app.config.get('BULK_JOB_SYNC_MAX_KEYS', self.sync_max_keys)
+
+    def submit(self, action, criterion=None, key_ids=None, params=None, description=None, all_keys=False, wait=False):
+        """Registra o job e o executa em segundo plano (ou na própria requisição, com wait); alvo por
+        critério SQL ou lista de key_ids. all_keys: o alvo é a base inteira (pause-all)
+        """
+        params = params or {}
+        job = BulkJob(
+            id=uuid.uuid4().hex,
+            action=action,
+            params={**params, 'target': description},
+            status='pending'
+        )
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+
+        if self.app is None or wait:
+            # Sem init_app (scripts): executa na própria requisição, sem pausa entre os blocos
+            self.run(job_id, action, criterion, key_ids, params, all_keys, chunk_pause=0)
+        else:
+            threading.Thread(
+                target=self._run_in_context,
+                args=(job_id, action, criterion, key_ids, params, all_keys),
+                name=f'bulk-job-{job_id[:8]}',
+                daemon=True
+            ).start()
+
+        # O progresso é gravado via Core: relê o job em vez de usar o identity map da sessão
+        return db.session.get(BulkJob, job_id, populate_existing=True)
+
+    def _run_in_context(self, *args):
+        with self.app.app_context():
+            self.run(*args)
+
+    def run(self, job_id, action, criterion=None, key_ids=None, params=None, all_keys=False, chunk_pause=None):
+        """Executa o job, gravando o progresso junto com cada bloco"""
+        chunk_pause = self.chunk_pause if chunk_pause is None else chunk_pause
+        with self._run_lock:
+            table = BulkJob.__table__
+            try:
+                total = len(set(key_ids)) if key_ids is not None else self._count(criterion)
+                with db.engine.begin() as connection:
+                    connection.execute(table.update().where(table.c.id == job_id).values(
+                        status='running', total=total, started_at=datetime.utcnow()
+                    ))
+
+                processed = 0
+                for index, ids in self._chunks(criterion, key_ids):
+                    processed += self._apply(job_id, action, index, ids, criterion, params or {}, all_keys)
+                    if chunk_pause:
+                        time.sleep(chunk_pause)
+
+                with db.engine.begin() as connection:
+                    connection.execute(table.update().where(table.c.id == job_id).values(
+                        status='done', processed=processed, finished_at=datetime.utcnow()
+                    ))
+                event_bus.publish('keys', {'action': action, 'job_id': job_id, 'status': 'done', 'count': processed})
+            except Exception as e:
+                with db.engine.begin() as connection:
+                    connection.execute(table.update().where(table.c.id == job_id).values(
+                        status='failed', error=str(e), finished_at=datetime.utcnow()
+                    ))
+                # Os blocos já gravados continuam aplicados
+                event_bus.publish('keys', {'action': action, 'job_id': job_id, 'status': 'failed'})
+
+    def _count(self, criterion):
+        total = 0
+        for index in shards.indexes():
+            with shards.engine(index).connect() as connection:
+                total += connection.execute(db.select(func.count()).select_from(Key).where(criterion)).scalar()
+        return total
+
+    def _chunks(self, criterion, key_ids):
+        """Blocos (shard, ids de keys), cada um lido numa conexão curta"""
+        table = Key.__table__
+        if key_ids is not None:
+            for index, group in shards.group(sorted(set(key_ids))).items():
+                for start in range(0, len(group), self.chunk_size):
+                    with shards.engine(index).connect() as connection:
+                        ids = connection.execute(
+                            db.select(table.c.id).where(table.c.key_id.in_(group[start:start + self.chunk_size]))
+                        ).scalars().all()
+                    if ids:
+                        yield index, ids
+            return
+
+        for index in shards.indexes():
+            last_id = 0
+            while True:
+                with shards.engine(index).connect() as connection:
+                    ids = connection.execute(
+                        db.select(table.c.id).where(criterion, table.c.id > last_id)
+                        .order_by(table.c.id).limit(self.chunk_size)
+                    ).scalars().all()
+                if not ids:
+                    break
+                yield index, ids
+                last_id = ids[-1]
+
+    def _apply(self, job_id, action, index, ids, criterion, params, all_keys=False):
+        """Aplica a ação a um bloco de um shard numa única transação curta; retorna quantas keys foram alteradas"""
+        table = Key.__table__
+        now = datetime.utcnow()
+        deltas = dict.fromkeys(KEY_COUNTERS, 0)
+
+        with shards.engine(index).begin() as connection:
+            # Escrever primeiro garante o lock de escrita: o bloco é relido e alterado sem escritas concorrentes
+            connection.execute(table.update().where(table.c.id.in_(ids)).values(id=table.c.id))
+
+            query = db.select(*[table.c[column] for column in KeySnapshot.__slots__]).where(table.c.id.in_(ids))
+            if criterion is not None:
+                # A key pode ter deixado de atender ao filtro desde a leitura dos ids
+                query = query.where(criterion)
+            keys = [KeySnapshot(**row._mapping) for row in connection.execute(query)]
+            if not keys:
+                return 0
+
+            for key in keys:
+                for name, value in key_flags(_state(key)).items():
+                    deltas[name] -= value
+
+            if action == 'delete':
+                key_ids = [key.key_id for key in keys]
+                logs = AccessLog.__table__
+                total, successful, failed = connection.execute(db.select(
+                    func.count(),
+                    func.coalesce(func.sum(case((logs.c.success.is_(True), 1), else_=0)), 0),
+                    func.coalesce(func.sum(case((logs.c.success.is_(False), 1), else_=0)), 0)
+                ).where(logs.c.key_id.in_(key_ids))).one()
+                # Os logs saem junto com as keys (o cascade do ORM não vale para DELETE em massa)
+                connection.execute(logs.delete().where(logs.c.key_id.in_(key_ids)))
+                connection.execute(table.delete().where(table.c.id.in_([key.id for key in keys])))
+                deltas.update(logins_total=-total, logins_successful=-successful, logins_failed=-failed)
+            else:
+                rows = []
+                for key in keys:
+                    UPDATES[action](key, params)
+                    key.refresh_status(now)
+                    for name, value in key_flags(_state(key)).items():
+                        deltas[name] += value
+                    rows.append({'_id': key.id, **{column: getattr(key, column) for column in UPDATE_COLUMNS}})
+                connection.execute(
+                    table.update().where(table.c.id == bindparam('_id'))
+                    .values({column: bindparam(column) for column in UPDATE_COLUMNS}),
+                    rows
+                )
+
+            stats_counters.increment(connection=connection, **deltas)
+            if index == 0:
+                _add_progress(connection, job_id, len(keys))
+            # O diário do shard recebe as keys do bloco na mesma transação; com all_keys, uma linha para
+            # a base inteira a cada bloco: cada worker limpa o cache e, na pausa ou remoção, revoga
+            # todas as sessões de uma vez em vez de key por key, já a partir do primeiro bloco
+            changes = key_changes.stage(
+                action, None if all_keys else [key.key_id for key in keys], connection=connection
+            )
+
+        if index != 0:
+            # Os jobs ficam no shard 0: o progresso dos demais é gravado logo depois do bloco
+            with db.engine.begin() as connection:
+                _add_progress(connection, job_id, len(keys))
+
+        key_changes.apply(changes)
+        return len(keys)
+
+    def recent(self, limit=50):
+        return BulkJob.query.order_by(BulkJob.created_at.desc()).limit(limit).all()
+
+
+def _add_progress(connection, job_id, count):
+    jobs = BulkJob.__table__
+    connection.execute(jobs.update().where(jobs.c.id == job_id).values(processed=jobs.c.processed + count))
+
+
+def _state(key):
+    return {column: getattr(key, column) for column in KEY_COLUMNS}
+
+
+# Instância compartilhada pelas rotas de administração
+bulk_jobs = BulkJobs()
@@ -0,0 +1,138 @@
+from collections import deque
+import json
+import threading
+
+# Mensagem SSE de comentário: mantém a conexão viva e detecta clientes que saíram
+HEARTBEAT = b': heartbeat\n\n'
+
+
+def encode_event(event, data):
+    """Mensagem no formato text/event-stream"""
+    payload = json.dumps(data, separators=(',', ':'), default=str)
+    return f'event: {event}\ndata: {payload}\n\n'.encode()
+
+
+class Subscription:
+    """Fila limitada de um assinante; se ela enche, as mensagens novas são descartadas"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lagged = False
+        self.closed = False
+        self._messages = deque()
+        self._cond = threading.Condition()
+
+    def put(self, message):
+        """Retorna False se a mensagem foi descartada"""
+        with self._cond:
+            if len(self._messages) >= self.max_size:
+                # O cliente perdeu eventos: o stream reenvia o estado completo
+                self.lagged = True
+                return False
+            self._messages.append(message)
+            self._cond.notify()
+            return True
+
+    def get(self, timeout):
+        """Todas as mensagens pendentes ([] se nada chegou no prazo); None depois de close()"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._messages or self.closed, timeout=timeout)
+            if self.closed:
+                return None
+            messages = list(self._messages)
+            self._messages.clear()
+            return messages
+
+    def take_lagged(self):
+        with self._cond:
+            lagged, self.lagged = self.lagged, False
+            return lagged
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class EventBus:
+    """Publicação de eventos dentro do processo para os streams abertos (/api/admin/stream)
+
+    Cada evento é serializado uma única vez e copiado para a fila de cada assinante: N dashboards
+    abertos custam N inserções em fila, nenhuma consulta ao banco.
+    """
+
+    def __init__(self, app=None):
+        self.queue_size = 256
+        self.heartbeat_interval = 15
+        self.resync_interval = 60
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._closed = False
+
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.queue_size = app.config.get('STREAM_QUEUE_SIZE', self.queue_size)
+        self.heartbeat_interval = app.config.get('STREAM_HEARTBEAT_INTERVAL', self.heartbeat_interval)
+        self.resync_interval = app.config.get('STREAM_RESYNC_INTERVAL', self.resync_interval)
+        self._closed = False
+
+    def has_subscribers(self):
+        """Permite pular a montagem do evento quando ninguém está ouvindo"""
+        return bool(self._subscribers)
+
+    def publish(self, event, data):
+        if not self._subscribers:
+            return
+        message = encode_event(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += 1
+        delivered = sum(1 for subscription in subscribers if subscription.put(message))
+        with self._lock:
+            self.delivered += delivered
+            self.dropped += len(subscribers) - delivered
+
+    def subscribe(self):
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if self._closed:
+                subscription.close()
+            else:
+                self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+        subscription.close()
+
+    def close(self):
+        """Encerra todos os streams (shutdown do servidor) e recusa novos"""
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscription in subscribers:
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'queue_size': self.queue_size,
+                'heartbeat_interval': self.heartbeat_interval,
+                'resync_interval': self.resync_interval,
+                'published': self.published,
+                'delivered': self.delivered,
+                'dropped': self.dropped
+            }
+
+
+# Instância compartilhada pelas rotas e serviços que publicam eventos
+event_bus = EventBus()
@@ -0,0 +1,112 @@
+from datetime import datetime
+import atexit
+import os
+import threading
+from src.models.key import db, Key
+from src.services.key_changes import key_changes
+from src.services.stats import stats_counters
+from src.services.sharding import shards
+
+
+class ExpirySweeper:
+    """Marca periodicamente como expiradas as keys cujo expires_at já passou"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 60
+        self.chunk_size = 1000
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+        self.last_run = None
+        self.keys_expired = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('EXPIRY_SWEEP_INTERVAL', self.interval)
+        self.chunk_size = app.config.get('EXPIRY_SWEEP_CHUNK_SIZE', self.chunk_size)
+        atexit.register(self.stop)
+
+    def sweep(self, now=None):
+        """Atualiza expired/status em blocos curtos, shard a shard; retorna quantas keys expiraram"""
+        now = now or datetime.utcnow()
+        table = Key.__table__
+        pending = table.c.expired.is_(False) & (table.c.expires_at < now)
+        swept = 0
+
+        with self._lock:
+            for index in shards.indexes():
+                engine = shards.engine(index)
+                while True:
+                    with engine.connect() as connection:
+                        rows = connection.execute(
+                            db.select(table.c.id, table.c.key_id).where(pending).limit(self.chunk_size)
+                        ).all()
+
+                    if not rows:
+                        break
+
+                    ids = [row.id for row in rows]
+                    values = {'expired': True, 'status': Key.status_expression(expired=True)}
+                    with engine.begin() as connection:
+                        # As keys disponíveis são atualizadas primeiro para contar a transição sob o lock de escrita
+                        available = connection.execute(table.update().where(
+                            table.c.id.in_(ids), pending, table.c.status == 'available'
+                        ).values(**values)).rowcount
+                        others = connection.execute(table.update().where(
+                            table.c.id.in_(ids), pending
+                        ).values(**values)).rowcount
+                        stats_counters.increment(
+                            connection=connection,
+                            keys_expired=available + others,
+                            keys_available=-available
+                        )
+                        changes = key_changes.stage('expire', [row.key_id for row in rows], connection=connection)
+
+                    key_changes.apply(changes)
+
+                    swept += available + others
+                    if len(rows) < self.chunk_size:
+                        break
+
+            self.last_run = now
+            self.keys_expired += swept
+            return swept
+
+    def status(self):
+        return {
+            'interval': self.interval,
+            'last_run': self.last_run.isoformat() if self.last_run else None,
+            'keys_expired': self.keys_expired
+        }
+
+    def start(self):
+        """Inicia a varredura periódica numa thread de fundo (uma por processo)"""
+        if self.app is None or (self._thread is not None and self._pid == os.getpid()):
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='expiry-sweeper', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    self.sweep()
+            except Exception:
+                # Tenta novamente no próximo ciclo
+                pass
+
+    def stop(self):
+        self._stop.set()
+
+
+# Instância compartilhada pela aplicação
+expiry_sweeper = ExpirySweeper()
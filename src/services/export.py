@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+import zlib
+from src.models.key import db, Key, AccessLog, KeySnapshot
+from src.services.sharding import shards
+
+FORMATS = ('csv', 'ndjson')
+BATCH_SIZE = 5000
+
+KEY_FIELDS = ('id', 'key_id', 'hwid', 'expiration_days', 'created_at', 'first_login_at', 'expires_at',
+              'is_active', 'is_paused', 'is_used', 'is_expired', 'status')
+LOG_FIELDS = ('id', 'key_id', 'hwid', 'ip_address', 'user_agent', 'login_at', 'success', 'error_message')
+
+
+def iter_batches(query, id_column, columns, batch_size=BATCH_SIZE):
+    """Percorre a consulta em blocos por id, cada bloco numa leitura curta e independente"""
+    last_id = 0
+    while True:
+        rows = query.filter(id_column > last_id).order_by(id_column).with_entities(*columns).limit(batch_size).all()
+        # Encerra a transação de leitura entre blocos para não segurar o banco durante toda a exportação
+        db.session.rollback()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def key_rows(query, batch_size=BATCH_SIZE):
+    columns = [getattr(Key, column) for column in KeySnapshot.__slots__]
+    for rows in iter_batches(query, Key.id, columns, batch_size):
+        yield [KeySnapshot(**row._mapping).to_dict() for row in rows]
+
+
+def log_rows(query, batch_size=BATCH_SIZE):
+    columns = [getattr(AccessLog, column) for column in LOG_FIELDS]
+    for rows in iter_batches(query, AccessLog.id, columns, batch_size):
+        yield [{
+            **row._mapping,
+            'login_at': row.login_at.isoformat() if row.login_at else None
+        } for row in rows]
+
+
+def shard_batches(rows, query):
+    """Blocos de rows(query) em cada shard, um shard após o outro"""
+    for index in shards.indexes():
+        with shards.scope(index):
+            yield from rows(query)
+
+
+def encode_batches(batches, fields, output_format):
+    """Converte blocos de dicionários em blocos de texto CSV ou NDJSON"""
+    if output_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, lineterminator='\n')
+        writer.writeheader()
+        yield buffer.getvalue()
+        for batch in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(batch)
+            yield buffer.getvalue()
+    else:
+        for batch in batches:
+            yield ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in batch)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import secrets
+import threading
+from src.models.key import db, KeyAllocatorState
+
+KEY_SPACE = 10 ** 8
+HALF_SPACE = 10 ** 4
+ROUNDS = 8
+BLOCK_SIZE = 1000
+
+
+class KeyPermutation:
+    """Permutação com chave do espaço de 8 dígitos (rede de Feistel sobre duas metades de 4 dígitos)"""
+
+    def __init__(self, secret):
+        # Cada metade tem só 10^4 valores, então a função de rodada é pré-calculada em tabelas
+        key = bytes.fromhex(secret)
+        self._rounds = [
+            [int.from_bytes(hashlib.blake2b(f'{round_number}:{value}'.encode(), key=key, digest_size=8).digest(), 'big') % HALF_SPACE
+             for value in range(HALF_SPACE)]
+            for round_number in range(ROUNDS)
+        ]
+
+    def permute(self, index):
+        left, right = divmod(index, HALF_SPACE)
+        for table in self._rounds:
+            left, right = right, (left + table[right]) % HALF_SPACE
+        return left * HALF_SPACE + right
+
+    def invert(self, value):
+        left, right = divmod(value, HALF_SPACE)
+        for table in reversed(self._rounds):
+            left, right = (right - table[left]) % HALF_SPACE, left
+        return left * HALF_SPACE + right
+
+
+class KeyAllocator:
+    """Aloca key_ids únicos sem consultar o banco: cada índice do contador persistido vira uma key distinta"""
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._permutation = None
+        self._secret = None
+        self._next = 0
+        self._end = 0
+        self._pid = None
+
+    def allocate(self, quantity):
+        """Retorna quantity key_ids novos"""
+        with self._lock:
+            # Após um fork o bloco reservado pertence ao processo pai
+            if self._pid != os.getpid():
+                self._next = self._end = 0
+                self._pid = os.getpid()
+
+            key_ids = []
+            while len(key_ids) < quantity:
+                if self._next >= self._end:
+                    self._reserve(max(self.block_size, quantity - len(key_ids)))
+
+                count = min(quantity - len(key_ids), self._end - self._next)
+                permute = self._permutation.permute
+                key_ids.extend(f'{permute(index):08d}' for index in range(self._next, self._next + count))
+                self._next += count
+
+            return key_ids
+
+    def _reserve(self, size):
+        """Reserva um bloco de índices no contador persistido, numa transação própria"""
+        table = KeyAllocatorState.__table__
+
+        with db.engine.begin() as connection:
+            state = connection.execute(db.select(table).where(table.c.id == 1)).first()
+            if state is None:
+                connection.execute(table.insert().prefix_with('OR IGNORE'),
+                                   {'id': 1, 'secret': secrets.token_hex(32), 'next_index': 0})
+
+            connection.execute(table.update().where(table.c.id == 1).values(next_index=table.c.next_index + size))
+            state = connection.execute(db.select(table).where(table.c.id == 1)).first()
+
+        end = min(state.next_index, KEY_SPACE)
+        start = state.next_index - size
+        if start >= KEY_SPACE:
+            raise ValueError('Espaço de keys de 8 dígitos esgotado')
+
+        if state.secret != self._secret:
+            self._permutation = KeyPermutation(state.secret)
+            self._secret = state.secret
+
+        self._next, self._end = start, end
+
+    def reset(self):
+        """Descarta o bloco reservado e o segredo em memória"""
+        with self._lock:
+            self._permutation = None
+            self._secret = None
+            self._next = self._end = 0
+
+
+# Instância compartilhada pela criação de keys
+key_allocator = KeyAllocator()
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class KeyCache:
+    """Cache LRU com TTL do estado das keys, indexado por key_id
+
+    Quem lê a key no banco pega generation() antes da leitura e a passa a set(): se uma invalidação
+    aconteceu no meio, o snapshot lido pode ser anterior a ela e não é armazenado.
+    """
+
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Incrementada a cada invalidate/clear
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+
+    def get(self, key_id):
+        """Retorna o snapshot da key ou None se ausente/expirado"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key_id)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            if now - stored_at > self.ttl:
+                del self._entries[key_id]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key_id)
+            self.hits += 1
+            return value
+
+    def generation(self):
+        """Marcador a pegar antes de ler a key no banco"""
+        with self._lock:
+            return self._generation
+
+    def set(self, key_id, value, generation=None):
+        """Armazena o snapshot da key, removendo a entrada menos usada se necessário
+
+        Com generation, descarta o snapshot se houve invalidação desde aquele marcador.
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self.stale_sets += 1
+                return
+            self._entries[key_id] = (time.monotonic(), value)
+            self._entries.move_to_end(key_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key_id):
+        """Remove uma key do cache"""
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(key_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """Remove todas as keys do cache"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale_sets': self.stale_sets,
+                'hit_rate': round((self.hits / lookups * 100) if lookups > 0 else 0, 2)
+            }
+
+
+# Instância compartilhada pelas rotas de autenticação e administração
+key_cache = KeyCache()
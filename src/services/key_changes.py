@@ -0,0 +1,203 @@
+from datetime import datetime, timedelta, timezone
+import atexit
+import os
+import threading
+import time
+from sqlalchemy import func
+from src.models.key import db, KeyChange
+from src.services.key_cache import key_cache
+from src.services.key_membership import key_membership
+from src.services.session_tokens import session_tokens
+from src.services.sharding import shards
+
+# Ações que encerram as sessões abertas da key (tokens de /api/heartbeat)
+REVOKING_ACTIONS = frozenset(('reset_hwid', 'pause', 'delete', 'delete_all'))
+
+
+class KeyChanges:
+    """Diário compartilhado das alterações de keys: leva a invalidação do cache, a revogação dos
+    tokens de sessão e as keys criadas ou apagadas (filtro de existência) a todos os processos
+
+    Cada escrita que muda o estado de uma key grava uma linha em key_changes no shard da key, na
+    mesma transação da alteração (stage), e a aplica neste processo depois do commit (apply); uma
+    thread por processo lê a cada sync_interval segundos as linhas gravadas pelos outros workers.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.sync_interval = 1.0
+        self.retention = 86400
+        self._lock = threading.Lock()
+        # Uma leitura do diário por vez (thread periódica e keys ausentes do filtro)
+        self._sync_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        # Maior id de key_changes já aplicado neste processo, por shard
+        self._last_ids = [0]
+        self._pruned_at = 0.0
+
+        self.recorded = 0
+        self.applied = 0
+        self.syncs = 0
+        self.synced_at = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Chamar depois de criar as tabelas: as alterações anteriores à inicialização não afetam nada"""
+        self.app = app
+        self.sync_interval = app.config.get('KEY_CHANGES_SYNC_INTERVAL', self.sync_interval)
+        self.retention = app.config.get('KEY_CHANGES_RETENTION', self.retention)
+        with app.app_context():
+            self._last_ids = []
+            for index in shards.indexes():
+                with shards.engine(index).connect() as connection:
+                    self._last_ids.append(connection.execute(db.select(func.max(KeyChange.id))).scalar() or 0)
+        atexit.register(self.stop)
+
+    @staticmethod
+    def _rows(action, key_ids):
+        now = datetime.utcnow()
+        if key_ids is None:
+            return [{'key_id': None, 'action': action, 'changed_at': now}]
+        return [{'key_id': key_id, 'action': action, 'changed_at': now} for key_id in key_ids]
+
+    def stage(self, action, key_ids=None, connection=None, shard=None):
+        """Grava a alteração na transação em andamento: em connection ou, sem ela, no db.session do
+        shard (as keys precisam estar nele); retorna as linhas, a aplicar com apply() após o commit"""
+        rows = self._rows(action, key_ids)
+        if rows:
+            if connection is not None:
+                connection.execute(KeyChange.__table__.insert(), rows)
+            else:
+                db.session.execute(KeyChange.__table__.insert(), rows, bind_arguments={'shard': shard})
+        return rows
+
+    def apply(self, rows):
+        """Aplica neste processo as linhas gravadas por stage(), depois do commit"""
+        if not rows:
+            return
+        with self._lock:
+            self.recorded += len(rows)
+        self._apply(rows)
+
+    def record(self, action, key_ids=None):
+        """Registra a alteração das keys (None: todas) numa transação própria e a aplica neste processo"""
+        groups = {0: None} if key_ids is None else shards.group(key_ids)
+        rows = []
+        for index, group in groups.items():
+            with shards.engine(index).begin() as connection:
+                rows.extend(self.stage(action, group, connection=connection))
+        self.apply(rows)
+
+    def sync(self):
+        """Aplica as alterações gravadas desde a última leitura; retorna quantas foram lidas"""
+        table = KeyChange.__table__
+        count = 0
+        with self._sync_lock:
+            for index in shards.indexes():
+                with shards.engine(index).connect() as connection:
+                    rows = connection.execute(
+                        db.select(table).where(table.c.id > self._last_ids[index]).order_by(table.c.id)
+                    ).all()
+
+                if rows:
+                    # As gravadas por este processo já foram aplicadas; aplicar de novo, em ordem, não muda nada
+                    self._last_ids[index] = rows[-1].id
+                    self._apply([row._mapping for row in rows])
+                    count += len(rows)
+
+        # Linhas antigas já foram lidas por todos os processos ativos
+        if time.monotonic() - self._pruned_at > 60:
+            self._pruned_at = time.monotonic()
+            cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+            for index in shards.indexes():
+                with shards.engine(index).begin() as connection:
+                    connection.execute(table.delete().where(table.c.changed_at < cutoff))
+
+        with self._lock:
+            self.syncs += 1
+            self.synced_at = datetime.utcnow()
+        return count
+
+    def _apply(self, rows):
+        # Revogações agrupadas pelo instante, aplicadas de uma vez por grupo
+        revoked = {}
+        created = []
+        for row in rows:
+            if row['action'] == 'create':
+                created.append(row['key_id'])
+                continue
+            if created:
+                # Keys criadas entram no filtro antes de uma remoção posterior a elas
+                key_membership.add_many(created)
+                created = []
+
+            if row['key_id'] is None:
+                key_cache.clear()
+            else:
+                key_cache.invalidate(row['key_id'])
+
+            if row['action'] in ('delete', 'delete_all'):
+                if row['key_id'] is None:
+                    # Cada shard grava a sua linha e os diários não têm ordem entre si: em vez de
+                    # zerar o filtro (e perder keys criadas em outro shard), ele é reconstruído
+                    key_membership.expire()
+                else:
+                    key_membership.discard(row['key_id'])
+
+            if row['action'] in REVOKING_ACTIONS:
+                # Um worker que ainda não tinha lido a alteração pode ter emitido tokens pelo estado
+                # antigo até a sua próxima leitura: esses também são revogados
+                revoked_at = row['changed_at'].replace(tzinfo=timezone.utc).timestamp() + 2 * self.sync_interval
+                if row['key_id'] is None:
+                    session_tokens.revoke_all(revoked_at)
+                else:
+                    revoked.setdefault(revoked_at, []).append(row['key_id'])
+
+        key_membership.add_many(created)
+        for revoked_at, key_ids in revoked.items():
+            session_tokens.revoke_many(key_ids, revoked_at)
+        with self._lock:
+            self.applied += len(rows)
+
+    def ensure_started(self):
+        """Inicia a leitura periódica do diário neste processo (após um fork, a thread do pai não existe)"""
+        if self.app is None or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='key-changes', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.sync_interval):
+            try:
+                with self.app.app_context():
+                    self.sync()
+            except Exception:
+                # Tenta novamente no próximo ciclo
+                pass
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sync_interval': self.sync_interval,
+                'last_ids': list(self._last_ids),
+                'recorded': self.recorded,
+                'applied': self.applied,
+                'syncs': self.syncs,
+                'synced_at': self.synced_at.isoformat() if self.synced_at else None
+            }
+
+
+# Instância compartilhada pelas rotas, pelos jobs e pela varredura de expiração
+key_changes = KeyChanges()
@@ -0,0 +1,148 @@
+import threading
+import time
+from src.models.key import db, Key
+from src.services.sharding import shards
+
+KEY_SPACE = 10 ** 8
+
+
+class KeyMembership:
+    """Bitmap de todos os key_id existentes (1 bit por key do espaço de 8 dígitos, 12,5 MB)
+
+    As keys criadas e apagadas por qualquer processo chegam pelo diário key_changes; os ids das
+    linhas de keys não servem de marcador, pois o SQLite os reaproveita depois de remoções.
+    """
+
+    def __init__(self, app=None):
+        self.sync_interval = 1.0
+        self.rebuild_interval = 300
+        self._bits = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        # Keys adicionadas durante uma reconstrução, reaplicadas sobre o bitmap novo
+        self._pending = None
+        self._synced_at = 0.0
+        self._built_at = 0.0
+
+        self.size = 0
+        self.rejected = 0
+        self.syncs = 0
+        self.rebuilds = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Monta o bitmap na inicialização"""
+        self.sync_interval = app.config.get('KEY_MEMBERSHIP_SYNC_INTERVAL', self.sync_interval)
+        self.rebuild_interval = app.config.get('KEY_MEMBERSHIP_REBUILD_INTERVAL', self.rebuild_interval)
+        with app.app_context():
+            self.rebuild()
+
+    def rebuild(self):
+        """Recarrega o bitmap a partir da tabela keys de todos os shards"""
+        bits = bytearray(KEY_SPACE // 8)
+        size = 0
+        with self._lock:
+            self._pending = []
+
+        try:
+            for index in shards.indexes():
+                with shards.engine(index).connect() as connection:
+                    for key_id in connection.execute(db.select(Key.key_id)).scalars():
+                        value = int(key_id)
+                        bits[value >> 3] |= 1 << (value & 7)
+                        size += 1
+
+            with self._lock:
+                # Criadas depois da leitura do seu shard
+                for key_id in self._pending:
+                    value = int(key_id)
+                    if not bits[value >> 3] & (1 << (value & 7)):
+                        bits[value >> 3] |= 1 << (value & 7)
+                        size += 1
+                self._bits = bits
+                self.size = size
+                self._synced_at = self._built_at = time.monotonic()
+                self.rebuilds += 1
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _sync(self):
+        """Lê agora o diário de alterações: a key pode ter sido criada por outro processo há pouco"""
+        from src.services.key_changes import key_changes
+        key_changes.sync()
+        with self._lock:
+            self._synced_at = time.monotonic()
+            self.syncs += 1
+
+    def might_exist(self, key_id):
+        """False somente quando a key com certeza não existe"""
+        if self._bits is None:
+            self.rebuild()
+
+        if self._test(key_id):
+            return True
+
+        # No máximo uma sincronização por intervalo, mesmo sob varredura de keys inexistentes
+        with self._sync_lock:
+            now = time.monotonic()
+            if now - self._built_at > self.rebuild_interval:
+                self.rebuild()
+            elif now - self._synced_at > self.sync_interval:
+                self._sync()
+
+        return self._test(key_id)
+
+    def reject(self):
+        """Conta uma tentativa com key inexistente, sem gravar log individual"""
+        with self._lock:
+            self.rejected += 1
+
+    def add_many(self, key_ids):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(key_ids)
+            if self._bits is None:
+                return
+            for key_id in key_ids:
+                self._set(key_id)
+
+    def discard(self, key_id):
+        if self._bits is None:
+            return
+        with self._lock:
+            value = int(key_id)
+            if self._bits[value >> 3] & (1 << (value & 7)):
+                self._bits[value >> 3] &= ~(1 << (value & 7)) & 0xFF
+                self.size -= 1
+
+    def expire(self):
+        """Reconstrói o bitmap na próxima key ausente; até lá, as keys apagadas são falsos positivos"""
+        with self._lock:
+            self._built_at = 0.0
+
+    def _set(self, key_id):
+        value = int(key_id)
+        if not self._bits[value >> 3] & (1 << (value & 7)):
+            self._bits[value >> 3] |= 1 << (value & 7)
+            self.size += 1
+
+    def _test(self, key_id):
+        value = int(key_id)
+        return bool(self._bits[value >> 3] & (1 << (value & 7)))
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'rejected': self.rejected,
+            'syncs': self.syncs,
+            'rebuilds': self.rebuilds,
+            'sync_interval': self.sync_interval,
+            'rebuild_interval': self.rebuild_interval
+        }
+
+
+# Instância compartilhada pelas rotas de autenticação e administração
+key_membership = KeyMembership()
@@ -0,0 +1,69 @@
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from src.models.key import db, Key
+from src.services.key_allocator import key_allocator
+from src.services.key_changes import key_changes
+from src.services.stats import stats_counters
+from src.services.sharding import shards
+
+MAX_BULK_QUANTITY = 500000
+CHUNK_SIZE = 5000
+
+
+def insert_keys(key_ids, expiration_days, created_at=None, chunk_size=CHUNK_SIZE):
+    """Insere as keys em blocos, com um commit por bloco (e por shard) para liberar o lock de escrita entre eles"""
+    created_at = created_at or datetime.utcnow()
+    table = Key.__table__
+
+    for start in range(0, len(key_ids), chunk_size):
+        chunk = key_ids[start:start + chunk_size]
+        # Keys do bloco ainda não gravadas
+        pending = chunk
+
+        for _ in range(3):
+            conflicts = []
+            for index, group in shards.group(pending).items():
+                rows = [{
+                    'key_id': key_id,
+                    'expiration_days': expiration_days,
+                    'created_at': created_at,
+                    'is_active': True,
+                    'is_paused': False,
+                    'is_used': False,
+                    'expired': False,
+                    'status': 'available'
+                } for key_id in group]
+                with shards.scope(index):
+                    try:
+                        db.session.execute(table.insert(), rows)
+                        stats_counters.increment(keys_total=len(rows), keys_active=len(rows), keys_available=len(rows))
+                        # Leva as keys novas ao filtro de existência de todos os processos
+                        changes = key_changes.stage('create', group, shard=index)
+                        db.session.commit()
+                        key_changes.apply(changes)
+                    except IntegrityError:
+                        # Só acontece com keys antigas, criadas antes do alocador por permutação
+                        db.session.rollback()
+                        existing = set(db.session.execute(
+                            db.select(Key.key_id).where(Key.key_id.in_(group))
+                        ).scalars())
+                        conflicts.append((group, existing))
+
+            if not conflicts:
+                break
+
+            existing = sorted(set().union(*[found for _, found in conflicts]))
+            replacements = dict(zip(existing, key_allocator.allocate(len(existing))))
+            pending = [replacements.get(key_id, key_id) for group, _ in conflicts for key_id in group]
+            chunk = [replacements.get(key_id, key_id) for key_id in chunk]
+            key_ids[start:start + len(chunk)] = chunk
+        else:
+            raise RuntimeError('Não foi possível gerar keys únicas após 3 tentativas')
+
+    return key_ids
+
+
+def mint_keys(quantity, expiration_days, chunk_size=CHUNK_SIZE):
+    """Cria quantity keys novas e retorna a lista de key_ids"""
+    key_ids = key_allocator.allocate(quantity)
+    return insert_keys(key_ids, expiration_days, chunk_size=chunk_size)
@@ -0,0 +1,59 @@
+from sqlalchemy import and_
+from src.models.key import db, Key, AccessLog
+from src.models.schema import table_exists
+
+KEY_LENGTH = 8
+# Menor termo que o índice trigram consegue atender
+MIN_TRIGRAM_LENGTH = 3
+
+MATCH_SUBSTRING = 'substring'
+MATCH_PREFIX = 'prefix'
+
+_fts_available = {}
+
+
+def fts_available():
+    """Verifica (uma vez por banco) se o índice keys_fts existe"""
+    url = str(db.engine.url)
+    if url not in _fts_available:
+        _fts_available[url] = table_exists('keys_fts')
+    return _fts_available[url]
+
+
+def prefix_filter(column, prefix):
+    """Busca por prefixo como intervalo, atendida pelo índice B-tree da coluna"""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(column >= prefix, column < upper)
+
+
+def substring_filter(term):
+    """Filtro das keys cujo key_id contém term, pelo índice trigram quando possível"""
+    if len(term) >= MIN_TRIGRAM_LENGTH and fts_available():
+        quoted = '"' + term.replace('"', '""') + '"'
+        matches = db.select(db.literal_column('rowid')).select_from(db.table('keys_fts')).where(
+            db.text('keys_fts MATCH :term').bindparams(term=quoted)
+        )
+        return Key.id.in_(matches)
+    return Key.key_id.like(f'%{term}%')
+
+
+def key_search_filter(term, match=MATCH_SUBSTRING):
+    """Filtro de Key.key_id: exato para keys completas, prefixo pelo B-tree ou substring pelo índice trigram"""
+    if len(term) == KEY_LENGTH:
+        return Key.key_id == term
+    if match == MATCH_PREFIX:
+        return prefix_filter(Key.key_id, term)
+    return substring_filter(term)
+
+
+def log_key_filter(term, match=MATCH_SUBSTRING):
+    """Filtro de AccessLog.key_id, sempre sobre a própria coluna dos logs
+
+    Os logs de keys apagadas (ou que nunca existiram) continuam na tabela: a busca por substring não
+    passa pela tabela keys nem pelo índice trigram, que só cobre as keys existentes.
+    """
+    if len(term) == KEY_LENGTH:
+        return AccessLog.key_id == term
+    if match == MATCH_PREFIX:
+        return prefix_filter(AccessLog.key_id, term)
+    return AccessLog.key_id.like(f'%{term}%')
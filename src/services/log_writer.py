@@ -0,0 +1,236 @@
+from collections import deque
+from datetime import datetime
+import atexit
+import os
+import threading
+from src.models.key import db, AccessLog
+from src.services.stats import stats_counters
+from src.services.event_bus import event_bus
+from src.services.analytics import analytics
+from src.services.sharding import shards
+
+# Políticas quando a fila está cheia
+POLICY_BLOCK = 'block'
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_SAMPLE = 'sample'
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_SAMPLE)
+
+# Logs mais recentes de cada lote enviados ao stream (o dashboard mostra 50 por página)
+STREAM_LOGS = 50
+
+
+def publish_logs(records):
+    """Envia aos dashboards os logs já gravados"""
+    if not event_bus.has_subscribers():
+        return
+    logs = [dict(record, login_at=record['login_at'].isoformat()) for record in records[-STREAM_LOGS:]]
+    event_bus.publish('logs', {'count': len(records), 'logs': logs[::-1]})
+
+
+class AccessLogWriter:
+    """Grava os logs de acesso em lotes numa thread de fundo, fora do caminho do login"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.batch_size = 500
+        self.flush_interval = 0.5
+        self.max_queue = 50000
+        self.policy = POLICY_DROP_OLDEST
+        self.sample_rate = 10
+        self.block_timeout = 1.0
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._overflow = 0
+        self._in_flight = 0
+        self._flush_requested = False
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Lê a configuração da aplicação e registra o flush no encerramento"""
+        self.app = app
+        self.batch_size = app.config.get('LOG_WRITER_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('LOG_WRITER_FLUSH_INTERVAL', self.flush_interval)
+        self.max_queue = app.config.get('LOG_WRITER_MAX_QUEUE', self.max_queue)
+        self.policy = app.config.get('LOG_WRITER_POLICY', self.policy)
+        self.sample_rate = app.config.get('LOG_WRITER_SAMPLE_RATE', self.sample_rate)
+        self.block_timeout = app.config.get('LOG_WRITER_BLOCK_TIMEOUT', self.block_timeout)
+
+        if self.policy not in POLICIES:
+            raise ValueError(f'Política de fila inválida: {self.policy}')
+
+        atexit.register(self.stop)
+
+    def submit(self, key_id, hwid, ip_address=None, user_agent=None, success=True, error_message=None):
+        """Enfileira um log de acesso; grava direto no banco se o writer não foi configurado"""
+        record = {
+            'key_id': key_id,
+            'hwid': hwid,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'login_at': datetime.utcnow(),
+            'success': success,
+            'error_message': error_message
+        }
+
+        if self.app is None:
+            with shards.for_key(key_id):
+                db.session.add(AccessLog(**record))
+                db.session.flush()
+                analytics.record(db.session.connection(bind_arguments={'shard': shards.current()}), [record])
+                db.session.commit()
+            publish_logs([record])
+            return
+
+        self._ensure_started()
+
+        with self._cond:
+            if len(self._queue) >= self.max_queue and not self._make_room():
+                self.dropped += 1
+                return
+
+            self._queue.append(record)
+            self.enqueued += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _make_room(self):
+        """Aplica a política de backpressure; retorna False se o registro novo deve ser descartado"""
+        if self.policy == POLICY_BLOCK:
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: len(self._queue) < self.max_queue, timeout=self.block_timeout)
+
+        if self.policy == POLICY_SAMPLE:
+            # Com a fila cheia, apenas 1 a cada sample_rate registros novos entra
+            self._overflow += 1
+            if self._overflow % self.sample_rate != 0:
+                return False
+
+        self._queue.popleft()
+        self.dropped += 1
+        return True
+
+    def _ensure_started(self):
+        # Após um fork a thread do processo pai não existe no filho
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='access-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._stopping)
+                if not self._stopping:
+                    self._cond.wait_for(
+                        lambda: len(self._queue) >= self.batch_size or self._stopping or self._flush_requested,
+                        timeout=self.flush_interval
+                    )
+
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._in_flight = len(batch)
+                if not self._queue:
+                    self._flush_requested = False
+                stopping = self._stopping
+                self._cond.notify_all()
+
+            if batch:
+                self._write(batch)
+            elif stopping:
+                return
+
+    def _write(self, batch):
+        """Insere o lote com um único executemany por shard"""
+        written = []
+        try:
+            with self.app.app_context():
+                for index, records in self._by_shard(batch).items():
+                    with shards.engine(index).begin() as connection:
+                        connection.execute(AccessLog.__table__.insert(), records)
+                        successful = sum(1 for record in records if record['success'])
+                        stats_counters.increment(
+                            connection=connection,
+                            logins_total=len(records),
+                            logins_successful=successful,
+                            logins_failed=len(records) - successful
+                        )
+                        analytics.record(connection, records)
+                    written.extend(records)
+                    with self._cond:
+                        self.written += len(records)
+            with self._cond:
+                self.batches += 1
+        except Exception:
+            # Os shards já gravados ficam; só os logs restantes do lote são perdidos
+            with self._cond:
+                self.failed += len(batch) - len(written)
+        finally:
+            if written:
+                # Na ordem de chegada (written está agrupado por shard)
+                publish_logs(batch if len(written) == len(batch) else written)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _by_shard(self, batch):
+        if shards.count == 1:
+            return {0: batch}
+        groups = {}
+        for record in batch:
+            groups.setdefault(shards.index_for(record['key_id']), []).append(record)
+        return groups
+
+    def flush(self, timeout=5.0):
+        """Aguarda até que a fila atual seja gravada"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: not self._queue and not self._in_flight, timeout=timeout)
+
+    def stop(self, timeout=5.0):
+        """Grava o que resta na fila e encerra a thread"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        with self._cond:
+            return {
+                'queue_depth': len(self._queue),
+                'max_queue': self.max_queue,
+                'policy': self.policy,
+                'batch_size': self.batch_size,
+                'flush_interval': self.flush_interval,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches
+            }
+
+
+# Instância compartilhada pelas rotas de autenticação
+log_writer = AccessLogWriter()
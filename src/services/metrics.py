@@ -0,0 +1,304 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+import threading
+import time
+from flask import Response, request
+from sqlalchemy import event
+from src.models.key import db
+from src.services.storage import storage, WRITE_PREFIXES
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+# Rótulo das consultas feitas fora de requisições (threads de fundo)
+BACKGROUND = '(background)'
+
+# Comandos SQL da requisição atual; as threads de shards.scatter herdam o contexto (copy_context)
+_request_sql = ContextVar('metrics_request_sql', default=None)
+
+
+def new_histogram(buckets):
+    # Contagem por bucket (não cumulativa), +Inf e soma
+    return [0] * (len(buckets) + 1) + [0.0]
+
+
+def observe(histogram, buckets, value):
+    histogram[bisect_left(buckets, value)] += 1
+    histogram[-1] += value
+
+
+class ThreadMetrics:
+    """Métricas acumuladas por uma única thread, sem lock"""
+
+    def __init__(self):
+        self.requests = {}
+        self.latency = {}
+        self.sql_per_request = {}
+        self.sql_totals = {}
+        self.lock_wait = new_histogram(LATENCY_BUCKETS)
+        self.lock_errors = 0
+
+    def merge(self, other):
+        """Soma as métricas de other; list() copia os dicionários que a outra thread pode estar alterando"""
+        for labels, value in list(other.requests.items()):
+            self.requests[labels] = self.requests.get(labels, 0) + value
+        for name in ('latency', 'sql_per_request', 'sql_totals'):
+            target = getattr(self, name)
+            for labels, values in list(getattr(other, name).items()):
+                current = target.setdefault(labels, [0] * len(values))
+                for index, value in enumerate(list(values)):
+                    current[index] += value
+        for index, value in enumerate(list(other.lock_wait)):
+            self.lock_wait[index] += value
+        self.lock_errors += other.lock_errors
+
+
+class RequestSQL:
+    """Contagem e tempo de SQL de uma requisição, somados também pelas threads do scatter"""
+
+    __slots__ = ('count', 'time', 'lock')
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, elapsed):
+        with self.lock:
+            self.count += 1
+            self.time += elapsed
+
+
+class Metrics:
+    """Latência por endpoint, status HTTP, SQL por requisição e espera de lock do SQLite em formato Prometheus"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (thread, métricas) de cada thread que já registrou algo
+        self._threads = []
+        # Métricas das threads que já terminaram
+        self._retired = ThreadMetrics()
+        self._engines = set()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics', self.render_response)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                self.instrument_engine(engine)
+            for engine in storage.readers():
+                self.instrument_engine(engine)
+
+    def instrument_engine(self, engine):
+        if engine in self._engines:
+            return
+        self._engines.add(engine)
+        # Primeiro da fila: o tempo medido inclui a espera pelo escritor único (services/storage.py)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute, insert=True)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'commit', self._end_transaction)
+        event.listen(engine, 'rollback', self._end_transaction)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def _metrics(self):
+        metrics = getattr(self._local, 'metrics', None)
+        if metrics is None:
+            metrics = self._local.metrics = ThreadMetrics()
+            with self._lock:
+                # Threads novas surgem enquanto outras terminam (pools, um thread por requisição):
+                # consolida as encerradas aqui, e não só quando /metrics é lido
+                self._retire_finished()
+                self._threads.append((threading.current_thread(), metrics))
+        return metrics
+
+    def _retire_finished(self):
+        """Move para _retired as métricas das threads encerradas (chamar com _lock)"""
+        alive = []
+        for thread, metrics in self._threads:
+            if thread.is_alive():
+                alive.append((thread, metrics))
+            else:
+                # A thread terminou e não escreve mais: consolida uma única vez
+                self._retired.merge(metrics)
+        self._threads = alive
+
+    # Requisições
+
+    def _before_request(self):
+        self._local.started = time.perf_counter()
+        _request_sql.set(RequestSQL())
+
+    def _after_request(self, response):
+        self._record(response.status_code)
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request não roda quando a requisição termina com exceção não tratada
+        if exc is not None:
+            self._record(500)
+
+    def _record(self, status):
+        local = self._local
+        started = getattr(local, 'started', None)
+        if started is None:
+            return
+        local.started = None
+
+        elapsed = time.perf_counter() - started
+        sql = _request_sql.get() or RequestSQL()
+        _request_sql.set(None)
+        endpoint = request.endpoint or '(unmatched)'
+        method = request.method
+        metrics = self._metrics()
+
+        key = (endpoint, method, str(status))
+        metrics.requests[key] = metrics.requests.get(key, 0) + 1
+
+        histogram = metrics.latency.get((endpoint, method))
+        if histogram is None:
+            histogram = metrics.latency[(endpoint, method)] = new_histogram(LATENCY_BUCKETS)
+        observe(histogram, LATENCY_BUCKETS, elapsed)
+
+        histogram = metrics.sql_per_request.get((endpoint,))
+        if histogram is None:
+            histogram = metrics.sql_per_request[(endpoint,)] = new_histogram(SQL_COUNT_BUCKETS)
+        observe(histogram, SQL_COUNT_BUCKETS, sql.count)
+
+        totals = metrics.sql_totals.setdefault((endpoint,), [0, 0.0])
+        totals[0] += sql.count
+        totals[1] += sql.time
+
+    # SQL
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.sql_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - self._local.sql_started
+
+        sql = _request_sql.get()
+        if sql is not None:
+            sql.add(elapsed)
+        else:
+            totals = self._metrics().sql_totals.setdefault((BACKGROUND,), [0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed
+
+        # O driver abre a transação (BEGIN) logo antes da primeira escrita, que espera pelo lock de escrita
+        if not conn.info.get('metrics_writing') and statement.lstrip()[:6].upper() in WRITE_PREFIXES:
+            conn.info['metrics_writing'] = True
+            observe(self._metrics().lock_wait, LATENCY_BUCKETS, elapsed)
+
+    def _end_transaction(self, conn):
+        conn.info['metrics_writing'] = False
+
+    def _handle_error(self, context):
+        if 'database is locked' in str(context.original_exception):
+            self._metrics().lock_errors += 1
+
+    # Exposição
+
+    def collect(self):
+        """Soma as métricas de todas as threads"""
+        total = ThreadMetrics()
+        with self._lock:
+            self._retire_finished()
+            total.merge(self._retired)
+            for _, metrics in self._threads:
+                total.merge(metrics)
+        return total
+
+    def render(self):
+        metrics = self.collect()
+        lines = []
+
+        lines += [
+            '# HELP bc_http_requests_total Requisições HTTP por endpoint, método e status.',
+            '# TYPE bc_http_requests_total counter'
+        ]
+        for (endpoint, method, status), value in sorted(metrics.requests.items()):
+            lines.append(f'bc_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {value}')
+
+        lines += [
+            '# HELP bc_http_request_duration_seconds Latência das requisições HTTP.',
+            '# TYPE bc_http_request_duration_seconds histogram'
+        ]
+        for (endpoint, method), histogram in sorted(metrics.latency.items()):
+            lines += _histogram_lines('bc_http_request_duration_seconds', histogram, LATENCY_BUCKETS,
+                                      endpoint=endpoint, method=method)
+
+        lines += [
+            '# HELP bc_http_request_sql_statements Comandos SQL executados por requisição.',
+            '# TYPE bc_http_request_sql_statements histogram'
+        ]
+        for (endpoint,), histogram in sorted(metrics.sql_per_request.items()):
+            lines += _histogram_lines('bc_http_request_sql_statements', histogram, SQL_COUNT_BUCKETS, endpoint=endpoint)
+
+        lines += [
+            '# HELP bc_sql_statements_total Comandos SQL executados.',
+            '# TYPE bc_sql_statements_total counter'
+        ]
+        for (endpoint,), (count, _) in sorted(metrics.sql_totals.items()):
+            lines.append(f'bc_sql_statements_total{_labels(endpoint=endpoint)} {count}')
+
+        lines += [
+            '# HELP bc_sql_duration_seconds_total Tempo gasto em comandos SQL.',
+            '# TYPE bc_sql_duration_seconds_total counter'
+        ]
+        for (endpoint,), (_, seconds) in sorted(metrics.sql_totals.items()):
+            lines.append(f'bc_sql_duration_seconds_total{_labels(endpoint=endpoint)} {seconds:.6f}')
+
+        lines += [
+            '# HELP bc_sqlite_lock_wait_seconds Duração da primeira escrita de cada transação (inclui a espera pelo lock de escrita).',
+            '# TYPE bc_sqlite_lock_wait_seconds histogram'
+        ]
+        lines += _histogram_lines('bc_sqlite_lock_wait_seconds', metrics.lock_wait, LATENCY_BUCKETS)
+
+        lines += [
+            '# HELP bc_sqlite_lock_errors_total Comandos que falharam com "database is locked".',
+            '# TYPE bc_sqlite_lock_errors_total counter',
+            f'bc_sqlite_lock_errors_total {metrics.lock_errors}'
+        ]
+
+        return '\n'.join(lines) + '\n'
+
+    def render_response(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _histogram_lines(name, histogram, buckets, **labels):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(buckets, histogram):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels(**labels, le=repr(float(bound)))} {cumulative}')
+    cumulative += histogram[len(buckets)]
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {cumulative}')
+    lines.append(f'{name}_sum{_labels(**labels)} {histogram[-1]:.6f}')
+    lines.append(f'{name}_count{_labels(**labels)} {cumulative}')
+    return lines
+
+# Instância compartilhada pela aplicação
+metrics = Metrics()
@@ -0,0 +1,164 @@
+from datetime import datetime
+import base64
+import json
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import desc, tuple_
+from src.models.key import db
+from src.services.serialization import iso_text
+from src.services.sharding import shards
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, row_id, shard=None):
+    """Cursor opaco com a posição (timestamp, id) do último item da página, e o seu shard com vários
+
+    timestamp pode ser um datetime ou o texto gravado pelo SQLite (colunas projetadas com raw_text).
+    """
+    if isinstance(timestamp, str):
+        timestamp = iso_text(timestamp)
+    elif timestamp:
+        timestamp = timestamp.isoformat()
+    position = [timestamp or None, row_id] + ([] if shard is None else [shard])
+    raw = json.dumps(position, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Retorna (timestamp, id, shard); shard é None nos cursores de um único shard"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, row_id, *shard = json.loads(raw)
+        if len(shard) > 1:
+            raise ValueError(cursor)
+        return datetime.fromisoformat(timestamp), int(row_id), int(shard[0]) if shard else None
+    except (ValueError, TypeError):
+        raise InvalidCursor('Cursor inválido')
+
+
+def after_position(timestamp_column, id_column, timestamp, row_id, cursor_shard=None, shard=None):
+    """Linhas do shard depois da posição do cursor, na ordem decrescente de (timestamp, shard, id)
+
+    Os ids só são únicos dentro de um shard: entre shards, o empate no timestamp (keys criadas no
+    mesmo lote têm o mesmo created_at) é desfeito pelo número do shard.
+    """
+    if cursor_shard is None or shard is None or shard == cursor_shard:
+        return tuple_(timestamp_column, id_column) < tuple_(timestamp, row_id)
+    if shard < cursor_shard:
+        return timestamp_column <= timestamp
+    return timestamp_column < timestamp
+
+
+def keyset_page(query, timestamp_column, id_column, after, per_page, shard=None):
+    """Página seguinte a after em ordem decrescente de (timestamp, id), sem OFFSET nem COUNT
+
+    Os itens podem ser objetos do ORM ou linhas projetadas com colunas de mesmo nome. shard: o shard
+    consultado, quando a página faz parte de keyset_page_shards().
+    """
+    if after:
+        timestamp, row_id, cursor_shard = decode_cursor(after)
+        query = query.filter(after_position(timestamp_column, id_column, timestamp, row_id, cursor_shard, shard))
+
+    # Um item extra indica se existe próxima página
+    items = query.order_by(desc(timestamp_column), desc(id_column)).limit(per_page + 1).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+
+    next_cursor = None
+    if has_next:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key))
+
+    return items, next_cursor, has_next
+
+
+def _sort_key(name):
+    # NULL antes de qualquer valor, como na ordenação do SQLite
+    def key(item):
+        value = getattr(item, name)
+        return value is not None, value
+    return key
+
+
+def merge_sorted(items, order):
+    """Ordena em Python itens vindos de vários shards pela mesma ordem do SQL ([(coluna, decrescente)])"""
+    for column, descending in reversed(order):
+        # sort é estável: cada passada preserva a ordem das colunas seguintes
+        items.sort(key=_sort_key(column.key), reverse=descending)
+    return items
+
+
+def on_shard(query):
+    """A mesma consulta na sessão da thread atual (cada execução de shards.scatter tem a sua)"""
+    return query.with_session(db.session())
+
+
+class ShardedPagination(Pagination):
+    """paginate() de uma consulta repetida em todos os shards
+
+    Cada shard devolve a contagem e as suas page * per_page primeiras linhas; a página é o trecho
+    correspondente da intercalação delas. O custo cresce com o número da página, como o do OFFSET.
+    """
+
+    def _query_items(self):
+        query = self._query_args['query']
+        order = self._query_args['order']
+        limit = self.page * self.per_page
+
+        def shard_page():
+            shard_query = on_shard(query)
+            total = shard_query.order_by(None).count()
+            rows = shard_query.order_by(
+                *[desc(column) if descending else column for column, descending in order]
+            ).limit(limit).all()
+            return rows, total
+
+        results = shards.scatter(shard_page)
+        self._total = sum(total for _, total in results)
+        items = merge_sorted([row for rows, _ in results for row in rows], order)
+        return items[self._query_offset:limit]
+
+    def _query_count(self):
+        return self._total
+
+
+def paginate_shards(query, order, page, per_page):
+    """Paginação por página e total de query (order: [(coluna, decrescente)]) em todos os shards"""
+    if shards.count == 1:
+        return query.order_by(
+            *[desc(column) if descending else column for column, descending in order]
+        ).paginate(page=page, per_page=per_page, error_out=False)
+    return ShardedPagination(page=page, per_page=per_page, error_out=False, query=query, order=order)
+
+
+def count_shards(query):
+    """COUNT(*) de query somado em todos os shards"""
+    return sum(shards.scatter(lambda: on_shard(query).order_by(None).count()))
+
+
+def keyset_page_shards(query, timestamp_column, id_column, after, per_page):
+    """keyset_page() em todos os shards, com as páginas intercaladas numa só
+
+    A ordem é (timestamp, shard, id), decrescente, e o cursor leva o shard do último item: o par
+    (timestamp, id) se repete entre shards.
+    """
+    if shards.count == 1:
+        return keyset_page(query, timestamp_column, id_column, after, per_page)
+
+    pages = shards.scatter(
+        lambda: keyset_page(on_shard(query), timestamp_column, id_column, after, per_page, shards.current())
+    )
+    timestamp_key = _sort_key(timestamp_column.key)
+    tagged = [(item, index) for index, (shard_items, _, _) in zip(shards.indexes(), pages) for item in shard_items]
+    tagged.sort(key=lambda pair: (timestamp_key(pair[0]), pair[1], getattr(pair[0], id_column.key)), reverse=True)
+    has_next = len(tagged) > per_page or any(shard_has_next for _, _, shard_has_next in pages)
+    tagged = tagged[:per_page]
+
+    next_cursor = None
+    if has_next:
+        last, index = tagged[-1]
+        next_cursor = encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key), index)
+
+    return [item for item, _ in tagged], next_cursor, has_next
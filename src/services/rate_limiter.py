@@ -0,0 +1,199 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+# Limites padrão por regra: no máximo `limit` requisições a cada `window` segundos
+# (ip_batch: itens das rotas em lote por IP; o limite é também o maior lote aceito)
+DEFAULT_RATE_LIMITS = {
+    'ip': {'limit': 60, 'window': 60},
+    'ip_batch': {'limit': 5000, 'window': 300},
+    'hwid': {'limit': 30, 'window': 60},
+    'key_id': {'limit': 30, 'window': 60}
+}
+
+
+class MemoryBuckets:
+    """Token buckets em memória, locais ao processo"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, bucket, capacity, rate, now, cost=1):
+        """Consome cost tokens; retorna 0 se permitido ou os segundos até haver tokens suficientes"""
+        return self.take_many([(bucket, capacity, rate, cost)], now)
+
+    def take_many(self, requests, now):
+        """take() para vários (bucket, capacity, rate, cost) de uma vez; retorna a maior espera"""
+        wait = 0
+        with self._lock:
+            for bucket, capacity, rate, cost in requests:
+                tokens, updated = self._buckets.get(bucket, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                if tokens >= cost:
+                    tokens -= cost
+                else:
+                    wait = max(wait, (cost - tokens) / rate)
+                self._buckets[bucket] = (tokens, now)
+        return wait
+
+    def evict(self, idle_before):
+        """Remove buckets ociosos (já cheios de novo, equivalentes a buckets novos)"""
+        with self._lock:
+            self._buckets = {bucket: state for bucket, state in self._buckets.items() if state[1] >= idle_before}
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBuckets:
+    """Token buckets num arquivo SQLite local, compartilhados entre processos"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute('CREATE TABLE IF NOT EXISTS rate_buckets (bucket TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+
+    def _connection(self):
+        # Uma conexão por thread e por processo
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, bucket, capacity, rate, now, cost=1):
+        return self.take_many([(bucket, capacity, rate, cost)], now)
+
+    def take_many(self, requests, now):
+        # Uma única transação para todos os buckets da requisição (lotes com milhares de keys)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            wait = 0
+            for bucket, capacity, rate, cost in requests:
+                row = connection.execute('SELECT tokens, updated FROM rate_buckets WHERE bucket = ?', (bucket,)).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+                if tokens >= cost:
+                    tokens -= cost
+                else:
+                    wait = max(wait, (cost - tokens) / rate)
+                connection.execute('INSERT OR REPLACE INTO rate_buckets (bucket, tokens, updated) VALUES (?, ?, ?)',
+                                   (bucket, tokens, now))
+            connection.execute('COMMIT')
+            return wait
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def evict(self, idle_before):
+        self._connection().execute('DELETE FROM rate_buckets WHERE updated < ?', (idle_before,))
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM rate_buckets').fetchone()[0]
+
+
+class RateLimiter:
+    """Limita requisições por IP, HWID e key_id antes de qualquer acesso ao banco"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.rules = {}
+        self.backend = None
+        self.sweep_interval = 60
+        self._last_sweep = time.time()
+
+        self.allowed = 0
+        self.limited = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        rules = app.config.get('RATE_LIMITS', DEFAULT_RATE_LIMITS)
+        # Regras com valor None ficam desativadas
+        self.rules = {name: rule for name, rule in rules.items() if rule}
+
+        storage = app.config.get('RATE_LIMIT_STORAGE')
+        self.backend = SQLiteBuckets(storage) if storage else MemoryBuckets()
+
+    def identities(self, request):
+        """Valores de cada regra para a requisição atual: {regra: {valor: custo}}
+
+        Nas rotas em lote ({"keys": [...]}) o IP paga um token da regra ip pela requisição e um da
+        ip_batch por item; cada key e HWID do lote, um token por ocorrência.
+        """
+        data = request.get_json(silent=True)
+        data = data if isinstance(data, dict) else {}
+        entries = data.get('keys')
+        batch = isinstance(entries, list) and bool(entries)
+        if not batch:
+            entries = [data]
+
+        identities = {'ip': Counter(), 'ip_batch': Counter(), 'hwid': Counter(), 'key_id': Counter()}
+        if isinstance(request.remote_addr, str) and request.remote_addr:
+            identities['ip'][request.remote_addr] = 1
+            if batch:
+                identities['ip_batch'][request.remote_addr] = len(entries)
+        for entry in entries:
+            if not isinstance(entry, dict):
+                # validate/batch: lista de key_ids
+                entry = {'key_id': entry}
+            for name in ('hwid', 'key_id'):
+                value = entry.get(name)
+                if isinstance(value, str) and value.strip():
+                    identities[name][value.strip()] += 1
+        return {name: values for name, values in identities.items() if values}
+
+    def check(self, request):
+        """Retorna None se a requisição é permitida, senão os segundos para o Retry-After"""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        identities = self.identities(request)
+        requests = []
+        for name, rule in self.rules.items():
+            rate = rule['limit'] / rule['window']
+            for value, cost in identities.get(name, {}).items():
+                # Um custo acima da capacidade nunca caberia no bucket: no máximo, o lote o esvazia
+                requests.append((f'{name}:{value}', rule['limit'], rate, min(cost, rule['limit'])))
+        wait = self.backend.take_many(requests, now) if requests else 0
+
+        if now - self._last_sweep > self.sweep_interval:
+            self._last_sweep = now
+            self.backend.evict(now - max(rule['window'] for rule in self.rules.values()))
+
+        if wait:
+            self.limited += 1
+            return max(1, math.ceil(wait))
+        self.allowed += 1
+        return None
+
+    def batch_limit(self):
+        """Maior lote aceito pela regra ip_batch (None: sem limite)"""
+        rule = self.rules.get('ip_batch') if self.enabled else None
+        return rule['limit'] if rule else None
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'rules': self.rules,
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'buckets': len(self.backend) if self.backend else 0,
+            'allowed': self.allowed,
+            'limited': self.limited
+        }
+
+
+# Instância compartilhada pelo blueprint de autenticação
+rate_limiter = RateLimiter()
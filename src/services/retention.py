@@ -0,0 +1,291 @@
+from datetime import datetime, timedelta
+import atexit
+import os
+import threading
+import time
+from sqlalchemy import case, create_engine, func
+from src.models.key import db, AccessLog, AccessLogRollup, RetentionState
+from src.services.analytics import analytics
+from src.services.sharding import shards, shard_uri
+
+PERIOD_HOUR = 'hour'
+PERIOD_DAY = 'day'
+PERIODS = (PERIOD_HOUR, PERIOD_DAY)
+
+BUCKET_FORMATS = {
+    PERIOD_HOUR: '%Y-%m-%d %H:00:00',
+    PERIOD_DAY: '%Y-%m-%d 00:00:00'
+}
+
+
+def floor_time(value, period):
+    if period == PERIOD_HOUR:
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def get_state(name, shard=0):
+    table = RetentionState.__table__
+    with shards.engine(shard).connect() as connection:
+        return connection.execute(db.select(table.c.value).where(table.c.name == name)).scalar()
+
+
+def earliest_state(name):
+    """Menor valor de name entre os shards (None se algum shard ainda não tem)"""
+    values = [get_state(name, index) for index in shards.indexes()]
+    return None if None in values else min(values)
+
+
+def set_state(connection, name, value):
+    table = RetentionState.__table__
+    updated = connection.execute(table.update().where(table.c.name == name).values(value=value))
+    if updated.rowcount == 0:
+        connection.execute(table.insert(), {'name': name, 'value': value})
+
+
+class RetentionEngine:
+    """Consolida logs antigos em agregados por hora/dia, arquiva os logs brutos e os remove em blocos"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.retention_days = 30
+        self.interval = 3600
+        self.chunk_size = 1000
+        self.chunk_pause = 0.05
+        # Logs chegam pela fila de gravação com alguns segundos de atraso
+        self.grace = timedelta(minutes=5)
+        self.archive_uri = None
+
+        # Shard -> engine do banco de arquivo (um arquivo por shard)
+        self._archive_engines = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+        self.last_run = None
+        self.rows_archived = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.retention_days = app.config.get('RETENTION_DAYS', self.retention_days)
+        self.interval = app.config.get('RETENTION_INTERVAL', self.interval)
+        self.chunk_size = app.config.get('RETENTION_CHUNK_SIZE', self.chunk_size)
+        self.chunk_pause = app.config.get('RETENTION_CHUNK_PAUSE', self.chunk_pause)
+        self.archive_uri = app.config.get('RETENTION_ARCHIVE_URI')
+        atexit.register(self.stop)
+
+    def run(self, now=None):
+        """Executa um ciclo completo em cada shard: agregados por hora e por dia, arquivamento e limpeza dos buckets de analytics"""
+        now = now or datetime.utcnow()
+        with self._lock:
+            rolled = dict.fromkeys(PERIODS, 0)
+            archived = 0
+            for index in shards.indexes():
+                for period in PERIODS:
+                    rolled[period] += self.rollup(period, floor_time(now - self.grace, period), index)
+                archived += self.archive(floor_time(now - timedelta(days=self.retention_days), PERIOD_DAY), index)
+            pruned = analytics.prune(now)
+            self.last_run = now
+            return {'rollup_rows': rolled, 'archived_rows': archived, 'analytics_buckets_pruned': pruned}
+
+    def rollup(self, period, closed_until, shard=0):
+        """Agrega os logs brutos de todos os buckets fechados desde a última execução, um dia por transação"""
+        engine = shards.engine(shard)
+        watermark = get_state(f'rollup_{period}', shard)
+        if watermark is None:
+            with engine.connect() as connection:
+                first = connection.execute(db.select(func.min(AccessLog.login_at))).scalar()
+            if first is None:
+                return 0
+            watermark = floor_time(first, period)
+
+        created = 0
+        while watermark < closed_until:
+            window_end = min(floor_time(watermark, PERIOD_DAY) + timedelta(days=1), closed_until)
+            rows = self._aggregate(engine, period, watermark, window_end)
+
+            with engine.begin() as connection:
+                if rows:
+                    connection.execute(AccessLogRollup.__table__.insert(), rows)
+                set_state(connection, f'rollup_{period}', window_end)
+
+            created += len(rows)
+            watermark = window_end
+
+        return created
+
+    def _aggregate(self, engine, period, start, end):
+        bucket = func.strftime(BUCKET_FORMATS[period], AccessLog.login_at)
+        query = db.select(
+            bucket,
+            AccessLog.key_id,
+            func.coalesce(func.sum(case((AccessLog.success.is_(True), 1), else_=0)), 0),
+            func.coalesce(func.sum(case((AccessLog.success.is_(False), 1), else_=0)), 0),
+            func.count(func.distinct(AccessLog.hwid)),
+            func.count(func.distinct(AccessLog.ip_address))
+        ).where(AccessLog.login_at >= start, AccessLog.login_at < end).group_by(bucket, AccessLog.key_id)
+
+        with engine.connect() as connection:
+            return [{
+                'period': period,
+                'bucket_start': datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S'),
+                'key_id': row[1],
+                'success_count': row[2],
+                'failed_count': row[3],
+                'distinct_hwids': row[4],
+                'distinct_ips': row[5]
+            } for row in connection.execute(query)]
+
+    def archive(self, cutoff, shard=0):
+        """Move os logs anteriores a cutoff para o banco de arquivo do shard, em blocos curtos"""
+        # Só arquiva dias que já estão nos agregados diários
+        rolled_until = get_state(f'rollup_{PERIOD_DAY}', shard)
+        if rolled_until is None:
+            return 0
+        cutoff = min(cutoff, rolled_until)
+
+        table = AccessLog.__table__
+        engine = shards.engine(shard)
+        archive_engine = self._get_archive_engine(shard)
+        moved = 0
+
+        while True:
+            with engine.connect() as connection:
+                rows = connection.execute(
+                    db.select(table).where(table.c.login_at < cutoff)
+                    .order_by(table.c.login_at, table.c.id).limit(self.chunk_size)
+                ).mappings().all()
+
+            if not rows:
+                break
+
+            # OR REPLACE torna o bloco idempotente se a remoção abaixo falhar
+            with archive_engine.begin() as connection:
+                connection.execute(table.insert().prefix_with('OR REPLACE'), [dict(row) for row in rows])
+
+            with engine.begin() as connection:
+                connection.execute(table.delete().where(table.c.id.in_([row['id'] for row in rows])))
+
+            moved += len(rows)
+            self.rows_archived += len(rows)
+            if len(rows) < self.chunk_size:
+                break
+            # Libera o lock de escrita entre blocos para os logins
+            time.sleep(self.chunk_pause)
+
+        # Só avança depois que todos os logs anteriores a cutoff saíram da tabela
+        archived_before = get_state('archived_before', shard)
+        if archived_before is None or cutoff > archived_before:
+            with engine.begin() as connection:
+                set_state(connection, 'archived_before', cutoff)
+
+        return moved
+
+    def clear_archive(self, shard=0):
+        """Esvazia o banco de arquivo do shard (todas as keys foram apagadas)"""
+        with self._get_archive_engine(shard).begin() as connection:
+            connection.execute(AccessLog.__table__.delete())
+
+    def _get_archive_engine(self, shard=0):
+        if shard not in self._archive_engines:
+            uri = self.archive_uri or 'sqlite:///' + os.path.join(
+                os.path.dirname(db.engine.url.database), 'archive.db'
+            )
+            # Os ids dos logs só são únicos dentro de um shard
+            engine = create_engine(shard_uri(uri, shard))
+            AccessLog.__table__.create(engine, checkfirst=True)
+            self._archive_engines[shard] = engine
+        return self._archive_engines[shard]
+
+    def rollups(self, period, since=None, until=None, key_id=None):
+        """Consulta os agregados de um período (no shard atual), opcionalmente filtrados por intervalo e key"""
+        query = AccessLogRollup.query.filter(AccessLogRollup.period == period)
+        if key_id:
+            query = query.filter(AccessLogRollup.key_id == key_id)
+        if since:
+            query = query.filter(AccessLogRollup.bucket_start >= floor_time(since, period))
+        if until:
+            query = query.filter(AccessLogRollup.bucket_start < until)
+        return query
+
+    def archived_summary(self, since=None, until=None, key_id=None):
+        """Totais dos dias já arquivados dentro do intervalo, lidos dos agregados diários
+
+        Com key_id, só o shard da key é lido; sem ele, os totais dos shards são somados.
+        """
+        if key_id:
+            with shards.for_key(key_id):
+                return self._archived_summary(since, until, key_id)
+
+        summaries = [summary for summary in shards.scatter(self._archived_summary, since, until) if summary]
+        if len(summaries) <= 1:
+            return summaries[0] if summaries else None
+        return {
+            'until': max(summary['until'] for summary in summaries),
+            'total': sum(summary['total'] for summary in summaries),
+            'successful': sum(summary['successful'] for summary in summaries),
+            'failed': sum(summary['failed'] for summary in summaries)
+        }
+
+    def _archived_summary(self, since=None, until=None, key_id=None):
+        archived_before = get_state('archived_before', shards.current())
+        if archived_before is None or (since and since >= archived_before):
+            return None
+
+        until = min(until, archived_before) if until else archived_before
+        query = self.rollups(PERIOD_DAY, since, until, key_id).with_entities(
+            func.coalesce(func.sum(AccessLogRollup.success_count), 0),
+            func.coalesce(func.sum(AccessLogRollup.failed_count), 0)
+        )
+        successful, failed = query.one()
+        return {
+            'until': until.isoformat(),
+            'total': successful + failed,
+            'successful': successful,
+            'failed': failed
+        }
+
+    def status(self):
+        # Com vários shards, o ponto até onde todos chegaram
+        return {
+            'retention_days': self.retention_days,
+            'interval': self.interval,
+            'rollup_hour_until': _isoformat(earliest_state(f'rollup_{PERIOD_HOUR}')),
+            'rollup_day_until': _isoformat(earliest_state(f'rollup_{PERIOD_DAY}')),
+            'archived_before': _isoformat(earliest_state('archived_before')),
+            'last_run': _isoformat(self.last_run),
+            'rows_archived': self.rows_archived
+        }
+
+    def start(self):
+        """Inicia a execução periódica numa thread de fundo (uma por processo)"""
+        if self.app is None or (self._thread is not None and self._pid == os.getpid()):
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='log-retention', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    self.run()
+            except Exception:
+                # Tenta novamente no próximo ciclo
+                pass
+
+    def stop(self):
+        self._stop.set()
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+# Instância compartilhada pela aplicação
+retention_engine = RetentionEngine()
@@ -0,0 +1,103 @@
+from datetime import datetime
+from flask import current_app, jsonify
+from sqlalchemy import String, type_coerce
+from src.models.key import Key, AccessLog, STATUS_LABELS, key_status
+
+try:
+    import orjson
+except ImportError:
+    # Backend opcional: sem ele as respostas saem pelo jsonify do Flask
+    orjson = None
+
+
+def raw_text(column):
+    """Coluna DateTime lida como o texto gravado pelo SQLite, sem converter para datetime"""
+    return type_coerce(column, String).label(column.key)
+
+
+def iso_text(value):
+    """Texto de DateTime do SQLite ('2024-01-01 12:00:00.000000') no formato de datetime.isoformat()"""
+    if value is None:
+        return None
+    # isoformat() omite os microssegundos quando são zero
+    if value.endswith('.000000'):
+        value = value[:-7]
+    return value.replace(' ', 'T', 1)
+
+
+# Colunas projetadas na ordem em que key_dicts()/log_dicts() desempacotam as linhas
+KEY_COLUMNS = (
+    Key.id, Key.key_id, Key.hwid, Key.expiration_days,
+    raw_text(Key.created_at), raw_text(Key.first_login_at), raw_text(Key.expires_at),
+    Key.is_active, Key.is_paused, Key.is_used, Key.expired, Key.status
+)
+
+LOG_COLUMNS = (
+    AccessLog.id, AccessLog.key_id, AccessLog.hwid, AccessLog.ip_address, AccessLog.user_agent,
+    raw_text(AccessLog.login_at), AccessLog.success, AccessLog.error_message
+)
+
+
+def key_dicts(rows):
+    """Mesmo resultado de Key.to_dict() para linhas de KEY_COLUMNS, numa única passada"""
+    labels = STATUS_LABELS
+    # Como em Key.to_dict(), o prazo é conferido agora (o texto do SQLite ordena como a data)
+    now = datetime.utcnow().isoformat(sep=' ')
+    result = []
+    for (row_id, key_id, hwid, expiration_days, created_at, first_login_at, expires_at,
+         is_active, is_paused, is_used, expired, status) in rows:
+        expired = expires_at is not None and expires_at < now
+        result.append({
+            'id': row_id,
+            'key_id': key_id,
+            'hwid': hwid,
+            'expiration_days': expiration_days,
+            'created_at': iso_text(created_at),
+            'first_login_at': iso_text(first_login_at),
+            'expires_at': iso_text(expires_at),
+            'is_active': is_active,
+            'is_paused': is_paused,
+            'is_used': is_used,
+            'is_expired': expired,
+            'status': labels[key_status(is_active, is_paused, expired, is_used)]
+        })
+    return result
+
+
+def log_dicts(rows):
+    """Mesmo resultado de AccessLog.to_dict() para linhas de LOG_COLUMNS, numa única passada"""
+    return [{
+        'id': row_id,
+        'key_id': key_id,
+        'hwid': hwid,
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'login_at': iso_text(login_at),
+        'success': success,
+        'error_message': error_message
+    } for (row_id, key_id, hwid, ip_address, user_agent, login_at, success, error_message) in rows]
+
+
+def json_backend():
+    """'orjson' quando instalado e habilitado (FAST_JSON_ENABLED), senão 'json' (jsonify do Flask)"""
+    app = current_app
+    # No modo debug o jsonify indenta o JSON: mantém a mesma saída
+    if orjson is None or app.debug or not app.config.get('FAST_JSON_ENABLED', True):
+        return 'json'
+    return 'orjson'
+
+
+def json_response(payload):
+    """Equivalente a jsonify(payload), pelo backend de json_backend()
+
+    Com orjson a estrutura e a ordem das chaves são as mesmas, mas caracteres não ASCII
+    saem em UTF-8 em vez de escapes \\uXXXX.
+    """
+    if json_backend() == 'json':
+        return jsonify(payload)
+
+    app = current_app
+    option = orjson.OPT_APPEND_NEWLINE
+    if app.json.sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    return app.response_class(orjson.dumps(payload, option=option), mimetype=app.json.mimetype)
@@ -0,0 +1,116 @@
+from datetime import datetime, timezone
+import threading
+import time
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+
+class InvalidSession(Exception):
+    pass
+
+
+class SessionTokens:
+    """Tokens de sessão assinados (HMAC), verificados só em memória"""
+
+    def __init__(self, app=None):
+        self.ttl = 900
+        self._serializer = None
+        self._lock = threading.Lock()
+        # key_id -> instante da revogação; tokens emitidos antes disso são recusados
+        self._revoked = {}
+        self._revoked_all_at = 0.0
+        self._pruned_at = 0.0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('SESSION_TOKEN_TTL', self.ttl)
+        self._serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='bc-games-session')
+
+    def issue(self, key, hwid):
+        """Emite um token para a key e HWID, válido até o fim do TTL ou a expiração da key"""
+        now = time.time()
+        # expires_at é armazenado em UTC sem fuso
+        key_expires_at = key.expires_at.replace(tzinfo=timezone.utc).timestamp() if key.expires_at else None
+        expires_at = now + self.ttl
+        if key_expires_at is not None:
+            expires_at = min(expires_at, key_expires_at)
+
+        token = self._serializer.dumps({
+            'k': key.key_id,
+            'h': hwid,
+            'x': key_expires_at,
+            'i': now,
+            'e': expires_at
+        })
+        return token, datetime.utcfromtimestamp(expires_at)
+
+    def verify(self, token, hwid):
+        """Valida assinatura, expiração, revogação e HWID; retorna os dados do token"""
+        try:
+            payload = self._serializer.loads(token, max_age=self.ttl)
+        except SignatureExpired:
+            raise InvalidSession('Sessão expirada')
+        except BadSignature:
+            raise InvalidSession('Sessão inválida')
+
+        now = time.time()
+        if now >= payload['e']:
+            raise InvalidSession('Sessão expirada')
+
+        if payload['i'] < max(self._revoked_all_at, self._revoked.get(payload['k'], 0.0)):
+            raise InvalidSession('Sessão revogada')
+
+        if payload['h'] != hwid:
+            raise InvalidSession('HWID não corresponde')
+
+        return payload
+
+    def refresh(self, payload):
+        """Emite um novo token com os mesmos dados, a partir de um token já verificado
+
+        'i' continua sendo o instante do login: uma revogação posterior a ele vale para todos os
+        tokens renovados desde então, mesmo os renovados por um worker que ainda não a conhecia.
+        """
+        now = time.time()
+        expires_at = now + self.ttl
+        if payload['x'] is not None:
+            expires_at = min(expires_at, payload['x'])
+
+        token = self._serializer.dumps({**payload, 'e': expires_at})
+        return token, datetime.utcfromtimestamp(expires_at)
+
+    def revoke_key(self, key_id, at=None):
+        """Invalida os tokens da key emitidos antes de at (padrão: agora)"""
+        self.revoke_many([key_id], at)
+
+    def revoke_many(self, key_ids, at=None):
+        """Invalida os tokens das keys emitidos antes de at (padrão: agora)"""
+        now = time.time()
+        at = now if at is None else at
+        with self._lock:
+            for key_id in key_ids:
+                self._revoked[key_id] = max(at, self._revoked.get(key_id, 0.0))
+            # Limpeza periódica, não a cada revogação: um job com milhares de keys não reconstrói o dicionário a cada uma
+            if now - self._pruned_at > 60:
+                self._pruned_at = now
+                # Revogações mais antigas que o TTL não afetam nenhum token ainda válido
+                self._revoked = {k: t for k, t in self._revoked.items() if now - t <= self.ttl}
+
+    def revoke_all(self, at=None):
+        """Invalida todos os tokens emitidos antes de at (padrão: agora)"""
+        at = time.time() if at is None else at
+        with self._lock:
+            self._revoked_all_at = max(at, self._revoked_all_at)
+            self._revoked = {k: t for k, t in self._revoked.items() if t > self._revoked_all_at}
+
+    def stats(self):
+        return {
+            'ttl': self.ttl,
+            'revoked_keys': len(self._revoked),
+            'revoked_all_at': datetime.utcfromtimestamp(self._revoked_all_at).isoformat() if self._revoked_all_at else None
+        }
+
+
+# Instância compartilhada pelas rotas de autenticação e administração
+session_tokens = SessionTokens()
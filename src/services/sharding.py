@@ -0,0 +1,165 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+import os
+import threading
+import zlib
+from flask import current_app
+from sqlalchemy.engine import make_url
+
+# Tabelas divididas entre os shards pelo key_id (ou mantidas por shard, como os contadores e o
+# diário de alterações); as demais (alocador de keys, jobs) ficam só no shard 0, o banco principal
+SHARDED_TABLES = frozenset((
+    'keys', 'keys_fts', 'access_logs', 'stats_counters', 'access_log_rollups', 'retention_state',
+    'analytics_buckets', 'key_changes'
+))
+
+# Shard das consultas do db.session às tabelas divididas (scope / for_key)
+_current = ContextVar('shard_current', default=0)
+# Marca as threads de scatter: um scatter dentro de outro roda em sequência, sem esperar o pool
+_scattering = ContextVar('shard_scattering', default=False)
+
+
+def shard_uri(uri, index):
+    """URI do shard index: o 0 é o próprio banco; os demais ficam ao lado dele (app-shard1.db, ...)"""
+    if index == 0:
+        return uri
+    url = make_url(uri)
+    database = url.database
+    if not database or database == ':memory:' or database.startswith('file:'):
+        raise ValueError('SHARD_COUNT > 1 exige um banco SQLite em arquivo (ou SHARD_URIS)')
+    root, extension = os.path.splitext(database)
+    return url.set(database=f'{root}-shard{index}{extension or ".db"}').render_as_string(hide_password=False)
+
+
+def bind_key(index):
+    """Chave em SQLALCHEMY_BINDS do shard index (None: o engine padrão)"""
+    return None if index == 0 else f'shard{index}'
+
+
+class Shards:
+    """Divide keys e logs de acesso entre N bancos SQLite pelo hash do key_id
+
+    Cada shard tem o próprio arquivo, o próprio lock de escrita e os próprios contadores: uma key e
+    todos os seus logs ficam sempre no mesmo shard. Com SHARD_COUNT = 1 (padrão) nada muda.
+    """
+
+    def __init__(self, app=None):
+        self.count = 1
+        self.uris = []
+        self.scatter_workers = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        self.scatters = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Chamar antes de db.init_app: registra os shards 1..N-1 em SQLALCHEMY_BINDS"""
+        self.count = app.config.get('SHARD_COUNT', 1)
+        if not isinstance(self.count, int) or self.count < 1:
+            raise ValueError(f'SHARD_COUNT inválido: {self.count}')
+
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        overrides = app.config.get('SHARD_URIS', {})
+        self.uris = [uri] + [overrides.get(index) or shard_uri(uri, index) for index in range(1, self.count)]
+        self.scatter_workers = app.config.get('SHARD_SCATTER_WORKERS', self.count)
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for index in range(1, self.count):
+            binds[bind_key(index)] = self.uris[index]
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+    # Roteamento
+
+    def index_for(self, key_id):
+        """Shard de uma key (e de todos os seus logs)"""
+        if self.count == 1:
+            return 0
+        return zlib.crc32(key_id.encode()) % self.count
+
+    def indexes(self):
+        return range(self.count)
+
+    def current(self):
+        return _current.get()
+
+    def engine(self, index=None):
+        """Engine de escrita do shard index (padrão: o shard atual) na aplicação atual"""
+        index = self.current() if index is None else index
+        return current_app.extensions['sqlalchemy'].engines[bind_key(index)]
+
+    def engines(self):
+        return [self.engine(index) for index in self.indexes()]
+
+    @contextmanager
+    def scope(self, index):
+        """Envia ao shard index as consultas do db.session às tabelas divididas"""
+        token = _current.set(index)
+        try:
+            yield index
+        finally:
+            _current.reset(token)
+
+    def for_key(self, key_id):
+        return self.scope(self.index_for(key_id))
+
+    def group(self, key_ids):
+        """{shard: [key_id, ...]} na ordem dos shards"""
+        groups = {}
+        for key_id in key_ids:
+            groups.setdefault(self.index_for(key_id), []).append(key_id)
+        return dict(sorted(groups.items()))
+
+    # Scatter-gather
+
+    def scatter(self, function, *args, **kwargs):
+        """Executa function em todos os shards em paralelo; retorna os resultados na ordem dos shards
+
+        Cada execução tem o próprio app context (e a própria sessão) e roda com o shard atual
+        definido; as demais variáveis de contexto (requisição, read_only) vêm de quem chamou.
+        """
+        if self.count == 1:
+            return [function(*args, **kwargs)]
+
+        app = current_app._get_current_object()
+
+        def task(index):
+            _scattering.set(True)
+            with app.app_context(), self.scope(index):
+                return function(*args, **kwargs)
+
+        with self._lock:
+            self.scatters += 1
+        if _scattering.get():
+            return [copy_context().run(task, index) for index in self.indexes()]
+
+        executor = self._get_executor()
+        futures = [executor.submit(copy_context().run, task, index) for index in self.indexes()]
+        return [future.result() for future in futures]
+
+    def _get_executor(self):
+        # Após um fork as threads do pool do processo pai não existem no filho
+        if self._executor is not None and self._pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.scatter_workers,
+                                                    thread_name_prefix='shard-scatter')
+            return self._executor
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'databases': [make_url(uri).database for uri in self.uris],
+            'scatter_workers': self.scatter_workers if self.count > 1 else 0,
+            'scatters': self.scatters
+        }
+
+
+# Instância compartilhada pela sessão, pelas rotas e pelos serviços
+shards = Shards()
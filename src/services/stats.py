@@ -0,0 +1,309 @@
+from datetime import datetime
+import atexit
+import os
+import threading
+import time
+from sqlalchemy import case, event, func, inspect, true
+from sqlalchemy.orm import Session
+from src.models.key import db, Key, AccessLog, StatsCounter, AccessLogRollup, RetentionState
+from src.services.event_bus import event_bus
+from src.services.sharding import shards
+from src.services.storage import storage
+
+KEY_COUNTERS = ('keys_total', 'keys_active', 'keys_paused', 'keys_used', 'keys_expired', 'keys_available')
+LOGIN_COUNTERS = ('logins_total', 'logins_successful', 'logins_failed')
+COUNTERS = KEY_COUNTERS + LOGIN_COUNTERS
+
+KEY_COLUMNS = ('is_active', 'is_paused', 'is_used', 'expired', 'status')
+
+
+def key_flags(state):
+    """Contribuição de uma key (ou dos valores de suas colunas) para cada contador"""
+    return {
+        'keys_total': 1,
+        'keys_active': int(bool(state['is_active']) and not state['is_paused']),
+        'keys_paused': int(bool(state['is_paused'])),
+        'keys_used': int(bool(state['is_used'])),
+        'keys_expired': int(bool(state['expired'])),
+        'keys_available': int(state['status'] == 'available')
+    }
+
+
+def stats_summary(counters):
+    """Contadores no formato de /api/admin/stats"""
+    total_logins = counters['logins_total']
+    successful_logins = counters['logins_successful']
+    return {
+        'keys': {
+            'total': counters['keys_total'],
+            'active': counters['keys_active'],
+            'paused': counters['keys_paused'],
+            'used': counters['keys_used'],
+            'expired': counters['keys_expired'],
+            'available': counters['keys_available']
+        },
+        'logins': {
+            'total': total_logins,
+            'successful': successful_logins,
+            'failed': counters['logins_failed'],
+            'success_rate': round((successful_logins / total_logins * 100) if total_logins > 0 else 0, 2)
+        },
+        'snapshot_at': counters['taken_at'].isoformat(),
+        'reconciled_at': counters['reconciled_at'].isoformat()
+    }
+
+
+def log_flags(success):
+    return {
+        'logins_total': 1,
+        'logins_successful': int(success is True),
+        'logins_failed': int(success is False)
+    }
+
+
+class StatsCounters:
+    """Contadores de keys e logins mantidos a cada escrita, com reconciliação periódica"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.reconcile_interval = 300
+        self.snapshot_ttl = 2
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.reconcile_interval = app.config.get('STATS_RECONCILE_INTERVAL', self.reconcile_interval)
+        self.snapshot_ttl = app.config.get('STATS_SNAPSHOT_TTL', self.snapshot_ttl)
+        atexit.register(self.stop)
+
+        with app.app_context():
+            engines = shards.engines()
+        # Os deltas de cada transação vão para o stream só depois do COMMIT: a devolução da
+        # conexão ao pool vem depois dele; um rollback antes descarta os deltas
+        for engine in engines:
+            event.listen(engine, 'rollback', self._discard_deltas)
+            event.listen(engine, 'checkin', self._publish_deltas)
+
+    def increment(self, connection=None, **deltas):
+        """Soma os deltas aos contadores, na mesma transação da escrita que os originou
+
+        Cada shard tem os seus contadores: connection deve ser do shard da escrita (padrão: o atual).
+        """
+        table = StatsCounter.__table__
+        connection = connection or db.session.connection(bind_arguments={'shard': shards.current()})
+        pending = connection.info.setdefault('stats_deltas', {})
+        for name, delta in deltas.items():
+            if delta:
+                connection.execute(table.update().where(table.c.name == name).values(value=table.c.value + delta))
+                pending[name] = pending.get(name, 0) + delta
+
+    def _discard_deltas(self, connection):
+        connection.info.pop('stats_deltas', None)
+
+    def _publish_deltas(self, dbapi_connection, connection_record):
+        deltas = connection_record.info.pop('stats_deltas', None)
+        deltas = {name: delta for name, delta in (deltas or {}).items() if delta}
+        if deltas:
+            event_bus.publish('stats_delta', deltas)
+
+    def reconcile(self, keys=True, logins=True):
+        """Recalcula os contadores a partir das tabelas, uma única passada por tabela em cada shard"""
+        now = datetime.utcnow()
+        totals = {}
+        for index in shards.indexes():
+            for name, value in self._reconcile_shard(shards.engine(index), now, keys, logins).items():
+                totals[name] = totals.get(name, 0) + value
+
+        self._snapshot = None
+        if keys and logins:
+            # Valores recalculados substituem os que os dashboards acumularam pelos deltas
+            event_bus.publish('stats', stats_summary(dict(totals, reconciled_at=now, taken_at=now)))
+        return totals
+
+    def _reconcile_shard(self, engine, now, keys, logins):
+        """Conta as tabelas sem o lock de escrita e corrige só a diferença numa transação curta
+
+        Contagem e contadores vêm de um único SELECT, ou seja, do mesmo snapshot do WAL: como cada
+        escrita soma os seus deltas na própria transação, a diferença entre os dois naquele instante
+        é o erro acumulado, e somá-la aos valores atuais não perde incrementos posteriores.
+        """
+        table = StatsCounter.__table__
+        names = (KEY_COUNTERS if keys else ()) + (LOGIN_COUNTERS if logins else ())
+        parts = []
+
+        if keys:
+            parts.append(db.select(
+                func.count(),
+                func.coalesce(func.sum(case((Key.is_active.is_(True) & Key.is_paused.isnot(True), 1), else_=0)), 0),
+                func.coalesce(func.sum(case((Key.is_paused.is_(True), 1), else_=0)), 0),
+                func.coalesce(func.sum(case((Key.is_used.is_(True), 1), else_=0)), 0),
+                func.coalesce(func.sum(case((Key.expired.is_(True), 1), else_=0)), 0),
+                func.coalesce(func.sum(case((Key.status == 'available', 1), else_=0)), 0)
+            ).select_from(Key).subquery())
+
+        if logins:
+            parts.append(db.select(
+                func.count(),
+                func.coalesce(func.sum(case((AccessLog.success.is_(True), 1), else_=0)), 0),
+                func.coalesce(func.sum(case((AccessLog.success.is_(False), 1), else_=0)), 0)
+            ).select_from(AccessLog).subquery())
+            # Logs já arquivados continuam contando, pelos agregados diários
+            archived_before = db.select(RetentionState.value).where(
+                RetentionState.name == 'archived_before'
+            ).scalar_subquery()
+            parts.append(db.select(
+                func.coalesce(func.sum(AccessLogRollup.success_count), 0),
+                func.coalesce(func.sum(AccessLogRollup.failed_count), 0)
+            ).where(AccessLogRollup.period == 'day', AccessLogRollup.bucket_start < archived_before).subquery())
+
+        parts.append(db.select(*[
+            func.sum(case((table.c.name == name, table.c.value))) for name in names
+        ]).subquery())
+
+        # Cada parte tem uma única linha: o produto cartesiano junta todas numa só
+        source = parts[0]
+        for part in parts[1:]:
+            source = source.join(part, true())
+        with storage.reader(engine).connect() as connection:
+            row = list(connection.execute(
+                db.select(*[column for part in parts for column in part.c]).select_from(source)
+            ).one())
+
+        values = dict(zip(names, row))
+        if logins:
+            successful, failed = row[len(names):len(names) + 2]
+            values['logins_total'] += successful + failed
+            values['logins_successful'] += successful
+            values['logins_failed'] += failed
+        stored = row[-len(names):]
+        drift = {name: values[name] - (value or 0) for name, value in zip(names, stored)}
+
+        with engine.begin() as connection:
+            self._ensure_rows(connection)
+            # Um único UPDATE: o lock de escrita dura só esta instrução
+            connection.execute(table.update().where(table.c.name.in_(names)).values(
+                value=table.c.value + case(
+                    *[(table.c.name == name, delta) for name, delta in drift.items() if delta], else_=0
+                ) if any(drift.values()) else table.c.value,
+                updated_at=now
+            ))
+
+        return values
+
+    def _ensure_rows(self, connection):
+        table = StatsCounter.__table__
+        existing = set(connection.execute(db.select(table.c.name)).scalars())
+        missing = [{'name': name, 'value': 0, 'updated_at': None} for name in COUNTERS if name not in existing]
+        if missing:
+            connection.execute(table.insert(), missing)
+
+    def snapshot(self):
+        """Retorna os contadores, lidos no máximo uma vez a cada snapshot_ttl segundos"""
+        cached = self._snapshot
+        if cached is not None and time.monotonic() - cached[0] < self.snapshot_ttl:
+            return cached[1]
+
+        with self._lock:
+            shard_rows = self.by_shard()
+            if any(len(rows) < len(COUNTERS) or any(row.updated_at is None for row in rows) for rows in shard_rows):
+                self.reconcile()
+                shard_rows = self.by_shard()
+
+            counters = dict.fromkeys(COUNTERS, 0)
+            for rows in shard_rows:
+                for row in rows:
+                    counters[row.name] = counters.get(row.name, 0) + row.value
+            counters['reconciled_at'] = min(row.updated_at for rows in shard_rows for row in rows)
+            counters['taken_at'] = datetime.utcnow()
+            self._snapshot = (time.monotonic(), counters)
+            return counters
+
+    def by_shard(self):
+        """Linhas (name, value, updated_at) dos contadores de cada shard, lidas em paralelo"""
+        # Colunas em vez de entidades: o identity map da sessão não devolve valores antigos após reconcile
+        query = db.select(StatsCounter.name, StatsCounter.value, StatsCounter.updated_at)
+        return shards.scatter(
+            lambda: db.session.execute(query, bind_arguments={'shard': shards.current()}).all()
+        )
+
+    def start(self):
+        """Inicia a reconciliação periódica numa thread de fundo (uma cópia basta por banco)"""
+        if self.app is None or (self._thread is not None and self._pid == os.getpid()):
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stats-reconciler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.reconcile_interval):
+            try:
+                with self.app.app_context():
+                    self.reconcile()
+            except Exception:
+                # Tenta novamente no próximo ciclo
+                pass
+
+    def stop(self):
+        self._stop.set()
+
+
+def _track_flush(session, flush_context, instances):
+    """Converte as mudanças de Key/AccessLog feitas pelo ORM em deltas dos contadores de cada shard"""
+    deltas = {}
+
+    def apply(obj, flags, sign):
+        shard = deltas.setdefault(_shard_of(obj), dict.fromkeys(COUNTERS, 0))
+        for name, value in flags.items():
+            shard[name] += sign * value
+
+    for obj in session.new:
+        if isinstance(obj, Key):
+            apply(obj, key_flags({column: getattr(obj, column) for column in KEY_COLUMNS}), 1)
+        elif isinstance(obj, AccessLog):
+            # success tem default True no banco
+            apply(obj, log_flags(True if obj.success is None else obj.success), 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Key):
+            apply(obj, key_flags(_committed(obj)), -1)
+        elif isinstance(obj, AccessLog):
+            apply(obj, log_flags(_committed(obj, ('success',))['success']), -1)
+
+    for obj in session.dirty:
+        if isinstance(obj, Key) and session.is_modified(obj):
+            apply(obj, key_flags(_committed(obj)), -1)
+            apply(obj, key_flags({column: getattr(obj, column) for column in KEY_COLUMNS}), 1)
+
+    # Em ordem de shard: um flush que escreve em vários shards obtém os locks de escrita sempre na
+    # mesma ordem, sem deadlock com outro flush concorrente
+    for shard in sorted(deltas, key=lambda index: index or 0):
+        if any(deltas[shard].values()):
+            stats_counters.increment(connection=session.connection(bind_arguments={'shard': shard}), **deltas[shard])
+
+
+def _shard_of(obj):
+    """Shard de onde o objeto foi lido ou, se novo, o do seu key_id (None com um só shard)"""
+    if shards.count == 1:
+        return None
+    token = inspect(obj).identity_token
+    return shards.index_for(obj.key_id) if token is None else token
+
+
+def _committed(obj, columns=KEY_COLUMNS):
+    """Valores das colunas como estão no banco, antes das mudanças pendentes"""
+    committed = inspect(obj).committed_state
+    return {column: committed.get(column, getattr(obj, column)) for column in columns}
+
+
+event.listen(Session, 'before_flush', _track_flush)
+
+# Instância compartilhada pelas rotas e pelo writer de logs
+stats_counters = StatsCounters()
@@ -0,0 +1,237 @@
+from contextvars import ContextVar
+from functools import wraps
+import threading
+import time
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.sql.util import find_tables
+from src.services.sharding import shards, SHARDED_TABLES
+
+# Aplicados a toda conexão nova; SQLITE_PRAGMAS substitui valores individuais (None remove o pragma)
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Em WAL, NORMAL só sincroniza no checkpoint: um commit não espera o fsync
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -65536,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY'
+}
+
+# Pragmas que só valem (ou só são permitidos) na conexão de escrita
+WRITER_ONLY_PRAGMAS = ('journal_mode', 'synchronous')
+
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLAC')
+
+# Marca as requisições que só leem (decorator read_only)
+_reading = ContextVar('storage_reading', default=False)
+
+
+def read_only(view):
+    """Executa a view com as consultas do db.session no pool de leitura"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _reading.set(True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _reading.reset(token)
+    return wrapper
+
+
+class RoutingSession(Session):
+    """Session que envia as consultas das views read_only ao engine de leitura, se houver
+
+    Com mais de um shard, as tabelas divididas vão ao shard atual (ou ao de bind_arguments['shard']),
+    e cada objeto é gravado no shard de onde foi lido ou, se novo, no do seu key_id.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        if shards.count > 1:
+            self.connection_callable = self._shard_connection
+
+    def get_bind(self, mapper=None, clause=None, bind=None, shard=None, **kwargs):
+        if bind is None and (shard is not None or (shards.count > 1 and _is_sharded(mapper, clause))):
+            engine = shards.engine(shard)
+        else:
+            engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        # Um flush é sempre escrita, mesmo dentro de uma view read_only
+        if bind is None and _reading.get() and not self._flushing:
+            return storage.reader(engine)
+        return engine
+
+    def _shard_connection(self, mapper, instance):
+        """Conexão do flush para um objeto (connection_callable)"""
+        if mapper.local_table.name not in SHARDED_TABLES:
+            return self.connection(bind_arguments={'mapper': mapper})
+        state = inspect(instance)
+        if state.identity_token is None:
+            key_id = getattr(instance, 'key_id', None)
+            state.identity_token = shards.index_for(key_id) if key_id else shards.current()
+        return self.connection(bind_arguments={'mapper': mapper, 'shard': state.identity_token})
+
+
+def _is_sharded(mapper, clause):
+    if mapper is not None:
+        return mapper.local_table.name in SHARDED_TABLES
+    return clause is not None and any(
+        getattr(table, 'name', None) in SHARDED_TABLES for table in find_tables(clause, include_crud=True)
+    )
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _route_orm_select(orm_execute_state):
+    """Marca os objetos lidos com o shard de origem (identity_token): ids iguais em shards diferentes
+    são objetos diferentes, e refresh/lazy load voltam ao mesmo shard"""
+    if shards.count == 1 or not orm_execute_state.is_select or not any(
+        mapper.local_table.name in SHARDED_TABLES for mapper in orm_execute_state.all_mappers
+    ):
+        return None
+    source = orm_execute_state.lazy_loaded_from
+    token = orm_execute_state.load_options._identity_token
+    if token is None and source is not None:
+        token = source.identity_token
+    if token is None:
+        token = orm_execute_state.bind_arguments.get('shard')
+    if token is None:
+        token = shards.current()
+    orm_execute_state.update_execution_options(identity_token=token)
+    return orm_execute_state.invoke_statement(bind_arguments=dict(orm_execute_state.bind_arguments, shard=token))
+
+
+class Storage:
+    """Pragmas do SQLite em toda conexão, pool de leitura separado e escritas serializadas no processo"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        self.serialize_writes = True
+        # Engine de escrita -> engine de leitura
+        self._readers = {}
+        # Um escritor por arquivo: cada shard tem o seu lock
+        self._write_locks = {}
+        self.writes = 0
+        self.write_waits = 0
+        self.write_wait_seconds = 0.0
+        self.write_lock_timeouts = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Chamar depois de db.init_app: configura o engine de cada shard e cria o de leitura"""
+        self.enabled = app.config.get('SQLITE_TUNING_ENABLED', True)
+        if not self.enabled:
+            return
+
+        pragmas = dict(DEFAULT_PRAGMAS)
+        pragmas.update(app.config.get('SQLITE_PRAGMAS', {}))
+        self.pragmas = {name: value for name, value in pragmas.items() if value is not None}
+        self.serialize_writes = app.config.get('SQLITE_SERIALIZE_WRITES', True)
+
+        with app.app_context():
+            writers = list(app.extensions['sqlalchemy'].engines.values())
+        for writer in writers:
+            self._configure(app, writer)
+
+    def _configure(self, app, writer):
+        if writer.dialect.name != 'sqlite' or writer in self._readers:
+            return
+
+        event.listen(writer, 'connect', self._configure_writer)
+        if self.serialize_writes:
+            self._write_locks[writer] = threading.Lock()
+            event.listen(writer, 'before_cursor_execute', self._before_cursor_execute)
+            # O evento commit do SQLAlchemy vem antes do COMMIT de fato; a devolução ao pool
+            # vem depois dele (ou do rollback), tanto na Session quanto em engine.begin()
+            event.listen(writer, 'checkin', self._checkin)
+
+        # A primeira conexão de escrita ativa o WAL antes de qualquer leitor abrir o arquivo
+        with writer.connect():
+            pass
+
+        reader = writer
+        database = writer.url.database
+        if database and database != ':memory:' and not database.startswith('file::memory:'):
+            reader = create_engine(
+                writer.url,
+                pool_size=app.config.get('SQLITE_READER_POOL_SIZE', 8),
+                max_overflow=app.config.get('SQLITE_READER_MAX_OVERFLOW', 8)
+            )
+            event.listen(reader, 'connect', self._configure_reader)
+        self._readers[writer] = reader
+
+    def reader(self, engine):
+        """Engine de leitura associado ao engine de escrita (o próprio, se não houver)"""
+        return self._readers.get(engine, engine)
+
+    def readers(self):
+        return [reader for writer, reader in self._readers.items() if reader is not writer]
+
+    # Conexões
+
+    def _apply(self, dbapi_connection, pragmas):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+
+    def _configure_writer(self, dbapi_connection, connection_record):
+        self._apply(dbapi_connection, self.pragmas)
+
+    def _configure_reader(self, dbapi_connection, connection_record):
+        pragmas = {name: value for name, value in self.pragmas.items() if name not in WRITER_ONLY_PRAGMAS}
+        # Qualquer escrita por engano falha em vez de disputar o lock
+        pragmas['query_only'] = 'ON'
+        self._apply(dbapi_connection, pragmas)
+
+    # Escritor único
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # O driver abre a transação (BEGIN) logo antes da primeira escrita; o lock vale até a
+        # conexão voltar ao pool
+        if conn.info.get('storage_writing') or statement.lstrip()[:6].upper() not in WRITE_PREFIXES:
+            return
+        conn.info['storage_writing'] = True
+        write_lock = self._write_locks[conn.engine]
+
+        if write_lock.acquire(blocking=False):
+            conn.info['storage_lock_held'] = write_lock
+        else:
+            started = time.perf_counter()
+            # Passado o busy_timeout, segue sem o lock e deixa o SQLite decidir (evita deadlock
+            # se a mesma thread já escreve por outra conexão)
+            acquired = write_lock.acquire(timeout=self.pragmas.get('busy_timeout', 5000) / 1000)
+            if acquired:
+                conn.info['storage_lock_held'] = write_lock
+            self.write_waits += 1
+            self.write_wait_seconds += time.perf_counter() - started
+            if not acquired:
+                self.write_lock_timeouts += 1
+        self.writes += 1
+
+    def _checkin(self, dbapi_connection, connection_record):
+        info = connection_record.info
+        info['storage_writing'] = False
+        write_lock = info.pop('storage_lock_held', None)
+        if write_lock is not None:
+            write_lock.release()
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'pragmas': self.pragmas if self.enabled else {},
+            'reader_pool': bool(self.readers()),
+            'serialize_writes': self.enabled and self.serialize_writes,
+            'writes': self.writes,
+            'write_waits': self.write_waits,
+            'write_wait_seconds': round(self.write_wait_seconds, 3),
+            'write_lock_timeouts': self.write_lock_timeouts
+        }
+
+
+# Instância compartilhada pela aplicação
+storage = Storage()